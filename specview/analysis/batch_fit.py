@@ -0,0 +1,311 @@
+"""Fitting of one model to many spectra
+
+The spectra are split into chunks of consecutive spectra, which are fitted
+in a pool of processes. Within a chunk each fit starts from the result of
+the previous successful one, as neighbouring spectra (e.g. adjacent
+spaxels of a cube) tend to have similar parameters; the first fit of a
+chunk starts from the given model, or from estimates. Chunks are fitted
+independently, so that they can be fitted in parallel: results depend on
+the size of the chunks, but not on the number of processes.
+
+Results come back as a structured array with a field per parameter, and
+an array of status codes, one per fit.
+
+Cubes are fitted in place, without building an object per spaxel, in a
+serpentine order: rows left to right and right to left in turn, so that
+consecutive spaxels are always adjacent. `fit_cube` returns the results
+as parameter maps.
+"""
+import warnings
+from collections import namedtuple, OrderedDict
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+from astropy.wcs import WCS
+
+from specview.core import CubeData, ImageArray
+from specview.analysis.model_fitting import get_fitter
+from specview.analysis.estimators import estimate as estimate_parameters
+
+# Number of bands of rows `fit_cube` cuts cubes in by default.
+BANDS = 16
+
+# Status codes of the fits.
+OK = 0
+WARNING = 1
+FAILED = 2
+SKIPPED = 3
+
+STATUS = ('ok', 'warning', 'failed', 'skipped')
+
+BatchResult = namedtuple('BatchResult', ['parameters', 'status'])
+CubeFit = namedtuple('CubeFit', ['maps', 'status'])
+
+
+def batch_fit(model, spectra, fitter='Levenberg-Marquardt', warm_start=True,
+              estimate=False, workers=None, chunk_size=64, **kwargs):
+    """Fit a model to each of many spectra.
+
+    Parameters
+    ----------
+    model: Model
+        The initial model, e.g. the compound model of a layer.
+    spectra: [SpectrumData,] or CubeData
+        The spectra to fit, or a cube to fit spaxel by spaxel. Masked and
+        non-finite points are left out, and uncertainties, when there are
+        any, weight the fits.
+    fitter: str
+        Name of the fitter, see `model_fitting.all_fitters`.
+    warm_start: bool
+        Start each fit from the result of the previous one in its chunk.
+        The first fit of each chunk starts from `model`.
+    estimate: bool
+        Start fits that have no previous result to start from with
+        parameters estimated from the data, see `estimators`. Only for
+        models with an estimator, i.e. not compound models.
+    workers: int
+        Number of processes to use. Defaults to the number of CPUs. With
+        a single worker, the fits run in this process.
+    chunk_size: int
+        Number of consecutive spectra fitted by a process in a row. With
+        `warm_start`, results depend on it, as each chunk starts again
+        from `model`.
+    kwargs: dict
+        Keyword arguments to pass to the fitter, e.g. `maxiter`.
+
+    Returns
+    -------
+    BatchResult
+        `parameters` is a structured array with a float field per
+        parameter of `model`; `status` holds the status code of each fit,
+        see `STATUS`. Both have a shape of `(len(spectra),)`, or the
+        spatial shape of a cube. Parameters of fits that failed or were
+        skipped for lack of data are NaN.
+    """
+    if isinstance(spectra, CubeData):
+        shape = spectra.shape[1:]
+        tasks = _cube_tasks(spectra)
+    else:
+        spectra = list(spectra)
+        shape = (len(spectra),)
+        tasks = (_spectrum_task(spectrum) for spectrum in spectra)
+
+    values, status = _run(model, tasks, fitter, warm_start, estimate,
+                          workers, chunk_size, kwargs)
+
+    return BatchResult(_table(model, values).reshape(shape),
+                       status.reshape(shape))
+
+
+def fit_cube(model, cube, fitter='Levenberg-Marquardt', warm_start=True,
+             estimate=False, workers=None, band=None, **kwargs):
+    """Fit a model to every spaxel of a cube.
+
+    The cube is cut in bands of rows, fitted in a pool of processes. In a
+    band the spaxels are fitted in serpentine order, each fit starting
+    from the result of the previous, neighbouring, spaxel. The first
+    spaxel of each band starts from `model`, or from estimates.
+
+    Parameters
+    ----------
+    model: Model
+        The initial model.
+    cube: CubeData
+        The cube, with the spectral axis first. Masked and non-finite
+        values are left out, and uncertainties, when there are any,
+        weight the fits.
+    fitter: str
+        Name of the fitter, see `model_fitting.all_fitters`.
+    warm_start: bool
+        Start each fit from the result of the previous spaxel.
+    estimate: bool
+        Start fits that have no previous result to start from with
+        parameters estimated from the data, see `batch_fit`.
+    workers: int
+        Number of processes to use. Defaults to the number of CPUs.
+    band: int
+        Number of rows per band. Each band starts again from `model`, so
+        results depend on it, but not on `workers`. Defaults to cutting the
+        cube in `BANDS` bands.
+    kwargs: dict
+        Keyword arguments to pass to the fitter, e.g. `maxiter`.
+
+    Returns
+    -------
+    CubeFit
+        `maps` is an ordered dictionary of `ImageArray`, one map per
+        parameter of `model`, with the celestial WCS of the cube; NaN
+        where the fit failed or was skipped. `status` is the map of the
+        status codes, see `STATUS`.
+    """
+    n_rows, n_columns = cube.shape[1:]
+    if band is None:
+        band = max(1, -(-n_rows // BANDS))
+
+    order = _serpentine(n_rows, n_columns)
+    values, status = _run(model, _cube_tasks(cube, order), fitter,
+                          warm_start, estimate, workers, band * n_columns,
+                          kwargs)
+
+    # Back from serpentine to row-major order.
+    values[order] = values.copy()
+    status[order] = status.copy()
+
+    wcs = cube.wcs.celestial if isinstance(cube.wcs, WCS) else None
+    maps = OrderedDict(
+        (name, ImageArray(values[:, i].reshape(n_rows, n_columns), wcs=wcs))
+        for i, name in enumerate(model.param_names))
+
+    return CubeFit(maps, status.reshape(n_rows, n_columns))
+
+
+def _serpentine(n_rows, n_columns):
+    """Flat indices of a grid, rows alternately left to right and right to
+    left."""
+    order = np.arange(n_rows * n_columns).reshape(n_rows, n_columns)
+    order[1::2] = order[1::2, ::-1]
+    return order.ravel()
+
+
+def _table(model, values):
+    """Structured array of parameter values, one row per fit."""
+    table = np.empty(len(values), dtype=[(name, float)
+                                         for name in model.param_names])
+    for i, name in enumerate(model.param_names):
+        table[name] = values[:, i]
+
+    return table
+
+
+def _run(model, tasks, fitter, warm_start, estimate, workers, chunk_size,
+         kwargs):
+    """Fit all `tasks`, in chunks, and gather the results in order."""
+    if workers is None:
+        workers = cpu_count()
+
+    chunks = ((model, fitter, chunk, warm_start, estimate, kwargs)
+              for chunk in _chunks(tasks, chunk_size))
+
+    if workers <= 1:
+        results = [_fit_chunk(args) for args in chunks]
+    else:
+        pool = Pool(workers)
+        try:
+            results = list(pool.imap(_fit_chunk, chunks))
+        finally:
+            pool.terminate()
+
+    if not results:
+        return (np.empty((0, len(model.parameters))),
+                np.empty(0, dtype=np.uint8))
+
+    return (np.concatenate([values for values, _ in results]),
+            np.concatenate([status for _, status in results]))
+
+
+def _chunks(tasks, size):
+    chunk = []
+    for task in tasks:
+        chunk.append(task)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+
+def _prepare(x, y, mask=None, error=None):
+    """The points of a spectrum to fit, and their weights."""
+    good = np.isfinite(x) & np.isfinite(y)
+    if mask is not None:
+        good &= ~mask
+
+    weights = None
+    if error is not None:
+        good &= np.isfinite(error) & (error > 0)
+        weights = 1. / error[good]
+
+    return x[good], y[good], weights
+
+
+def _error(nddata):
+    if nddata.uncertainty is None:
+        return None
+    return np.asarray(nddata.uncertainty.array, dtype=float)
+
+
+def _spectrum_task(spectrum):
+    y = spectrum.y
+    return _prepare(spectrum.x._data, y._data, y.mask, _error(y))
+
+
+def _cube_tasks(cube, order=None):
+    """Yield the spaxels of `cube` to fit, in row-major order or the
+    order of the flat spaxel indices `order`."""
+    x = cube.spectral_axis
+    data = cube.data.reshape(cube.shape[0], -1)
+
+    mask = cube.mask
+    if mask is not None:
+        mask = np.broadcast_to(mask, cube.shape).reshape(data.shape)
+
+    error = _error(cube)
+    if error is not None:
+        error = error.reshape(data.shape)
+
+    if order is None:
+        order = range(data.shape[1])
+
+    for i in order:
+        yield _prepare(x, data[:, i],
+                       None if mask is None else mask[:, i],
+                       None if error is None else error[:, i])
+
+
+def _free_parameters(model):
+    return sum(1 for name in model.param_names
+               if not model.fixed[name] and not model.tied[name])
+
+
+def _fit_chunk(args):
+    """Fit a chunk of spectra, in order.
+
+    Errors are caught and turned into status codes, so that one bad
+    spectrum does not bring down a whole pool.
+    """
+    model, fitter_name, tasks, warm_start, estimate, kwargs = args
+    fitter = get_fitter(fitter_name)
+    n_free = _free_parameters(model)
+
+    values = np.full((len(tasks), len(model.parameters)), np.nan)
+    status = np.full(len(tasks), SKIPPED, dtype=np.uint8)
+    start = model
+
+    for i, (x, y, weights) in enumerate(tasks):
+        if y.size < max(n_free, 1):
+            continue
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            try:
+                initial = start
+                if estimate and start is model:
+                    initial = estimate_parameters(model.copy(), x, y)
+                fitted = fitter(initial, x, y, weights=weights, **kwargs)
+            except Exception:
+                status[i] = FAILED
+                continue
+
+        if not np.all(np.isfinite(fitted.parameters)):
+            status[i] = FAILED
+            continue
+
+        values[i] = fitted.parameters
+        status[i] = WARNING if caught else OK
+
+        if warm_start and status[i] == OK:
+            start = fitted
+
+    return values, status
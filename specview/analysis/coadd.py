@@ -0,0 +1,240 @@
+"""Coaddition of many spectra on a common grid
+
+All spectra are resampled onto the grid with cached plans (see
+`specview.analysis.resample`) and stacked into a 2D array, which is then
+combined along the spectra axis in a single vectorized pass. The grid is
+processed in blocks of columns so that the stack stays within a memory
+budget, whatever the number of spectra.
+"""
+import numpy as np
+from astropy.nddata import StdDevUncertainty
+
+from specview.core import SpectrumArray, SpectrumData
+from specview.analysis.resample import get_plan
+
+# Default memory budget for a block of the stack, in bytes.
+MAX_MEMORY = 256 * 1024 ** 2
+
+METHODS = ('mean', 'median', 'clipped')
+
+
+def common_grid(spectra):
+    """Return a grid covering all `spectra`, sampled at the finest step.
+
+    Parameters
+    ----------
+    spectra: [SpectrumData,]
+        The spectra; their dispersions are taken in the unit of the first.
+
+    Returns
+    -------
+    ndarray
+    """
+    unit = spectra[0].x.unit
+    start, stop, step = np.inf, -np.inf, np.inf
+
+    for spectrum in spectra:
+        x = _dispersion(spectrum, unit)
+        start = min(start, x.min())
+        stop = max(stop, x.max())
+        step = min(step, np.median(np.abs(np.diff(x))))
+
+    return np.linspace(start, stop, int(round((stop - start) / step)) + 1)
+
+
+def coadd(spectra, grid=None, method='mean', weighting=None,
+          resample='linear', sigma=3., iterations=3, chunk_size=None):
+    """Combine spectra into a single one on a common grid.
+
+    Parameters
+    ----------
+    spectra: [SpectrumData,]
+        The spectra to combine.
+    grid: ndarray
+        Dispersion of the result, in the unit of the first spectrum.
+        Defaults to `common_grid`.
+    method: str
+        'mean' for the weighted mean, 'median', or 'clipped' for the
+        weighted mean after iterative sigma clipping around the median.
+    weighting: str
+        'ivar' to weight by inverse variance, which needs uncertainties on
+        all spectra, or 'uniform' for equal weights. Defaults to 'ivar'
+        when all spectra have uncertainties, 'uniform' otherwise. With
+        'ivar', values of zero or unknown variance are left out.
+    resample: str
+        Resampling method, one of 'linear', 'nearest' or 'flux'.
+    sigma: float
+        Clipping threshold, in standard deviations.
+    iterations: int
+        Maximum number of clipping iterations.
+    chunk_size: int
+        Number of grid points processed at a time. Defaults to as many
+        as fit in `MAX_MEMORY`.
+
+    Returns
+    -------
+    SpectrumData
+        The combined spectrum. Grid points no spectrum covers are masked.
+        As for arithmetic on spectra, errors are only propagated where all
+        the values combined have uncertainties; the result has none if
+        there are no such points.
+    """
+    if method not in METHODS:
+        raise NameError("There is no coadd method named {}".format(method))
+
+    spectra = list(spectra)
+    known = all(spectrum.y.uncertainty is not None for spectrum in spectra)
+    if weighting is None:
+        weighting = 'ivar' if known else 'uniform'
+    elif weighting == 'ivar' and not known:
+        raise ValueError("Inverse variance weighting needs uncertainties on "
+                         "all spectra, use uniform weighting.")
+    x_unit, y_unit = spectra[0].x.unit, spectra[0].y.unit
+
+    if grid is None:
+        grid = common_grid(spectra)
+    grid = np.asarray(grid, dtype=float)
+
+    # Everything that depends only on the grids is set up once.
+    inputs = []
+    for spectrum in spectra:
+        x = _dispersion(spectrum, x_unit)
+        plan = get_plan(x, grid, resample)
+
+        y = spectrum.y
+        scale = 1
+        if y_unit is not None and y.unit is not None and y.unit != y_unit:
+            scale = y.unit.to(y_unit)
+
+        variance = None
+        if y.uncertainty is not None:
+            variance = (np.asarray(y.uncertainty.array, dtype=float) *
+                        scale) ** 2
+
+        inputs.append((plan, y._data * scale if scale != 1 else y._data,
+                       variance, y.mask))
+
+    n_spectra = len(inputs)
+    if chunk_size is None:
+        # Values, variances and weights.
+        chunk_size = max(1, MAX_MEMORY // (3 * 8 * n_spectra))
+
+    flux = np.empty(grid.size)
+    error = np.empty(grid.size)
+    count = np.empty(grid.size, dtype=int)
+
+    for start in range(0, grid.size, chunk_size):
+        rows = slice(start, min(start + chunk_size, grid.size))
+        values, variances = _stack(inputs, rows)
+
+        flux[rows], error[rows], count[rows] = _combine(
+            values, variances, method, weighting, sigma, iterations)
+
+    mask = count == 0
+    uncertainty = None
+    if np.isfinite(error).any():
+        uncertainty = StdDevUncertainty(error)
+
+    return SpectrumData(SpectrumArray(grid, mask=mask, unit=x_unit),
+                        SpectrumArray(flux, uncertainty=uncertainty,
+                                      mask=mask, unit=y_unit))
+
+
+def _dispersion(spectrum, unit):
+    """Full dispersion array of `spectrum`, in `unit`."""
+    x = spectrum.x
+    if unit is not None and x.unit is not None and x.unit != unit:
+        return x.unit.to(unit, x._data)
+    return x._data
+
+
+def _stack(inputs, rows):
+    """Resample a block of the grid for all spectra.
+
+    Points not covered, or computed from masked points, are NaN. Variances
+    are NaN for spectra without uncertainties.
+    """
+    shape = (len(inputs), rows.stop - rows.start)
+    values = np.empty(shape)
+    variances = np.empty(shape)
+
+    for i, (plan, y, variance, mask) in enumerate(inputs):
+        values[i] = plan(y, np.nan, rows=rows)
+        if mask is not None:
+            values[i][plan.propagate_mask(mask, rows=rows)] = np.nan
+
+        if variance is None:
+            variances[i] = np.nan
+        else:
+            variances[i] = plan.propagate_variance(variance, np.nan,
+                                                   rows=rows)
+
+    return values, variances
+
+
+def _combine(values, variances, method, weighting, sigma, iterations):
+    """Combine a (spectra, points) block along the spectra axis.
+
+    Returns the combined values, their errors (NaN when unknown) and the
+    number of spectra used per point.
+    """
+    good = np.isfinite(values)
+
+    if method == 'clipped':
+        for _ in range(iterations):
+            clipped = np.where(good, values, np.nan)
+            center = _nanmedian(clipped)
+            spread = _nanstd(clipped)
+            keep = good & ~(np.abs(values - center) > sigma * spread)
+            if (keep == good).all():
+                break
+            good = keep
+
+    known = np.isfinite(variances) & (variances > 0)
+    if weighting == 'ivar':
+        # An unknown variance weighs as an inverse variance of zero.
+        good &= known
+        weights = 1. / np.where(known, variances, 1.)
+    else:
+        weights = np.ones(values.shape)
+    weights[~good] = 0
+
+    count = good.sum(axis=0)
+    total = weights.sum(axis=0)
+    empty = total == 0
+    total[empty] = 1.
+
+    # Error of the weighted mean, from the variances where all are known.
+    weighted_var = (weights ** 2 * np.where(known, variances, 0)).sum(axis=0)
+    complete = (known | ~good).all(axis=0)
+    error = np.where(complete, np.sqrt(weighted_var) / total, np.nan)
+
+    if method == 'median':
+        flux = _nanmedian(np.where(good, values, np.nan))
+        # Asymptotic efficiency of the median relative to the mean.
+        error *= np.sqrt(np.pi / 2)
+    else:
+        flux = (weights * np.where(good, values, 0)).sum(axis=0) / total
+
+    flux[empty] = np.nan
+    error[empty] = np.nan
+
+    return flux, error, count
+
+
+def _nanmedian(values):
+    """Median along the first axis, NaN for all-NaN columns."""
+    result = np.full(values.shape[1], np.nan)
+    some = np.isfinite(values).any(axis=0)
+    if some.any():
+        result[some] = np.nanmedian(values[:, some], axis=0)
+    return result
+
+
+def _nanstd(values):
+    """Standard deviation along the first axis, ignoring NaN."""
+    result = np.full(values.shape[1], np.nan)
+    some = np.isfinite(values).any(axis=0)
+    if some.any():
+        result[some] = np.nanstd(values[:, some], axis=0)
+    return result
@@ -1,17 +1,258 @@
+"""Collapse of cubes into images
+
+Cubes are reduced tile by tile: each spatial tile is read with all its
+planes, as floats, reduced, and written into the image. Tiles are sized
+to a fixed number of bytes, so that memory use stays bounded whatever the
+size of the cube, and only the tiles in flight are ever in memory, which
+lets a memory-mapped cube be collapsed without reading it all at once.
+Tiles are reduced in a pool of threads, as numpy releases the GIL for
+the bulk of the work.
+"""
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
 from astropy.units import Unit
+from astropy.wcs import WCS
 
 from specview.core import CubeData, ImageArray
+from specview.analysis.extract import spectral_window
+
+# Size of the tiles read at once, per worker, in bytes.
+TILE_BYTES = 32 * 2 ** 20
+
+
+def collapse(cube_data, method='average', axis=0, weights=None,
+             x_range=None, workers=None, tile_bytes=TILE_BYTES):
+    """Collapse a cube along an axis into an image.
+
+    Masked and non-finite values are left out; pixels with no value left
+    are NaN.
+
+    Parameters
+    ----------
+    cube_data : CubeData
+        The cube, with the spectral axis first.
+    method : str
+        'average' (or 'mean'), 'median', 'sum', 'min' or 'max'.
+    axis : int
+        Axis to collapse.
+    weights : ndarray
+        Weights of the values, either one per plane along `axis` or of
+        the shape of the cube. The average and the median are weighted;
+        the sum is of the weighted values. Values with a weight of zero
+        are left out.
+    x_range : tuple
+        Spectral window to collapse, as in `extract.spectral_window`,
+        when collapsing the spectral axis; all planes if `None`.
+    workers : int
+        Number of threads. Defaults to the number of CPUs.
+    tile_bytes : int
+        Approximate size of the tiles, in bytes.
+
+    Returns
+    -------
+    out : ImageArray
+        The image, with the WCS of the cube less the collapsed axis, if
+        the rest still makes one.
+    """
+    reducer = _reducers.get(method)
+    if reducer is None:
+        raise ValueError("Unknown method '{}'.".format(method))
+
+    planes = slice(None)
+    if x_range is not None:
+        if axis != 0:
+            raise ValueError("A spectral window needs the spectral axis, "
+                             "axis 0.")
+        planes = spectral_window(cube_data, x_range)
+
+    new_data, = map_tiles(lambda values, w: (reducer(values, w),),
+                          cube_data, axis=axis, planes=planes,
+                          weights=weights, workers=workers,
+                          tile_bytes=tile_bytes)
+
+    wcs = cube_data.wcs
+    if isinstance(wcs, WCS):
+        try:
+            # Numpy axes run opposite to WCS axes.
+            wcs = wcs.dropaxis(wcs.naxis - 1 - axis)
+        except ValueError:
+            # e.g. one of a pair of celestial axes, leaving the other
+            # without meaning.
+            wcs = None
+
+    return ImageArray(new_data, wcs=wcs, unit=cube_data.unit)
+
+
+def map_tiles(func, cube_data, axis=0, planes=slice(None), weights=None,
+              workers=None, tile_bytes=TILE_BYTES):
+    """Apply a reduction to a cube along an axis, tile by tile.
+
+    Parameters
+    ----------
+    func : callable
+        Called with the values of a tile, a float array of shape
+        `(planes, rows, columns)` with NaN for masked and non-finite
+        values, and their weights, broadcastable to the values, or `None`.
+        Returns a tuple of arrays of shape `(rows, columns)`. It is called
+        from several threads at once.
+    cube_data : CubeData
+        The cube.
+    axis : int
+        Axis to reduce, which comes first in the tiles.
+    planes : slice
+        Part of `axis` to reduce.
+    weights : ndarray
+        Weights, one per plane along `axis` or of the shape of the cube.
+    workers : int
+        Number of threads. Defaults to the number of CPUs.
+    tile_bytes : int
+        Approximate size of the tiles, in bytes.
+
+    Returns
+    -------
+    out : list
+        The images returned by `func`, put together.
+    """
+    if workers is None:
+        workers = cpu_count()
+
+    data = np.moveaxis(cube_data.data, axis, 0)[planes]
+
+    mask = cube_data.mask
+    if mask is not None:
+        mask = np.moveaxis(np.broadcast_to(mask, cube_data.shape),
+                           axis, 0)[planes]
+
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)
+        if weights.ndim == 1:
+            weights = weights[planes, np.newaxis, np.newaxis]
+        else:
+            weights = np.moveaxis(weights, axis, 0)[planes]
+
+    outputs = []
+
+    def reduce_tile(item):
+        rows, columns = item
+        values = np.array(data[:, rows, columns], dtype=float)
+        if mask is not None:
+            values[mask[:, rows, columns]] = np.nan
+        values[~np.isfinite(values)] = np.nan
+
+        tile_weights = weights
+        if weights is not None and weights.shape[1:] != (1, 1):
+            tile_weights = weights[:, rows, columns]
+
+        return item, func(values, tile_weights)
+
+    tiles = _tiles(data.shape, tile_bytes)
+
+    if workers <= 1:
+        results = (reduce_tile(item) for item in tiles)
+    else:
+        pool = ThreadPool(workers)
+        results = pool.imap_unordered(reduce_tile, tiles)
+
+    try:
+        for (rows, columns), images in results:
+            if not outputs:
+                outputs = [np.empty(data.shape[1:]) for _ in images]
+            for output, image in zip(outputs, images):
+                output[rows, columns] = image
+    finally:
+        if workers > 1:
+            pool.terminate()
+
+    return outputs
+
+
+def _tiles(shape, tile_bytes):
+    """Yield the (rows, columns) slices of tiles of about `tile_bytes`
+    bytes of floats, covering the last two axes of `shape`: bands of
+    whole rows, or parts of single rows for very long spectra."""
+    n_planes, n_rows, n_columns = shape
+    pixels = max(1, tile_bytes // (8 * max(n_planes, 1)))
+
+    if pixels >= n_columns:
+        band = pixels // n_columns
+        for start in range(0, n_rows, band):
+            yield slice(start, min(start + band, n_rows)), slice(None)
+    else:
+        for row in range(n_rows):
+            for start in range(0, n_columns, pixels):
+                yield (slice(row, row + 1),
+                       slice(start, min(start + pixels, n_columns)))
+
+
+def _weights(values, weights):
+    """Weights of the values, zero for NaN."""
+    finite = ~np.isnan(values)
+    if weights is None:
+        return finite.astype(float)
+    return np.where(finite, weights, 0.)
+
+
+def _weighted_sum(values, w):
+    weighted = np.where(w > 0, values, 0.)
+    weighted *= w
+    return weighted.sum(axis=0)
+
+
+def _average(values, weights):
+    w = _weights(values, weights)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return _weighted_sum(values, w) / w.sum(axis=0)
+
+
+def _sum(values, weights):
+    w = _weights(values, weights)
+    result = _weighted_sum(values, w)
+    result[w.sum(axis=0) == 0] = np.nan
+    return result
+
+
+def _median(values, weights):
+    if weights is None:
+        empty = np.isnan(values).all(axis=0)
+        if empty.any():
+            # Keeps nanmedian from warning, from any thread.
+            values[:, empty] = 0
+        result = np.nanmedian(values, axis=0)
+        result[empty] = np.nan
+        return result
+
+    # Weighted: the first value, in sorted order, at which the cumulated
+    # weights reach half the total, i.e. the lower middle value for an
+    # even number of equal weights. NaN sort last, with no weight.
+    w = _weights(values, weights)
+    order = np.argsort(values, axis=0)
+    cumulated = np.take_along_axis(w, order, axis=0).cumsum(axis=0)
+    half = np.argmax(cumulated >= cumulated[-1] / 2., axis=0)
+    result = np.take_along_axis(np.take_along_axis(values, order, axis=0),
+                                half[np.newaxis], axis=0)[0]
+    result[cumulated[-1] == 0] = np.nan
+    return result
 
 
-def collapse(cube_data, method='average', axis=0):
+def _extremum(ufunc):
+    def reducer(values, weights):
+        if weights is not None:
+            values = np.where(_weights(values, weights) > 0, values, np.nan)
+        # fmin and fmax skip NaN, and give NaN for all-NaN pixels.
+        return ufunc.reduce(values, axis=0)
+    return reducer
 
-    if method == 'average':
-        new_data = np.nanmean(cube_data.data, axis=axis)
-    elif method == 'median':
-        new_data = np.nanmedian(cube_data.data, axis=axis)
 
-    return ImageArray(new_data, wcs=cube_data.wcs, unit=cube_data.units[1])
+_reducers = {
+    'average': _average,
+    'mean': _average,
+    'median': _median,
+    'sum': _sum,
+    'min': _extremum(np.fmin),
+    'max': _extremum(np.fmax),
+}
 
 
 if __name__ == '__main__':
@@ -25,4 +266,4 @@ if __name__ == '__main__':
     ia = collapse(cd)
     print(type(ia))
     print(ia)
-    print(ia.unit)
\ No newline at end of file
+    print(ia.unit)
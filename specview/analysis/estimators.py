@@ -0,0 +1,236 @@
+"""Initial parameter estimates for the models of `model_fitting.all_models`
+
+Fitters converge in fewer iterations, and more often at all, when they
+start close to the solution. Each estimator computes starting values for
+one kind of model from the data with a few vectorized passes, and
+`estimate` applies the one registered for a model, if any.
+"""
+import numpy as np
+
+from specview.analysis.fitters import LinearFitter
+
+# FWHM of a Gaussian, in standard deviations.
+FWHM_SIGMA = 2. * np.sqrt(2. * np.log(2.))
+
+# Estimators, keyed by model class name. Each is called with the model
+# and the data, and returns a dictionary of parameter values.
+estimators = {}
+
+
+def register(*names):
+    """Decorator registering an estimator for the named models."""
+    def decorator(func):
+        for name in names:
+            estimators[name] = func
+        return func
+    return decorator
+
+
+def estimate(model, x, y):
+    """Set the parameters of `model` to estimates from the data.
+
+    Models without an estimator, and data with less than two finite
+    points, leave the model unchanged. Fixed parameters are not changed.
+
+    Parameters
+    ----------
+    model: Model
+        The model, modified in place.
+    x, y: ndarray
+        The data, with `x` in increasing order.
+
+    Returns
+    -------
+    Model
+        `model`.
+    """
+    estimator = estimators.get(model.__class__.__name__)
+    if estimator is None:
+        return model
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    good = np.isfinite(x) & np.isfinite(y)
+    if good.sum() < 2:
+        return model
+
+    values = estimator(model, x[good], y[good])
+
+    for name, value in values.items():
+        if not model.fixed[name] and np.isfinite(value):
+            setattr(model, name, value)
+
+    return model
+
+
+def _line(x, y, absorption=False):
+    """Amplitude, position and standard deviation of the strongest line,
+    above (below, for `absorption`) the median level.
+
+    The width is that of the run of points above half the amplitude around
+    the peak, as a Gaussian FWHM, so that noise elsewhere does not count.
+    """
+    deviation = y - np.median(y)
+    if absorption:
+        deviation = -deviation
+
+    peak = np.argmax(deviation)
+    amplitude = deviation[peak]
+    if not amplitude > 0:
+        return amplitude, x[peak], (x[-1] - x[0]) / 50.
+
+    half = amplitude / 2.
+    below = np.flatnonzero(deviation < half)
+    before = below[below < peak]
+    after = below[below > peak]
+
+    left = _crossing(x, deviation, before[-1], half) if before.size else x[0]
+    right = (_crossing(x, deviation, after[0] - 1, half) if after.size
+             else x[-1])
+
+    fwhm = abs(right - left)
+    if fwhm == 0:
+        fwhm = abs(x[-1] - x[0]) / max(x.size - 1, 1)
+
+    return amplitude, x[peak], fwhm / FWHM_SIGMA
+
+
+def _crossing(x, y, i, level):
+    """Abscissa at which `y` crosses `level` between points `i` and `i + 1`,
+    by linear interpolation."""
+    return x[i] + (level - y[i]) * (x[i + 1] - x[i]) / (y[i + 1] - y[i])
+
+
+@register('Gaussian1D')
+def _gaussian(model, x, y):
+    amplitude, mean, stddev = _line(x, y)
+    return {'amplitude': amplitude, 'mean': mean, 'stddev': stddev}
+
+
+@register('GaussianAbsorption1D')
+def _gaussian_absorption(model, x, y):
+    amplitude, mean, stddev = _line(x, y, absorption=True)
+    return {'amplitude': amplitude, 'mean': mean, 'stddev': stddev}
+
+
+@register('Lorentz1D')
+def _lorentz(model, x, y):
+    amplitude, x_0, stddev = _line(x, y)
+    return {'amplitude': amplitude, 'x_0': x_0, 'fwhm': stddev * FWHM_SIGMA}
+
+
+@register('MexicanHat1D')
+def _mexican_hat(model, x, y):
+    amplitude, x_0, stddev = _line(x, y)
+    return {'amplitude': amplitude, 'x_0': x_0, 'sigma': stddev}
+
+
+@register('Trapezoid1D')
+def _trapezoid(model, x, y):
+    amplitude, x_0, stddev = _line(x, y)
+    return {'amplitude': amplitude, 'x_0': x_0, 'width': stddev * FWHM_SIGMA,
+            'slope': amplitude / max(stddev, np.finfo(float).tiny)}
+
+
+@register('Sine1D')
+def _sine(model, x, y):
+    # Strongest frequency of the data, taken as evenly sampled, refined
+    # between frequency bins by a parabola through the peak.
+    y = y - y.mean()
+    power = np.abs(np.fft.rfft(y))
+    power[0] = 0
+    peak = np.argmax(power)
+    offset = 0.
+    if 0 < peak < power.size - 1:
+        left, center, right = power[peak - 1:peak + 2]
+        curvature = left - 2 * center + right
+        if curvature != 0:
+            offset = 0.5 * (left - right) / curvature
+    frequency = (peak + offset) / (x[-1] - x[0])
+
+    # Projections on sine and cosine at that frequency give the phase.
+    angle = 2 * np.pi * frequency * x
+    phase = np.arctan2((y * np.cos(angle)).sum(),
+                       (y * np.sin(angle)).sum()) / (2 * np.pi)
+
+    low, high = np.percentile(y, [5, 95])
+    return {'amplitude': (high - low) / 2., 'frequency': frequency,
+            'phase': phase}
+
+
+@register('Const1D')
+def _const(model, x, y):
+    return {'amplitude': np.median(y)}
+
+
+@register('Linear1D', 'Polynomial1D', 'Chebyshev1D', 'Legendre1D')
+def _linear(model, x, y):
+    # These have an exact solution, which is the best starting point.
+    fitted = LinearFitter()(model, x, y)
+    return dict(zip(fitted.param_names, fitted.parameters))
+
+
+def _log_log(x, y):
+    """Logarithms of the points with positive coordinates."""
+    positive = (x > 0) & (y > 0)
+    return np.log(x[positive]), np.log(y[positive])
+
+
+def _power_law(x, y, x_0):
+    """Amplitude at `x_0` and index of a power law through the data."""
+    log_x, log_y = _log_log(x, y)
+    if log_x.size < 2:
+        return np.nan, np.nan
+
+    slope, intercept = np.polyfit(log_x - np.log(x_0), log_y, 1)
+    return np.exp(intercept), -slope
+
+
+def _pivot(model, name, x):
+    """The reference abscissa `name` of a model: its value when fixed, the
+    middle of the positive part of the data otherwise."""
+    if model.fixed[name]:
+        return getattr(model, name).value
+
+    positive = x[x > 0]
+    return np.median(positive) if positive.size else np.nan
+
+
+@register('PowerLaw1D')
+def _power_law_1d(model, x, y):
+    x_0 = _pivot(model, 'x_0', x)
+    amplitude, alpha = _power_law(x, y, x_0)
+    return {'amplitude': amplitude, 'x_0': x_0, 'alpha': alpha}
+
+
+@register('BrokenPowerLaw1D')
+def _broken_power_law(model, x, y):
+    x_break = _pivot(model, 'x_break', x)
+    below = x <= x_break
+
+    amplitude, alpha_1 = _power_law(x[below], y[below], x_break)
+    _, alpha_2 = _power_law(x[~below], y[~below], x_break)
+
+    return {'amplitude': amplitude, 'x_break': x_break, 'alpha_1': alpha_1,
+            'alpha_2': alpha_2}
+
+
+@register('ExponentialCutoffPowerLaw1D')
+def _cutoff_power_law(model, x, y):
+    x_0 = _pivot(model, 'x_0', x)
+    amplitude, alpha = _power_law(x, y, x_0)
+    # A cutoff beyond the data, for the fit to bring in.
+    return {'amplitude': amplitude, 'x_0': x_0, 'alpha': alpha,
+            'x_cutoff': 2 * x[-1]}
+
+
+@register('LogParabola1D')
+def _log_parabola(model, x, y):
+    x_0 = _pivot(model, 'x_0', x)
+    log_x, log_y = _log_log(x, y)
+    if log_x.size < 3:
+        return {}
+
+    beta, slope, intercept = np.polyfit(log_x - np.log(x_0), log_y, 2)
+    return {'amplitude': np.exp(intercept), 'x_0': x_0, 'alpha': -slope,
+            'beta': -beta}
@@ -1,3 +1,35 @@
+"""Extraction of regions out of NDData objects and cubes
+
+Apertures on the sky (boxes, circles and polygons, in pixel or world
+coordinates) are reduced to the bounding box of their pixels, clipped to
+the cube, and a boolean mask of the pixels within that box whose centers
+fall in the aperture, edges included. Extractions only ever index the cube with that box
+and a spectral window, which are slices, so they read the pixels under
+the aperture and nothing else.
+
+Spatial coordinates are given as (x, y): column and row pixel indices
+from zero, or longitude and latitude in the units of the celestial WCS
+with `world=True`.
+"""
+from collections import namedtuple
+
+import numpy as np
+from astropy.nddata import StdDevUncertainty
+from astropy.wcs import WCS
+from astropy.wcs.utils import proj_plane_pixel_scales
+
+from specview.core import CubeData, SpectrumArray, SpectrumData
+
+# Pixels of an aperture: the bounding box, as slices of the rows and
+# columns of a cube, and the mask of the pixels in the aperture within it.
+Aperture = namedtuple('Aperture', ['rows', 'columns', 'mask'])
+
+# Distance, in pixels, within which the center of a pixel is taken to be on
+# the edge of an aperture, so that the rounding errors of coordinates
+# converted from the world do not drop the pixels on its edges.
+TOLERANCE = 1e-6
+
+
 def extract(nddata, range, axes=(0, 1)):
     """Extracts a region out of an n-dimensional NDData object.
 
@@ -16,12 +48,289 @@ def extract(nddata, range, axes=(0, 1)):
     out: NDData
         Extracted data object.
     """
-    shape = []
-
-    for m in nddata.shape:
-        shape.append(slice(0, m))
+    shape = [slice(0, m) for m in nddata.shape]
 
     for i, axis in enumerate(axes):
         shape[axis] = slice(range[i][0], range[i][1])
 
-    return nddata[shape]
\ No newline at end of file
+    return nddata[tuple(shape)]
+
+
+def box_aperture(cube, lower, upper, world=False):
+    """Aperture of the pixels within a box.
+
+    Parameters
+    ----------
+    cube : CubeData
+        The cube, with the spectral axis first.
+    lower, upper : tuple
+        Opposite corners of the box, as (x, y). A box in world coordinates
+        is the quadrilateral of its corners in pixel coordinates.
+    world : bool
+        Whether the corners are in world coordinates.
+
+    Returns
+    -------
+    out : Aperture
+    """
+    corners = [(lower[0], lower[1]), (upper[0], lower[1]),
+               (upper[0], upper[1]), (lower[0], upper[1])]
+    if world:
+        return polygon_aperture(cube, corners, world=True)
+
+    x, y = np.array(corners, dtype=float).T
+    rows, columns, grid_x, grid_y = _grid(cube, x, y)
+    mask = ((grid_x >= x.min() - TOLERANCE) &
+            (grid_x <= x.max() + TOLERANCE) &
+            (grid_y >= y.min() - TOLERANCE) &
+            (grid_y <= y.max() + TOLERANCE))
+
+    return Aperture(rows, columns, mask)
+
+
+def circle_aperture(cube, center, radius, world=False):
+    """Aperture of the pixels within a circle.
+
+    Parameters
+    ----------
+    cube : CubeData
+        The cube, with the spectral axis first.
+    center : tuple
+        Center of the circle, as (x, y).
+    radius : float
+        Radius of the circle, in pixels, or in the units of the celestial
+        WCS with `world`, converted with the mean pixel scale.
+    world : bool
+        Whether the center and radius are in world coordinates.
+
+    Returns
+    -------
+    out : Aperture
+    """
+    center_x, center_y = center
+    if world:
+        wcs = _celestial(cube)
+        center_x, center_y = wcs.wcs_world2pix([center_x], [center_y], 0)
+        center_x, center_y = center_x[0], center_y[0]
+        radius = radius / np.mean(proj_plane_pixel_scales(wcs))
+
+    rows, columns, grid_x, grid_y = _grid(
+        cube, [center_x - radius, center_x + radius],
+        [center_y - radius, center_y + radius])
+    mask = ((grid_x - center_x) ** 2 + (grid_y - center_y) ** 2 <=
+            (radius + TOLERANCE) ** 2)
+
+    return Aperture(rows, columns, mask)
+
+
+def polygon_aperture(cube, vertices, world=False):
+    """Aperture of the pixels within a polygon.
+
+    Parameters
+    ----------
+    cube : CubeData
+        The cube, with the spectral axis first.
+    vertices : list
+        The vertices of the polygon, in order, as (x, y).
+    world : bool
+        Whether the vertices are in world coordinates.
+
+    Returns
+    -------
+    out : Aperture
+    """
+    x, y = np.array(vertices, dtype=float).T
+    if world:
+        x, y = _celestial(cube).wcs_world2pix(x, y, 0)
+
+    rows, columns, grid_x, grid_y = _grid(cube, x, y)
+
+    # Even-odd rule: a pixel is inside if a ray from it crosses the edges
+    # an odd number of times. Rays run along rows, so the crossings of an
+    # edge are computed once per row. The rule leaves out some of the
+    # pixels on the edges, which are added on their own.
+    mask = np.zeros((grid_y.size, grid_x.size), dtype=bool)
+    edges = np.zeros_like(mask)
+    for i in range(len(x)):
+        x1, y1, x2, y2 = x[i - 1], y[i - 1], x[i], y[i]
+        edges |= _near_segment(grid_x, grid_y, x1, y1, x2, y2)
+        if y1 == y2:
+            continue
+
+        crosses = (y1 > grid_y) != (y2 > grid_y)
+        at = x1 + (grid_y - y1) * (x2 - x1) / (y2 - y1)
+        mask ^= crosses & (grid_x < at)
+
+    mask |= edges
+
+    return Aperture(rows, columns, mask)
+
+
+def spectral_window(cube, x_range):
+    """Slice of the planes of `cube` with a dispersion within `x_range`,
+    bounds included, in the units of `CubeData.spectral_axis`."""
+    x = cube.spectral_axis
+    low, high = min(x_range), max(x_range)
+
+    if x.size > 1 and x[0] > x[-1]:
+        start = x.size - np.searchsorted(x[::-1], high, side='right')
+        stop = x.size - np.searchsorted(x[::-1], low, side='left')
+    else:
+        start = np.searchsorted(x, low, side='left')
+        stop = np.searchsorted(x, high, side='right')
+
+    return slice(start, max(start, stop))
+
+
+def extract_cube(cube, aperture=None, x_range=None):
+    """Extract the part of a cube under an aperture and a spectral window.
+
+    Parameters
+    ----------
+    cube : CubeData
+        The cube, with the spectral axis first.
+    aperture : Aperture
+        The aperture; the whole image plane if `None`.
+    x_range : tuple
+        Spectral window, as in `spectral_window`; all planes if `None`.
+
+    Returns
+    -------
+    out : CubeData
+        The cube within the bounding box of the aperture, sharing memory
+        with `cube`. Pixels outside the aperture are masked.
+    """
+    item = _item(cube, aperture, x_range)
+
+    mask = cube.mask
+    if mask is not None:
+        mask = np.broadcast_to(mask, cube.shape)[item]
+
+    if aperture is not None and not aperture.mask.all():
+        outside = np.broadcast_to(~aperture.mask, cube.data[item].shape)
+        mask = outside.copy() if mask is None else mask | outside
+
+    uncertainty = cube.uncertainty
+    if uncertainty is not None:
+        uncertainty = uncertainty.__class__(uncertainty.array[item],
+                                            copy=False)
+
+    wcs = cube.wcs
+    if isinstance(wcs, WCS):
+        wcs = wcs.slice(item)
+
+    result = CubeData(cube.data[item], uncertainty=uncertainty, mask=mask,
+                      wcs=wcs, meta=cube.meta, unit=cube.unit)
+    result.set_units(*cube.units)
+
+    return result
+
+
+def extract_spectrum(cube, aperture, x_range=None, method='sum'):
+    """Extract the spectrum of an aperture.
+
+    Masked and non-finite values are left out. Uncertainties, if any, are
+    propagated as independent errors.
+
+    Parameters
+    ----------
+    cube : CubeData
+        The cube, with the spectral axis first.
+    aperture : Aperture
+        The aperture, see `box_aperture`, `circle_aperture` and
+        `polygon_aperture`.
+    x_range : tuple
+        Spectral window, as in `spectral_window`; all planes if `None`.
+    method : str
+        'sum' or 'mean' of the pixels in the aperture, plane by plane.
+
+    Returns
+    -------
+    out : SpectrumData
+        The spectrum, masked where no pixel of the aperture has a value.
+    """
+    if method not in ('sum', 'mean'):
+        raise ValueError("Unknown method '{}'.".format(method))
+
+    item = _item(cube, aperture, x_range)
+
+    # Only the pixels in the aperture, as (planes, pixels).
+    values = cube.data[item][:, aperture.mask]
+    good = np.isfinite(values)
+    if cube.mask is not None:
+        mask = np.broadcast_to(cube.mask, cube.shape)[item]
+        good &= ~mask[:, aperture.mask]
+
+    count = good.sum(axis=1)
+    flux = np.where(good, values, 0).sum(axis=1)
+
+    error = None
+    if cube.uncertainty is not None:
+        sigma = np.asarray(cube.uncertainty.array[item][:, aperture.mask],
+                           dtype=float)
+        error = np.sqrt(np.where(good, sigma ** 2, 0).sum(axis=1))
+
+    if method == 'mean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            flux = flux / count
+            if error is not None:
+                error = error / count
+
+    x = cube.spectral_axis[item[0]]
+    empty = count == 0
+
+    return SpectrumData(
+        SpectrumArray(x, mask=empty if empty.any() else None,
+                      unit=cube.spectral_unit),
+        SpectrumArray(flux, mask=empty if empty.any() else None,
+                      uncertainty=None if error is None
+                      else StdDevUncertainty(error),
+                      unit=cube.unit))
+
+
+def _celestial(cube):
+    if not isinstance(cube.wcs, WCS):
+        raise ValueError("World coordinates need a cube with a WCS.")
+    return cube.wcs.celestial
+
+
+def _near_segment(grid_x, grid_y, x1, y1, x2, y2):
+    """Whether the pixels of a grid are within `TOLERANCE` of the segment
+    from (x1, y1) to (x2, y2)."""
+    dx, dy = x2 - x1, y2 - y1
+    length = dx ** 2 + dy ** 2
+    if length == 0:
+        t = 0.
+    else:
+        t = np.clip(((grid_x - x1) * dx + (grid_y - y1) * dy) / length, 0, 1)
+
+    return ((grid_x - x1 - t * dx) ** 2 + (grid_y - y1 - t * dy) ** 2 <=
+            TOLERANCE ** 2)
+
+
+def _grid(cube, x, y):
+    """Bounding box of the pixels that hold the extent of `x` and `y`,
+    clipped to the cube, and the pixel coordinates of its columns (as a
+    row) and rows (as a column). Pixel `i` holds [i - 0.5, i + 0.5)."""
+    n_rows, n_columns = cube.shape[1:]
+
+    def _span(values, size):
+        start = int(np.clip(np.floor(np.min(values) + 0.5), 0, size))
+        stop = int(np.clip(np.floor(np.max(values) + 0.5) + 1, start, size))
+        return slice(start, stop)
+
+    rows = _span(y, n_rows)
+    columns = _span(x, n_columns)
+
+    grid_x = np.arange(columns.start, columns.stop, dtype=float)[np.newaxis]
+    grid_y = np.arange(rows.start, rows.stop, dtype=float)[:, np.newaxis]
+
+    return rows, columns, grid_x, grid_y
+
+
+def _item(cube, aperture, x_range):
+    window = slice(None) if x_range is None else spectral_window(cube,
+                                                                 x_range)
+    if aperture is None:
+        return window, slice(None), slice(None)
+    return window, aperture.rows, aperture.columns
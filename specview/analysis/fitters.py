@@ -0,0 +1,185 @@
+"""Fitters complementing those of `astropy.modeling.fitting`
+
+Both follow the interface of the astropy fitters: calling them with a
+model and data returns a fitted copy of the model, and details of the fit
+are left in `fit_info`.
+"""
+import warnings
+
+import numpy as np
+from astropy.utils.exceptions import AstropyUserWarning
+
+try:
+    from scipy.optimize import least_squares
+except ImportError:
+    # Needs scipy 0.17 or later.
+    least_squares = None
+
+
+class LinearFitter(object):
+    """Least squares for models linear in their parameters, such as
+    `Polynomial1D`, `Chebyshev1D`, `Legendre1D`, `Linear1D`, `Const1D`
+    and sums of them.
+
+    The solution is direct, with no iterations and no initial guess
+    needed: the model evaluated with each parameter set to one in turn
+    gives the columns of a design matrix, and the parameters come from a
+    single linear solve.
+    """
+    supported_constraints = ['fixed']
+
+    def __init__(self):
+        self.fit_info = {}
+
+    def __call__(self, model, x, y, weights=None, **kwargs):
+        if not getattr(model, 'linear', False):
+            raise ValueError("The model is not linear in its parameters, "
+                             "use a non-linear fitter.")
+        if any(model.tied.values()):
+            raise ValueError("The linear fitter does not support tied "
+                             "parameters.")
+        if any(bound is not None
+               for name, bounds in model.bounds.items()
+               if not model.fixed[name] for bound in bounds):
+            raise ValueError("The linear fitter does not support bounds, "
+                             "use the trust region fitter.")
+
+        model = model.copy()
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+
+        params = model.parameters.copy()
+        fixed = np.array([bool(model.fixed[name])
+                          for name in model.param_names])
+
+        design = np.empty((x.size, params.size))
+        unit = np.zeros(params.size)
+        for i in range(params.size):
+            unit[:] = 0
+            unit[i] = 1
+            model.parameters = unit
+            design[:, i] = model(x)
+
+        target = y - design[:, fixed].dot(params[fixed])
+        design = design[:, ~fixed]
+
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float)
+            design = design * weights[:, np.newaxis]
+            target = target * weights
+
+        solution, residuals, rank, singular_values = np.linalg.lstsq(
+            design, target, rcond=-1)
+
+        params[~fixed] = solution
+        model.parameters = params
+
+        self.fit_info = {'residuals': residuals,
+                         'rank': rank,
+                         'singular_values': singular_values,
+                         'nfev': params.size}
+
+        if rank < design.shape[1]:
+            warnings.warn("The fit may be poorly conditioned.",
+                          AstropyUserWarning)
+
+        return model
+
+
+class TrustRegionFitter(object):
+    """Non-linear least squares with the Trust Region Reflective method of
+    `scipy.optimize.least_squares`.
+
+    Unlike Levenberg-Marquardt, the solver keeps the parameters within
+    their bounds at every step, rather than clipping them, which makes it
+    more robust for bounded fits. Analytic derivatives of the model are
+    used when there are any.
+    """
+    supported_constraints = ['fixed', 'tied', 'bounds']
+
+    def __init__(self):
+        if least_squares is None:
+            raise ImportError("The trust region fitter needs scipy 0.17 or "
+                              "later.")
+
+        self.fit_info = {}
+
+    def objective_function(self, values, model, free, x, y, weights):
+        self._set_parameters(model, free, values)
+
+        residuals = model(x) - y
+        if weights is not None:
+            residuals *= weights
+
+        return residuals
+
+    def _jacobian(self, values, model, free, x, y, weights):
+        self._set_parameters(model, free, values)
+
+        derivatives = np.asarray(model.fit_deriv(x, *model.parameters),
+                                 dtype=float)
+        if not model.col_fit_deriv:
+            derivatives = derivatives.T
+
+        jacobian = derivatives[free].T
+        if weights is not None:
+            jacobian = jacobian * weights[:, np.newaxis]
+
+        return jacobian
+
+    @staticmethod
+    def _set_parameters(model, free, values):
+        params = model.parameters
+        params[free] = values
+        model.parameters = params
+
+        for name, tie in model.tied.items():
+            if tie:
+                setattr(model, name, tie(model))
+
+    def __call__(self, model, x, y, weights=None, maxiter=None, acc=1e-8,
+                 **kwargs):
+        model = model.copy()
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if weights is not None:
+            weights = np.asarray(weights, dtype=float)
+
+        names = model.param_names
+        tied = [bool(model.tied[name]) for name in names]
+        free = np.array([not model.fixed[name] and not is_tied
+                         for name, is_tied in zip(names, tied)])
+
+        lower = np.array([-np.inf if model.bounds[name][0] is None
+                          else model.bounds[name][0] for name in names])
+        upper = np.array([np.inf if model.bounds[name][1] is None
+                          else model.bounds[name][1] for name in names])
+        lower, upper = lower[free], upper[free]
+
+        start = np.clip(model.parameters[free], lower, upper)
+
+        # Derivatives are not adjusted for ties.
+        if model.fit_deriv is not None and not any(tied):
+            jac = self._jacobian
+        else:
+            jac = '2-point'
+
+        result = least_squares(self.objective_function, start, jac=jac,
+                               bounds=(lower, upper), method='trf',
+                               ftol=acc, xtol=acc, max_nfev=maxiter,
+                               args=(model, free, x, y, weights))
+
+        self._set_parameters(model, free, result.x)
+
+        self.fit_info = {'nfev': result.nfev,
+                         'njev': result.njev,
+                         'cost': result.cost,
+                         'status': result.status,
+                         'message': result.message}
+
+        if result.status <= 0:
+            warnings.warn("The fit may be unsuccessful; check fit_info "
+                          "['message'] for more information.",
+                          AstropyUserWarning)
+
+        return model
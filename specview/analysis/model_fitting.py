@@ -1,6 +1,13 @@
+import operator
+from functools import reduce
+
 import numpy as np
 from astropy.modeling import models, fitting
 
+from specview.analysis.fitters import (LinearFitter, TrustRegionFitter,
+                                       least_squares)
+from specview.analysis.estimators import estimate
+
 all_models = {
     'Gaussian1D': models.Gaussian1D,
     'GaussianAbsorption1D': models.GaussianAbsorption1D,
@@ -24,8 +31,12 @@ all_models = {
 
 all_fitters = {
     'Levenberg-Marquardt': fitting.LevMarLSQFitter,
+    'Linear Least-Squares': LinearFitter,
 }
 
+if least_squares is not None:
+    all_fitters['Trust Region Reflective'] = TrustRegionFitter
+
 
 def get_model(name):
     if name not in all_models.keys():
@@ -41,19 +52,53 @@ def get_fitter(name):
     return all_fitters[name]()
 
 
+def compound_model(model_list):
+    """Return the sum of the models in `model_list`, as a single model.
+
+    When every model has analytic derivatives, the sum gets them too, so
+    that fitters need not estimate them numerically. With less than two
+    models, this is the model itself, or 0.
+    """
+    if len(model_list) < 2:
+        return model_list[0] if model_list else 0
+
+    compound = reduce(operator.add, model_list)
+
+    # Recent versions of astropy derive compound models themselves.
+    if compound.fit_deriv is None and all(model.fit_deriv is not None
+                                          for model in model_list):
+        compound.fit_deriv = _sum_deriv(model_list)
+        compound.col_fit_deriv = True
+
+    return compound
+
+
+def _sum_deriv(model_list):
+    """Derivatives of a sum of models, with respect to all its parameters,
+    from those of each model."""
+    bounds = np.cumsum([0] + [len(model.parameters) for model in model_list])
+    parts = [(model.fit_deriv, model.col_fit_deriv, start, stop)
+             for model, start, stop in zip(model_list, bounds[:-1],
+                                           bounds[1:])]
+
+    def fit_deriv(x, *params):
+        rows = []
+        for deriv, col_deriv, start, stop in parts:
+            derivatives = np.asarray(deriv(x, *params[start:stop]),
+                                     dtype=float)
+            if not col_deriv:
+                derivatives = derivatives.T
+            rows.extend(np.broadcast_to(row, np.shape(x))
+                        for row in derivatives)
+
+        return np.array(rows)
+
+    return fit_deriv
+
+
 def gaussian(x, y):
-    amp, mean, stddev = _gaussian_parameter_estimates(x, y)
-    g_init = models.Gaussian1D(amplitude=amp, mean=mean, stddev=stddev)
+    g_init = estimate(models.Gaussian1D(), x, y)
     fit_g = fitting.LevMarLSQFitter()
     g = fit_g(g_init, x, y)
 
     return (g.amplitude, g.mean, g.stddev), x, g(x)
-
-
-def _gaussian_parameter_estimates(x, y, dy=0):
-    amplitude = np.percentile(y, 95)
-    y = np.max(y / y.sum(), 0)
-    mean = (x * y).sum()
-    stddev = np.sqrt((y * (x - mean) ** 2).sum())
-    return amplitude, mean, stddev
-
@@ -0,0 +1,198 @@
+"""Moment maps and line maps of cubes
+
+Moments are computed over a spectral window of a cube, spaxel by spaxel:
+
+    moment 0 = sum(I dx)                   integrated flux
+    moment 1 = sum(I x dx) / moment 0      centroid
+    moment 2 = sqrt(sum(I (x - moment 1)^2 dx) / moment 0)   dispersion
+
+where `dx` is the width of each plane. They come from sums accumulated
+over the planes of the window in a single pass, tile by tile (see
+`collapse.map_tiles`), with the dispersion taken relative to the middle
+of the window to keep the sums well conditioned.
+
+The continuum under a line can be subtracted first: it is fitted to a
+straight line in each spaxel over continuum windows, from sums gathered
+in the same pass, and taken away plane by plane.
+"""
+from collections import OrderedDict
+
+import numpy as np
+from astropy.wcs import WCS
+
+from specview.core import ImageArray
+from specview.analysis.collapse import map_tiles, TILE_BYTES
+from specview.analysis.extract import spectral_window
+
+
+def moment_maps(cube, x_range=None, order=2, continuum=None, workers=None,
+                tile_bytes=TILE_BYTES):
+    """Compute the moment maps of a cube.
+
+    Masked and non-finite values are left out; spaxels with no value left,
+    or no flux, are NaN.
+
+    Parameters
+    ----------
+    cube : CubeData
+        The cube, with the spectral axis first.
+    x_range : tuple
+        Spectral window of the line, as in `extract.spectral_window`; all
+        planes if `None`.
+    order : int
+        Highest moment to compute, up to 2.
+    continuum : list
+        Spectral windows of the continuum, e.g. one on each side of the
+        line. The continuum fitted over them is subtracted first.
+    workers : int
+        Number of threads. Defaults to the number of CPUs.
+    tile_bytes : int
+        Approximate size of the tiles, in bytes.
+
+    Returns
+    -------
+    out : OrderedDict
+        `ImageArray` maps, 'moment0' to 'moment<order>', with the celestial
+        WCS of the cube.
+    """
+    if not 0 <= order <= 2:
+        raise ValueError("Moments are computed up to order 2.")
+
+    x = cube.spectral_axis
+    window = (slice(0, x.size) if x_range is None
+              else spectral_window(cube, x_range))
+    windows = [spectral_window(cube, x_range) for x_range in continuum or []]
+
+    # Only the planes from the first to the last window are read.
+    first = min([window.start] + [w.start for w in windows])
+    last = max([window.stop] + [w.stop for w in windows])
+    planes = slice(first, max(first, last))
+
+    # Positions of the planes within the tiles, their dispersion relative
+    # to the middle of the line window, and their widths.
+    line = np.arange(window.start, window.stop) - first
+    sides = np.concatenate(
+        [np.arange(w.start, w.stop) for w in windows] or
+        [np.empty(0, dtype=int)]) - first
+    center = x[window].mean() if window.stop > window.start else 0.
+    offsets = x[planes] - center
+    widths = np.abs(np.gradient(x))[planes] if x.size > 1 else np.ones(1)
+
+    def reduce_tile(values, weights):
+        slope = intercept = None
+        if sides.size:
+            intercept, slope = _continuum(values, offsets, sides)
+
+        return _moments(values, offsets, widths, line, order, intercept,
+                        slope)
+
+    images = map_tiles(reduce_tile, cube, planes=planes, workers=workers,
+                       tile_bytes=tile_bytes)
+
+    if order >= 1:
+        images[1] += center
+
+    wcs = cube.wcs.celestial if isinstance(cube.wcs, WCS) else None
+    flux_unit, x_unit = cube.unit, cube.spectral_unit
+    units = [flux_unit * x_unit if flux_unit is not None else x_unit,
+             x_unit, x_unit]
+
+    return OrderedDict(
+        ('moment{}'.format(i), ImageArray(image, wcs=wcs, unit=units[i]))
+        for i, image in enumerate(images))
+
+
+def line_map(cube, x_range, continuum, workers=None, tile_bytes=TILE_BYTES):
+    """Compute the continuum-subtracted flux of a line in each spaxel.
+
+    Parameters
+    ----------
+    cube : CubeData
+        The cube, with the spectral axis first.
+    x_range : tuple
+        Spectral window of the line.
+    continuum : list
+        Spectral windows of the continuum around the line.
+    workers : int
+        Number of threads. Defaults to the number of CPUs.
+    tile_bytes : int
+        Approximate size of the tiles, in bytes.
+
+    Returns
+    -------
+    out : ImageArray
+        The map of the line flux, i.e. the moment 0 of the line above the
+        continuum, with the celestial WCS of the cube.
+    """
+    return moment_maps(cube, x_range, order=0, continuum=continuum,
+                       workers=workers, tile_bytes=tile_bytes)['moment0']
+
+
+def _continuum(values, offsets, sides):
+    """Intercept and slope of straight lines fitted to the planes `sides`
+    of a tile, by least squares in each spaxel. A single usable plane
+    gives a flat continuum."""
+    n = np.zeros(values.shape[1:])
+    s_x = np.zeros_like(n)
+    s_xx = np.zeros_like(n)
+    s_y = np.zeros_like(n)
+    s_xy = np.zeros_like(n)
+
+    for i in sides:
+        plane = values[i]
+        good = ~np.isnan(plane)
+        y = np.where(good, plane, 0.)
+        x = offsets[i]
+
+        n += good
+        s_x += good * x
+        s_xx += good * x ** 2
+        s_y += y
+        s_xy += y * x
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        determinant = n * s_xx - s_x ** 2
+        slope = np.where(determinant == 0, 0.,
+                         (n * s_xy - s_x * s_y) / determinant)
+        intercept = (s_y - slope * s_x) / n
+
+    return intercept, slope
+
+
+def _moments(values, offsets, widths, line, order, intercept=None,
+             slope=None):
+    """Moments of the planes `line` of a tile, the first relative to the
+    origin of `offsets`, accumulated plane by plane."""
+    sums = [np.zeros(values.shape[1:]) for _ in range(order + 1)]
+    count = np.zeros(values.shape[1:], dtype=int)
+
+    for i in line:
+        plane = values[i]
+        if intercept is not None:
+            plane = plane - (intercept + slope * offsets[i])
+
+        good = ~np.isnan(plane)
+        count += good
+        flux = np.where(good, plane, 0.)
+        flux *= widths[i]
+
+        sums[0] += flux
+        for k in range(1, order + 1):
+            flux *= offsets[i]
+            sums[k] += flux
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        moments = [sums[0]]
+        if order >= 1:
+            moments.append(sums[1] / sums[0])
+        if order >= 2:
+            variance = sums[2] / sums[0] - moments[1] ** 2
+            moments.append(np.sqrt(np.clip(variance, 0, None)))
+
+    empty = count == 0
+    for moment in moments[1:]:
+        moment[sums[0] == 0] = np.nan
+    for moment in moments:
+        moment[empty] = np.nan
+
+    return tuple(moments)
@@ -0,0 +1,292 @@
+"""Resampling of spectra onto new dispersion grids
+
+Resampling is done in two steps: a plan is built from the source and
+target grids, then applied to any number of flux arrays. Plans only depend
+on the grids, so they are cached per pair of grid arrays and reused, e.g.
+when many spectra sharing a grid are added or divided.
+"""
+import weakref
+
+import numpy as np
+from scipy import sparse
+
+
+class ResamplePlan(object):
+    """Precomputed mapping from a source grid onto a target grid.
+
+    Parameters
+    ----------
+    source: ndarray
+        Dispersion of the data to resample, monotonic.
+    target: ndarray
+        Dispersion to resample onto, monotonic.
+
+    Attributes
+    ----------
+    inside: ndarray
+        Boolean array, True for the target points covered by the source.
+    matrix: sparse matrix
+        The plan as a (target, source) matrix of weights, used to carry
+        variances and masks through.
+    """
+    def __init__(self, source, target):
+        source = np.asarray(source, dtype=float)
+        target = np.asarray(target, dtype=float)
+
+        if source.size < 2:
+            raise ValueError("Cannot resample from less than two points.")
+
+        # Work on ascending grids, and reverse the data when applying.
+        self._reverse = source[0] > source[-1]
+        if self._reverse:
+            source = source[::-1]
+
+        self.size = target.size
+        self.source_size = source.size
+        self.inside = (target >= source[0]) & (target <= source[-1])
+        self._squared = None
+        self._support = None
+        self._build(source, target)
+
+    def _build(self, source, target):
+        raise NotImplementedError('_build must be implemented in a subclass.')
+
+    def _apply(self, y):
+        raise NotImplementedError('_apply must be implemented in a subclass.')
+
+    def _sparse(self, rows, cols, weights):
+        return sparse.csr_matrix((weights, (rows, cols)),
+                                 shape=(self.size, self.source_size))
+
+    def __call__(self, y, fill=0, rows=None):
+        """Resample `y`, given on the source grid.
+
+        Parameters
+        ----------
+        y: ndarray
+            Values on the source grid.
+        fill: float
+            Value for the target points outside of the source grid.
+        rows: slice
+            Only compute this range of target points.
+
+        Returns
+        -------
+        ndarray
+            Values on the target grid.
+        """
+        y = np.asarray(y)
+        if self._reverse:
+            y = y[::-1]
+
+        if rows is None:
+            result = self._apply(y)
+            result[~self.inside] = fill
+        else:
+            result = self.matrix[rows].dot(y.astype(float))
+            result[~self.inside[rows]] = fill
+
+        return result
+
+    def propagate_variance(self, variance, fill=0, rows=None):
+        """Resample the variance of the source values.
+
+        Each target value is a weighted sum of source values, so its
+        variance is the sum of the source variances times the squared
+        weights.
+        """
+        variance = np.asarray(variance, dtype=float)
+        if self._reverse:
+            variance = variance[::-1]
+
+        if self._squared is None:
+            self._squared = self.matrix.multiply(self.matrix).tocsr()
+
+        if rows is None:
+            result = self._squared.dot(variance)
+            result[~self.inside] = fill
+        else:
+            result = self._squared[rows].dot(variance)
+            result[~self.inside[rows]] = fill
+
+        return result
+
+    def propagate_mask(self, mask, rows=None):
+        """Resample a mask of the source values.
+
+        A target point is masked when any of the source points it is
+        computed from is masked.
+        """
+        mask = np.asarray(mask, dtype=float)
+        if self._reverse:
+            mask = mask[::-1]
+
+        if self._support is None:
+            support = self.matrix.copy()
+            support.data = (support.data != 0).astype(float)
+            self._support = support
+
+        support = self._support if rows is None else self._support[rows]
+        return support.dot(mask) > 0
+
+
+class LinearPlan(ResamplePlan):
+    """Linear interpolation."""
+    def _build(self, source, target):
+        idx = np.searchsorted(source, target, side='right') - 1
+        idx = np.clip(idx, 0, source.size - 2)
+
+        self._idx = idx
+        self._weight = ((target - source[idx]) /
+                        (source[idx + 1] - source[idx]))
+
+        rows = np.arange(self.size)
+        self.matrix = self._sparse(np.concatenate((rows, rows)),
+                                   np.concatenate((idx, idx + 1)),
+                                   np.concatenate((1 - self._weight,
+                                                   self._weight)))
+
+    def _apply(self, y):
+        lower = y[self._idx]
+        return lower + (y[self._idx + 1] - lower) * self._weight
+
+
+class NearestPlan(ResamplePlan):
+    """Nearest neighbour."""
+    def _build(self, source, target):
+        idx = np.clip(np.searchsorted(source, target), 1, source.size - 1)
+        left_closer = (target - source[idx - 1]) < (source[idx] - target)
+
+        self._idx = idx - left_closer
+        self.matrix = self._sparse(np.arange(self.size), self._idx,
+                                   np.ones(self.size))
+
+    def _apply(self, y):
+        return y[self._idx].astype(float)
+
+
+class FluxPlan(ResamplePlan):
+    """Flux-conserving rebinning.
+
+    Points are taken as bin centers, with the bin edges halfway between
+    them. Each target bin gets the average of the source values over the
+    part of the bin they cover, weighted by the overlap. The overlaps form
+    a sparse matrix with at most ``n + m`` non-zero entries.
+    """
+    def _build(self, source, target):
+        descending = target[0] > target[-1]
+
+        source_edges = _edges(source)
+        target_edges = _edges(target[::-1] if descending else target)
+
+        # Every segment between two consecutive edges of either grid lies
+        # in exactly one source bin and one target bin.
+        bounds = np.union1d(source_edges, target_edges)
+        lengths = np.diff(bounds)
+        centers = bounds[:-1] + lengths * 0.5
+
+        cols = np.searchsorted(source_edges, centers, side='right') - 1
+        rows = np.searchsorted(target_edges, centers, side='right') - 1
+
+        keep = ((cols >= 0) & (cols < source.size) &
+                (rows >= 0) & (rows < target.size) & (lengths > 0))
+        cols, rows, lengths = cols[keep], rows[keep], lengths[keep]
+
+        if descending:
+            rows = target.size - 1 - rows
+
+        covered = np.bincount(rows, weights=lengths, minlength=target.size)
+        self.inside = covered > 0
+
+        weights = lengths / covered[rows]
+        self.matrix = self._sparse(rows, cols, weights)
+
+    def _apply(self, y):
+        return self.matrix.dot(y.astype(float))
+
+
+def _edges(centers):
+    """Bin edges around ascending bin `centers`."""
+    mids = (centers[1:] + centers[:-1]) * 0.5
+    first = centers[0] - (mids[0] - centers[0])
+    last = centers[-1] + (centers[-1] - mids[-1])
+    return np.concatenate(([first], mids, [last]))
+
+
+plans = {
+    'linear': LinearPlan,
+    'nearest': NearestPlan,
+    'flux': FluxPlan,
+}
+
+# Plans built so far, keyed by the identity of the grids.
+_cache = {}
+
+
+def get_plan(source, target, method='linear'):
+    """Return the plan resampling from `source` onto `target`.
+
+    Plans are cached for as long as both grid arrays are alive and
+    unchanged (see `forget_plans`), so passing the same arrays again
+    returns the same plan.
+
+    Parameters
+    ----------
+    source: ndarray
+        Dispersion of the data to resample.
+    target: ndarray
+        Dispersion to resample onto.
+    method: str
+        One of 'linear', 'nearest' or 'flux'.
+    """
+    if method not in plans:
+        raise NameError("There is no resampling method named {}".format(
+            method))
+
+    key = (id(source), id(target), method)
+    entry = _cache.get(key)
+    if entry is not None and entry[0]() is source and entry[1]() is target:
+        return entry[2]
+
+    plan = plans[method](source, target)
+
+    try:
+        forget = lambda ref, key=key: _cache.pop(key, None)
+        _cache[key] = (weakref.ref(source, forget),
+                       weakref.ref(target, forget), plan)
+    except TypeError:
+        # Not weakly referenceable, e.g. a list; just don't cache.
+        pass
+
+    return plan
+
+
+def forget_plans(array):
+    """Drop the cached plans from or onto `array`, e.g. after its values
+    were modified in place."""
+    for key, entry in list(_cache.items()):
+        if entry[0]() is array or entry[1]() is array:
+            _cache.pop(key, None)
+
+
+def resample(x, y, new_x, method='linear', fill=0):
+    """Resample `y`, given on `x`, onto `new_x`.
+
+    Parameters
+    ----------
+    x: ndarray
+        Dispersion of the data.
+    y: ndarray
+        Values to resample.
+    new_x: ndarray
+        Dispersion to resample onto.
+    method: str
+        One of 'linear', 'nearest' or 'flux'.
+    fill: float
+        Value for the points of `new_x` outside of `x`.
+
+    Returns
+    -------
+    ndarray
+    """
+    return get_plan(x, new_x, method)(y, fill)
@@ -1,11 +1,57 @@
+"""Statistics over regions of spectra
+
+Regions are ranges of the dispersion. On sorted dispersions they are found
+with `np.searchsorted` and taken as slices, i.e. views, of the data rather
+than copies. Sums over any region come from prefix sums of the flux, which
+are computed once per flux array and reused for every region after that,
+until the flux array is modified (see `SpectrumArray.invalidate_cache`).
+"""
+import weakref
+from collections import OrderedDict
+
 import numpy as np
 
-from specview.core import SpectrumData
+from specview.core import SpectrumArray, SpectrumData
+
+# Prefix sums kept, the least recently used are dropped first.
+MAX_PREFIX_SUMS = 16
+
+# Prefix sums computed so far, keyed by the identity of the flux array.
+_prefix_cache = OrderedDict()
+
+# Whether arrays are sorted, keyed by their identity, see `increasing`.
+_increasing_cache = {}
+
+
+def region_slice(x, x_range):
+    """Return the slice of `x` covering `x_range`, as `x_range[0] <= x <
+    x_range[1]`, or `None` if `x` is not sorted in increasing order, e.g.
+    overlapping spectral orders.
+
+    Parameters
+    ----------
+    x: ndarray
+        Dispersion.
+    x_range: tuple
+        A spectral coordinate range as in (wave1, wave2)
+
+    Returns
+    -------
+    slice
+    """
+    if not increasing(x):
+        return None
+
+    start, stop = np.searchsorted(x, x_range[:2], side='left')
+    return slice(start, max(start, stop))
 
 
 def extract(spectrum_data, x_range):
     ''' Extracts a region from a spectrum.
 
+    On a sorted dispersion the result shares memory with `spectrum_data`
+    rather than copying the region.
+
     Paramaters
     ----------
     spectrum_data: SpectrumData
@@ -21,7 +67,9 @@ def extract(spectrum_data, x_range):
     x = spectrum_data.x.data
     y = spectrum_data.y.data
 
-    slice = (x >= x_range[0]) & (x < x_range[1])
+    slice = region_slice(x, x_range)
+    if slice is None:
+        slice = (x >= x_range[0]) & (x < x_range[1])
 
     result = SpectrumData()
     result.set_x(x[slice], unit=spectrum_data.x.unit)
@@ -30,7 +78,7 @@ def extract(spectrum_data, x_range):
     return result
 
 
-def stats(spectrum_data):
+def stats(spectrum_data, x_range=None):
     ''' Computes basic statistics for a spectral region
     contained in a SpectrumData instance.
 
@@ -38,13 +86,108 @@ def stats(spectrum_data):
     ----------
     spectrum_data: SpectrumData
       Typically this is returned by the extract() function
+    x_range: tuple
+      Only use this range of the spectrum, without extracting it first.
 
     Returns
     -------
     statistics: dict
 
     '''
+    if x_range is None:
+        x_range = (-np.inf, np.inf)
+
+    return region_stats(spectrum_data, [x_range])[0]
+
+
+def region_stats(spectrum_data, x_ranges):
+    ''' Computes the statistics of `stats` for many regions of a
+    spectrum at once.
+
+    Means, standard deviations and totals come from prefix sums, so each
+    region costs a few operations whatever its size; only medians look at
+    the values of each region.
+
+    Paramaters
+    ----------
+    spectrum_data: SpectrumData
+      The spectrum.
+    x_ranges: [tuple,]
+      Spectral coordinate ranges as in (wave1, wave2)
+
+    Returns
+    -------
+    statistics: [dict,]
+      One per range, in order.
+
+    '''
+    x = spectrum_data.x.data
     flux = spectrum_data.y.data
+
+    if not increasing(x):
+        # Regions are not contiguous.
+        return [_stats(extract(spectrum_data, x_range).y.data)
+                for x_range in x_ranges]
+
+    offset, sums, squares, areas = _prefix_sums(flux)
+
+    results = []
+    for x_range in x_ranges:
+        region = region_slice(x, x_range)
+        start, stop = region.start, region.stop
+        npoints = stop - start
+
+        if npoints == 0:
+            results.append(_stats(flux[region]))
+            continue
+
+        total = sums[stop] - sums[start]
+        mean = total / npoints
+        variance = (squares[stop] - squares[start]) / npoints - mean ** 2
+
+        results.append({'mean': mean + offset,
+                        'median': np.median(flux[region]),
+                        'stddev': np.sqrt(max(variance, 0)),
+                        # Trapezoids between consecutive points, unit step.
+                        'total': (areas[stop - 1] - areas[start] +
+                                  offset * (npoints - 1)),
+                        'npoints': npoints})
+
+    return results
+
+
+def increasing(x):
+    """Whether `x` is a one-dimensional array in increasing order, equal
+    values allowed.
+
+    Every point is checked, which takes a pass over `x`, so the answer is
+    cached for as long as `x` is alive and unchanged (see
+    `SpectrumArray.invalidate_cache`).
+    """
+    if not isinstance(x, np.ndarray):
+        x = np.asarray(x)
+    if x.ndim != 1:
+        return False
+    if x.size < 2:
+        return True
+
+    key = id(x)
+    entry = _increasing_cache.get(key)
+    if entry is not None and entry[0]() is x:
+        return entry[1]
+
+    result = bool(np.all(x[1:] >= x[:-1]))
+
+    try:
+        forget = lambda ref, key=key: _increasing_cache.pop(key, None)
+        _increasing_cache[key] = (weakref.ref(x, forget), result)
+    except TypeError:
+        pass
+
+    return result
+
+
+def _stats(flux):
     return {'mean':    np.mean(flux),
             'median':  np.median(flux),
             'stddev':  np.std(flux),
@@ -53,6 +196,54 @@ def stats(spectrum_data):
             }
 
 
+def _prefix_sums(flux):
+    """Prefix sums of the flux, its square and the trapezoids between
+    points, cached for as long as `flux` is alive and unchanged.
+
+    Sums are taken around the mean of `flux`, returned first, which keeps
+    the variances of small regions accurate.
+    """
+    key = id(flux)
+    entry = _prefix_cache.pop(key, None)
+    if entry is not None and entry[0]() is flux:
+        _prefix_cache[key] = entry
+        return entry[1]
+
+    offset = flux.mean() if flux.size else 0.
+    centered = flux - offset
+
+    sums = np.zeros(flux.size + 1)
+    np.cumsum(centered, out=sums[1:])
+
+    squares = np.zeros(flux.size + 1)
+    np.cumsum(centered * centered, out=squares[1:])
+
+    areas = np.zeros(max(flux.size, 1))
+    np.cumsum((centered[1:] + centered[:-1]) * 0.5, out=areas[1:])
+
+    result = (offset, sums, squares, areas)
+
+    try:
+        forget = lambda ref, key=key: _prefix_cache.pop(key, None)
+        _prefix_cache[key] = (weakref.ref(flux, forget), result)
+    except TypeError:
+        pass
+
+    while len(_prefix_cache) > MAX_PREFIX_SUMS:
+        _prefix_cache.popitem(last=False)
+
+    return result
+
+
+@SpectrumArray.on_invalidate
+def _forget(array):
+    """Drop what is cached about an array whose values changed."""
+    for cache in (_prefix_cache, _increasing_cache):
+        entry = cache.get(id(array))
+        if entry is not None and entry[0]() is array:
+            del cache[id(array)]
+
+
 def eq_width(cont1_stats, cont2_stats, line):
     ''' Computes an equivalent width given stats for two continuum
     regions, and a SpectrumData instance with the extracted
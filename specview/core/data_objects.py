@@ -1,7 +1,37 @@
+import weakref
+from collections import OrderedDict
+
 import numpy as np
-from astropy.nddata import (NDData, NDSlicingMixin, NDArithmeticMixin)
+from astropy.nddata import (NDData, NDSlicingMixin, NDArithmeticMixin,
+                            StdDevUncertainty)
 from astropy.wcs import WCS
-from astropy.units import Unit
+from astropy.constants import c
+from astropy.units import (Unit, UnitsError, spectral, spectral_density,
+                           AA, Hz, erg, s, cm, ABmag, STmag)
+
+from specview.analysis.resample import get_plan, forget_plans
+
+# Unit conversions kept per array, the oldest are dropped first.
+MAX_CONVERSIONS = 8
+
+# Reference units of flux densities per unit frequency and per unit
+# wavelength, which `SpectrumData.to` converts between directly.
+FNU = erg / s / cm ** 2 / Hz
+FLAM = erg / s / cm ** 2 / AA
+
+# Magnitude systems, as the kind of flux density they are defined on and
+# their zero point in the reference unit of that kind.
+MAGNITUDES = {
+    ABmag: ('fnu', 48.60),
+    STmag: ('flam', 21.10),
+}
+REFERENCES = {'fnu': FNU, 'flam': FLAM}
+
+_C_AA = c.to(AA / s).value
+
+# The `SpectrumArray` objects holding each buffer, keyed by the identity of
+# the array owning the memory, see `SpectrumArray.shared`.
+_holders = {}
 
 
 class SpectrumArray(NDSlicingMixin, NDArithmeticMixin, NDData):
@@ -11,25 +41,106 @@ class SpectrumArray(NDSlicingMixin, NDArithmeticMixin, NDData):
     Contains additional metadata such as uncertainties, a mask, units,
     and/or coordinate system.
     """
+    # Called by `invalidate_cache`, see `on_invalidate`.
+    _invalidation_hooks = []
+
     def __init__(self, *args, **kwargs):
         super(SpectrumArray, self).__init__(*args, **kwargs)
 
+        _hold(self, self._data)
+        if self.uncertainty is not None:
+            _hold(self, self.uncertainty.array)
+
+    @classmethod
+    def on_invalidate(cls, func):
+        """
+        Register `func` to be called by `invalidate_cache` with each array
+        of values it drops, i.e. the data, its compressed view and the
+        uncertainties, so that what is cached on the identity of these
+        arrays elsewhere is dropped along. Returns `func`, so it can be
+        used as a decorator.
+        """
+        SpectrumArray._invalidation_hooks.append(func)
+        return func
+
     @property
     def shape(self):
         return self.data.shape
 
     @property
     def data(self):
+        """
+        The unmasked values. When there is a mask, this is a read-only
+        compressed copy, computed once and reused until the mask or the
+        underlying array is replaced (see `invalidate_cache`).
+        """
+        data = super(SpectrumArray, self).data
+
         if self.mask is None:
-            return super(SpectrumArray, self).data
-        else:
-            return super(SpectrumArray, self).data[np.logical_not(self.mask)]
+            return data
+
+        cache = getattr(self, '_compressed', None)
+        if cache is None or cache[0] is not data or cache[1] is not self.mask:
+            compressed = data[np.logical_not(self.mask)]
+            compressed.flags.writeable = False
+            cache = (data, self.mask, compressed)
+            self._compressed = cache
+
+        return cache[2]
+
+    @property
+    def mask(self):
+        return super(SpectrumArray, self).mask
+
+    @mask.setter
+    def mask(self, value):
+        NDData.mask.fset(self, value)
+        self.invalidate_cache()
+
+    @property
+    def masked(self):
+        """
+        Zero-copy `numpy.ma.MaskedArray` view of the full array and mask.
+        """
+        return np.ma.MaskedArray(super(SpectrumArray, self).data,
+                                 mask=np.ma.nomask if self.mask is None
+                                 else self.mask,
+                                 copy=False)
+
+    def invalidate_cache(self):
+        """
+        Drop values derived from the data, i.e. the compressed view, the
+        unit conversions and what was registered with `on_invalidate`.
+        Needed only after modifying the mask or the data in place;
+        replacing either is detected.
+        """
+        compressed = getattr(self, '_compressed', None)
+        self._compressed = None
+        self._conversions = OrderedDict()
+
+        # Also called by the mask setter while the object is initialized.
+        uncertainty = getattr(self, '_uncertainty', None)
+        arrays = [getattr(self, '_data', None)]
+        if compressed is not None:
+            arrays.append(compressed[2])
+        if uncertainty is not None:
+            arrays.append(uncertainty.array)
+
+        for func in self._invalidation_hooks:
+            for array in arrays:
+                if array is not None:
+                    func(array)
 
     def convert_unit_to(self, unit, equivalencies=[]):
         """
         Returns a new `NDData` object whose values have been converted
         to a new unit. Adapted from `compat.py` of Astropy.
 
+        Conversions are cached per target unit and equivalencies until the
+        data, mask or uncertainty are replaced (see `invalidate_cache`), and
+        converting to the current unit returns this object itself. The
+        arrays of a cached result are shared, hence read-only.
+
         Parameters
         ----------
         unit : `astropy.units.UnitBase` instance or str
@@ -51,7 +162,28 @@ class SpectrumArray(NDSlicingMixin, NDArithmeticMixin, NDData):
         if self.unit is None:
             raise ValueError("No unit specified on source data")
 
-        data = self.unit.to(unit, self.data, equivalencies=equivalencies)
+        unit = Unit(unit)
+        if unit == self.unit:
+            return self
+
+        state = (self._data, self.mask, self.uncertainty)
+        conversions = getattr(self, '_conversions', None)
+        if conversions is None:
+            conversions = self._conversions = OrderedDict()
+
+        try:
+            key = (unit, tuple(tuple(pair) for pair in equivalencies))
+            hash(key)
+        except TypeError:
+            # e.g. equivalencies holding arrays; convert without caching.
+            key = None
+
+        cached = conversions.get(key) if key is not None else None
+        if cached is not None and all(a is b for a, b in zip(cached[0],
+                                                             state)):
+            return cached[1]
+
+        data = self.unit.to(unit, self._data, equivalencies=equivalencies)
 
         if self.uncertainty is not None:
             uncertainty_values = self.unit.to(unit, self.uncertainty.array,
@@ -72,8 +204,87 @@ class SpectrumArray(NDSlicingMixin, NDArithmeticMixin, NDData):
                                 wcs=self.wcs,
                                 meta=self.meta, unit=unit)
 
+        if key is not None:
+            for array in (data, new_mask):
+                if isinstance(array, np.ndarray):
+                    array.flags.writeable = False
+
+            conversions[key] = (state, result)
+            while len(conversions) > MAX_CONVERSIONS:
+                conversions.popitem(last=False)
+
+        return result
+
+    def view(self, item=slice(None), mask=None):
+        """
+        Read-only `SpectrumArray` sharing the buffers of this one.
+
+        Parameters
+        ----------
+        item : slice
+            Part of the array to view.
+        mask : ndarray of bool, optional
+            Values to leave out, of the shape of the full array. It is
+            combined with the mask of this array, if any.
+        """
+        result = self[item]
+
+        for array in (result._data, result.mask,
+                      None if result.uncertainty is None
+                      else result.uncertainty.array):
+            if isinstance(array, np.ndarray):
+                array.flags.writeable = False
+
+        if mask is not None:
+            mask = mask[item]
+            result.mask = mask if result.mask is None else result.mask | mask
+
         return result
 
+    @property
+    def shared(self):
+        """
+        Whether the data or uncertainty buffers of this array are not its
+        own alone, in which case they must not be written over: they are
+        views of other arrays or of a file, or are held by other
+        `SpectrumArray` objects, e.g. views of layers (see `view`), results
+        of `SpectrumData.to` or of arithmetic keeping the dispersion, or
+        regions from `statistics.extract`.
+        """
+        arrays = [self._data]
+        if self.uncertainty is not None:
+            arrays.append(self.uncertainty.array)
+
+        for array in arrays:
+            if not isinstance(array, np.ndarray) or array.base is not None:
+                return True
+
+            entry = _holders.get(id(array))
+            if (entry is not None and entry[0]() is array and
+                    any(holder is not self for holder in entry[1])):
+                return True
+
+        return False
+
+    def copy(self):
+        """
+        Writeable `SpectrumArray` with its own copies of the data, mask and
+        uncertainty of this one.
+        """
+        uncertainty = None
+        if self.uncertainty is not None:
+            uncertainty = self.uncertainty.__class__(
+                np.array(self.uncertainty.array))
+
+        return self.__class__(np.array(self._data), uncertainty=uncertainty,
+                              mask=None if self.mask is None
+                              else np.array(self.mask),
+                              wcs=self.wcs, meta=self.meta, unit=self.unit)
+
+
+# Resampling plans are cached on the identity of the grids.
+SpectrumArray.on_invalidate(forget_plans)
+
 
 class SpectrumData(object):
     """
@@ -83,6 +294,43 @@ class SpectrumData(object):
     def __init__(self, x=None, y=None):
         self._x = x
         self._y = y
+        # Open file the arrays may be memory-mapped from. Keeping the
+        # reference here ties the lifetime of the file to this object.
+        self.source = None
+
+    def close(self):
+        """
+        Copy any memory-mapped data into memory and close the file backing
+        it. The object stays usable afterwards.
+        """
+        if self.source is None:
+            return
+
+        for array in (self._x, self._y):
+            # Views of the mapped file do not own their memory.
+            if array is not None and array._data.base is not None:
+                array._data = np.array(array._data)
+
+        self.source.close()
+        self.source = None
+
+    def view(self, mask=None):
+        """
+        Read-only spectrum sharing the arrays of this one, e.g. for a layer.
+
+        Nothing is copied: the values kept by `mask` (True for values to
+        leave out) are sliced out of the arrays when they are contiguous,
+        and otherwise masked within the smallest slice holding them. Use
+        `copy` on the result to modify it.
+        """
+        item, mask = _selection(mask)
+        return SpectrumData(self._x.view(item, mask), self._y.view(item, mask))
+
+    def copy(self):
+        """
+        Spectrum with writeable copies of the arrays of this one.
+        """
+        return SpectrumData(self._x.copy(), self._y.copy())
 
     def set_x(self, data, wcs=None, unit=None, name=""):
         if not isinstance(wcs, WCS) and wcs is not None:
@@ -117,73 +365,189 @@ class SpectrumData(object):
         self.x.mask = value
         self.y.mask = value
 
-    def add(self, operand, propagate_uncertainties=False):
-        # new_y = self._y.add(operand.y, propagate_uncertainties)
-        a, b = self._fit_shape(self, operand)
-        new_y = a.y.add(b.y, propagate_uncertainties)
-        return SpectrumData(self._x, new_y)
-
-    def subtract(self, operand, propagate_uncertainties=False):
-        # new_y = self._y.subtract(operand.y, propagate_uncertainties)
-        a, b = self._fit_shape(self, operand)
-        new_y = a.y.subtract(b.y, propagate_uncertainties)
-        return SpectrumData(self._x, new_y)
-
-    def multiply(self, operand, propagate_uncertainties=False):
-        # new_y = self._y.multiply(operand.y, propagate_uncertainties)
-        a, b = self._fit_shape(self, operand, fill=1)
-        new_y = a.y.multiply(b.y, propagate_uncertainties)
-        return SpectrumData(self._x, new_y)
-
-    def divide(self, operand, propagate_uncertainties=False):
-        # new_y = self._y.divide(operand.y, propagate_uncertainties)
-        a, b = self._fit_shape(self, operand, fill=1)
-        new_y = a.y.divide(b.y, propagate_uncertainties)
-        return SpectrumData(self._x, new_y)
-
-    def _fit_shape(self, a, b, fill=0):
-        if a.x.shape[0] == b.x.shape[0]:
-            fin_x = a
-            fin_y = b
-        elif a.x.shape[0] > b.x.shape[0]:
-            # Make y the same shape
-            x_start = a.x.data[a.x.data < b.x.data[0]]
-            x_end = a.x.data[a.x.data > b.x.data[-1]]
-            new_x = np.concatenate((x_start, b.x.data, x_end))
-
-            y_fill = np.empty(new_x.size)
-            y_fill.fill(fill)
-
-            y_start = y_fill[new_x < b.x.data[0]]
-            y_end = y_fill[new_x > b.x.data[-1]]
-            new_y = np.concatenate((y_start, b.y.data, y_end))
-
-            yp = np.interp(a.x.data, new_x, new_y)
-
-            fin_x = a
-            fin_y = SpectrumData(SpectrumArray(new_x, unit=b.x.unit, wcs=b.x.wcs),
-                                 SpectrumArray(yp, unit=b.y.unit, wcs=b.y.wcs))
+    def to(self, x_unit=None, y_unit=None, in_place=False):
+        """
+        Convert the dispersion and the flux to other units.
+
+        The dispersion converts between wavelength, frequency, energy and
+        wavenumber units; the flux between densities per unit frequency
+        (e.g. Jy), densities per unit wavelength and AB or ST magnitudes.
+        Flux conversions are computed as a single scale factor per point,
+        applied to the flux and its uncertainty. Other flux units are left
+        to `astropy.units.spectral_density`.
+
+        Parameters
+        ----------
+        x_unit: `astropy.units.Unit` or str
+            Unit of the dispersion, unchanged if `None`.
+        y_unit: `astropy.units.Unit` or str
+            Unit of the flux, unchanged if `None`.
+        in_place: bool
+            Write the converted values over the current arrays where they
+            are writeable floating point arrays that no other array shares
+            (see `SpectrumArray.shared`), and update this object rather
+            than returning a new one.
+
+        Returns
+        -------
+        SpectrumData
+            The converted spectrum, this object if `in_place`.
+        """
+        x, y = self._x, self._y
+        x_data, y_data = x._data, y._data
+        error = None if y.uncertainty is None else y.uncertainty.array
 
+        new_x_unit = x.unit if x_unit is None else _unit(x_unit)
+        new_y_unit = y.unit if y_unit is None else _unit(y_unit)
+
+        if x.unit is None or y.unit is None:
+            raise ValueError("No unit specified on source data")
+
+        # Shared arrays, e.g. of layers or of other spectra, are copied on
+        # write, so that the others keep the values of their unit.
+        y_in_place = in_place and not y.shared
+        x_in_place = in_place and not x.shared
+
+        # The flux goes first, it needs the dispersion as it is.
+        if new_y_unit != y.unit:
+            y_data, error = _convert_flux(y.unit, new_y_unit, x.unit,
+                                          x_data, y_data, error, y_in_place)
+            if y_in_place:
+                y.invalidate_cache()
+
+        if new_x_unit != x.unit:
+            x_data = _convert(x.unit, new_x_unit, x_data, x_in_place)
+            if x_in_place:
+                x.invalidate_cache()
+
+        uncertainty = None
+        if error is not None:
+            uncertainty = y.uncertainty.__class__(error)
+
+        new_x = SpectrumArray(x_data, mask=x.mask, wcs=x.wcs, meta=x.meta,
+                              unit=new_x_unit)
+        new_y = SpectrumArray(y_data, uncertainty=uncertainty, mask=y.mask,
+                              wcs=y.wcs, meta=y.meta, unit=new_y_unit)
+
+        if not in_place:
+            return SpectrumData(new_x, new_y)
+
+        self._x, self._y = new_x, new_y
+        return self
+
+    def add(self, operand, propagate_uncertainties=False, method='linear'):
+        return self._arithmetic(np.add, operand, 0,
+                                propagate_uncertainties, method)
+
+    def subtract(self, operand, propagate_uncertainties=False,
+                 method='linear'):
+        return self._arithmetic(np.subtract, operand, 0,
+                                propagate_uncertainties, method)
+
+    def multiply(self, operand, propagate_uncertainties=False,
+                 method='linear'):
+        return self._arithmetic(np.multiply, operand, 1,
+                                propagate_uncertainties, method)
+
+    def divide(self, operand, propagate_uncertainties=False, method='linear'):
+        return self._arithmetic(np.divide, operand, 1,
+                                propagate_uncertainties, method)
+
+    def _arithmetic(self, operation, operand, fill, propagate_uncertainties,
+                    method):
+        """
+        Apply `operation` to the flux of this spectrum and of `operand`,
+        resampled onto this spectrum's dispersion with `method` ('linear',
+        'nearest' or 'flux'). The mask of the result combines both masks,
+        and with `propagate_uncertainties` the variances are propagated to
+        first order. Uncertainties are only propagated when both operands
+        have some; otherwise the result has none, as the errors of the
+        other operand are not known to be negligible.
+        """
+        a = self._y
+        b = self._fit_shape(operand, fill=fill, method=method).y
+        a_data, b_data = a._data, b._data
+        unit = a.unit
+        scale = 1
+
+        if a.unit is not None and b.unit is not None:
+            if operation in (np.add, np.subtract):
+                if b.unit != a.unit:
+                    scale = b.unit.to(a.unit)
+                    b_data = b_data * scale
+            elif operation is np.multiply:
+                unit = a.unit * b.unit
+            else:
+                unit = a.unit / b.unit
+
+        result = operation(a_data, b_data)
+
+        uncertainty = None
+        if propagate_uncertainties and (a.uncertainty is not None and
+                                        b.uncertainty is not None):
+            var_a = _variance(a)
+            var_b = _variance(b) * scale ** 2
+
+            if operation in (np.add, np.subtract):
+                variance = var_a + var_b
+            elif operation is np.multiply:
+                variance = var_a * b_data ** 2 + var_b * a_data ** 2
+            else:
+                variance = (var_a + var_b * result ** 2) / b_data ** 2
+
+            uncertainty = StdDevUncertainty(np.sqrt(variance))
+
+        if a.mask is None or b.mask is None:
+            mask = a.mask if b.mask is None else b.mask
         else:
-            # Make y the same shape
-            x_start = b.x.data[b.x.data < a.x.data[0]]
-            x_end = b.x.data[b.x.data > a.x.data[-1]]
-            new_x = np.concatenate((x_start, a.x.data, x_end))
+            mask = a.mask | b.mask
+
+        new_x = SpectrumArray(self._x._data, mask=mask, unit=self._x.unit,
+                              wcs=self._x.wcs)
+        new_y = SpectrumArray(result, uncertainty=uncertainty, mask=mask,
+                              unit=unit, wcs=a.wcs)
+
+        return SpectrumData(new_x, new_y)
 
-            y_fill = np.empty(new_x.size)
-            y_fill.fill(fill)
+    def _fit_shape(self, operand, fill=0, method='linear'):
+        """
+        Return `operand` resampled onto the dispersion of this spectrum,
+        using `fill` where the operand does not cover it. Uncertainties and
+        mask are resampled along. Resampling plans are cached per pair of
+        grids (see `specview.analysis.resample`).
+        """
+        x = self.x._data
+        other_x = operand.x._data
 
-            y_start = y_fill[new_x < a.x.data[0]]
-            y_end = y_fill[new_x > a.x.data[-1]]
-            new_y = np.concatenate((y_start, a.y.data, y_end))
+        if other_x is x or (other_x.shape == x.shape and
+                            np.array_equal(other_x, x)):
+            return operand
 
-            yp = np.interp(b.x.data, new_x, new_y)
+        if (self.x.unit is not None and operand.x.unit is not None and
+                operand.x.unit != self.x.unit):
+            other_x = operand.x.unit.to(self.x.unit, other_x,
+                                        equivalencies=spectral())
 
-            fin_x = SpectrumData(SpectrumArray(new_x, unit=a.x.unit, wcs=a.x.wcs),
-                                 SpectrumArray(yp, unit=a.y.unit, wcs=a.y.wcs))
-            fin_y = b
+        plan = get_plan(other_x, x, method)
+        y = operand.y
 
-        return fin_x, fin_y
+        uncertainty = None
+        if y.uncertainty is not None:
+            variance = plan.propagate_variance(_variance(y))
+            uncertainty = StdDevUncertainty(np.sqrt(variance))
+
+        mask = None
+        if y.mask is not None:
+            mask = plan.propagate_mask(y.mask)
+
+        # A new array on the same buffer, so that it shows as shared.
+        new_x = SpectrumArray(x, mask=self._x.mask, wcs=self._x.wcs,
+                              meta=self._x.meta, unit=self._x.unit)
+
+        return SpectrumData(new_x,
+                            SpectrumArray(plan(y._data, fill),
+                                          uncertainty=uncertainty, mask=mask,
+                                          unit=y.unit, wcs=y.wcs))
 
     def __add__(self, other):
         return self.add(other)
@@ -198,6 +562,161 @@ class SpectrumData(object):
         return self.divide(other)
 
 
+def _root(array):
+    """The array owning the memory of `array`, or the outermost array."""
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    return array
+
+
+def _hold(holder, array):
+    """Record that the `SpectrumArray` `holder` holds `array`."""
+    if not isinstance(array, np.ndarray):
+        return
+
+    root = _root(array)
+    key = id(root)
+    entry = _holders.get(key)
+    if entry is None or entry[0]() is not root:
+        forget = lambda ref, key=key: _holders.pop(key, None)
+        entry = _holders[key] = (weakref.ref(root, forget),
+                                 weakref.WeakSet())
+    entry[1].add(holder)
+
+
+def _selection(mask):
+    """
+    Smallest slice holding the values not in `mask`, and the mask still
+    needed within it, `None` when they are contiguous.
+    """
+    if mask is None:
+        return slice(None), None
+
+    keep = np.logical_not(mask)
+    if not keep.any():
+        return slice(0, 0), None
+
+    start = np.argmax(keep)
+    stop = keep.size - np.argmax(keep[::-1])
+    if keep[start:stop].all():
+        return slice(start, stop), None
+
+    return slice(start, stop), np.asarray(mask, dtype=bool)
+
+
+def _variance(array):
+    """Variance of the full data of a `SpectrumArray`, zero if unknown."""
+    if array.uncertainty is None:
+        return np.zeros(array._data.shape)
+
+    return np.asarray(array.uncertainty.array, dtype=float) ** 2
+
+
+def _unit(unit):
+    """`Unit` of `unit`, also accepting magnitude units and their names."""
+    if isinstance(unit, str):
+        for mag in MAGNITUDES:
+            if unit in (mag.to_string(), str(mag.physical_unit) + 'mag'):
+                return mag
+    return unit if unit in MAGNITUDES else Unit(unit)
+
+
+def _out(values, in_place):
+    """`values` when it can take the result of an in-place conversion."""
+    if (in_place and isinstance(values, np.ndarray) and
+            values.flags.writeable and values.dtype.kind == 'f'):
+        return values
+    return None
+
+
+def _convert(unit, new_unit, values, in_place=False):
+    """Convert dispersion `values`, by a plain scale when possible."""
+    try:
+        scale = unit.to(new_unit)
+    except UnitsError:
+        result = unit.to(new_unit, values, equivalencies=spectral())
+        out = _out(values, in_place)
+        if out is None:
+            return result
+        out[...] = result
+        return out
+
+    return np.multiply(values, scale, out=_out(values, in_place))
+
+
+def _flux_kind(unit):
+    """
+    Kind of flux density of `unit`, 'fnu' or 'flam', and its scale to the
+    reference unit of that kind; `(None, None)` for other units.
+    """
+    for kind, reference in (('fnu', FNU), ('flam', FLAM)):
+        try:
+            return kind, unit.to(reference)
+        except UnitsError:
+            pass
+    return None, None
+
+
+def _convert_flux(unit, new_unit, x_unit, x, y, error, in_place=False):
+    """
+    Convert flux values `y` and their errors from `unit` to `new_unit`,
+    `x` being the dispersion in `x_unit`.
+
+    Magnitudes are first turned into flux densities. The conversion of
+    flux densities is then a factor per point: a constant between units of
+    the same kind, proportional to the squared wavelength otherwise.
+    """
+    y_out = _out(y, in_place)
+    error_out = None if error is None else _out(error, in_place)
+
+    if unit in MAGNITUDES:
+        kind, zero_point = MAGNITUDES[unit]
+        unit = REFERENCES[kind]
+        y = np.power(10., -0.4 * (y + zero_point), out=y_out)
+        if error is not None:
+            error = np.multiply(error, y * (np.log(10) / 2.5), out=error_out)
+        # Both are new arrays from here on, or may be overwritten anyway.
+        y_out, error_out = y, error
+
+    zero_point = None
+    if new_unit in MAGNITUDES:
+        new_kind, zero_point = MAGNITUDES[new_unit]
+        new_unit = REFERENCES[new_kind]
+
+    kind, scale = _flux_kind(unit)
+    new_kind, new_scale = _flux_kind(new_unit)
+
+    if kind is None or new_kind is None:
+        # Let astropy work out the factors, point by point.
+        wave = x_unit.to(AA, x, equivalencies=spectral()) * AA
+        factor = unit.to(new_unit, np.ones(wave.shape),
+                         equivalencies=spectral_density(wave))
+    elif kind == new_kind:
+        factor = scale / new_scale
+    else:
+        # F_lambda = F_nu * c / lambda ** 2, with lambda in Angstrom.
+        factor = x_unit.to(AA, x, equivalencies=spectral()) ** 2
+        if kind == 'fnu':
+            np.divide(scale * _C_AA / new_scale, factor, out=factor)
+        else:
+            factor *= scale / (_C_AA * new_scale)
+
+    y = np.multiply(y, factor, out=y_out)
+    if error is not None:
+        error = np.multiply(error, np.abs(factor), out=error_out)
+
+    if zero_point is not None:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if error is not None:
+                np.divide(error, y, out=error)
+                error *= 2.5 / np.log(10)
+            np.log10(y, out=y)
+            y *= -2.5
+            y -= zero_point
+
+    return y, error
+
+
 class ImageArray(NDSlicingMixin, NDArithmeticMixin, NDData):
     """
     Basic container for image data.
@@ -241,6 +760,41 @@ class CubeData(NDSlicingMixin, NDArithmeticMixin, NDData):
     def shape(self):
         return self.data.shape
 
+    @property
+    def spectral_axis(self):
+        """
+        Dispersion of the planes along the spectral axis, axis 0. Computed
+        from the WCS when there is one, in `spectral_unit`; pixel
+        indices otherwise.
+        """
+        pixels = np.arange(self.shape[0], dtype=float)
+
+        if not isinstance(self.wcs, WCS):
+            return pixels
+
+        return self._spectral_wcs().wcs_pix2world(pixels, 0)[0]
+
+    @property
+    def spectral_unit(self):
+        """
+        Unit of `spectral_axis`: that of the WCS when there is one, as
+        normalized by WCSLIB, e.g. SI units for wavelengths and
+        frequencies, the unit of axis 0 otherwise.
+        """
+        if not isinstance(self.wcs, WCS):
+            return self._units[0]
+
+        return Unit(self._spectral_wcs().wcs.cunit[0])
+
+    def _spectral_wcs(self):
+        """The spectral axis of the WCS, set up as for computing world
+        coordinates, which may change its units."""
+        # Numpy axis 0 is the last WCS axis.
+        spectral_wcs = self.wcs.sub([self.wcs.naxis])
+        spectral_wcs.fix()
+        spectral_wcs.wcs.set()
+        return spectral_wcs
+
 
 if __name__ == '__main__':
     arr = np.random.normal(size=10)
@@ -3,25 +3,39 @@ from specview.tools import decorate
 
 # Stats functions
 from specview.analysis.statistics import stats, eq_width, extract
+from specview.analysis.coadd import coadd as _coadd
 
 
 # Basic math
+#
+# The operand is resampled onto the dispersion of the first item with
+# `method`, one of 'linear', 'nearest' or 'flux' (flux-conserving).
 @decorate.display_result
-def add(a, b):
+def add(a, b, method='linear'):
     """Add items"""
-    return a + b
+    return a.add(b, propagate_uncertainties=True, method=method)
 
 
 @decorate.display_result
-def subtract(a, b):
-    return a - b
+def subtract(a, b, method='linear'):
+    return a.subtract(b, propagate_uncertainties=True, method=method)
 
 
 @decorate.display_result
-def multiply(a, b):
-    return a * b
+def multiply(a, b, method='linear'):
+    return a.multiply(b, propagate_uncertainties=True, method=method)
 
 
 @decorate.display_result
-def divide(a, b):
-    return a / b
+def divide(a, b, method='linear'):
+    return a.divide(b, propagate_uncertainties=True, method=method)
+
+
+@decorate.display_result
+def coadd(*items, **kwargs):
+    """Coadd items on a common grid, see `specview.analysis.coadd`
+
+    Items are weighted by inverse variance when all have uncertainties,
+    equally otherwise, and errors are only propagated where all items
+    have uncertainties, as for the operations above."""
+    return _coadd(items, **kwargs)
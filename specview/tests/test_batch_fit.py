@@ -0,0 +1,75 @@
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+from astropy.modeling import models
+from astropy.units import AA, Jy
+
+from specview.core import CubeData, SpectrumArray, SpectrumData
+from specview.analysis import batch_fit
+
+
+def _lines(n, n_points=80, seed=0):
+    """Noisy Gaussian lines with parameters drifting from one to the
+    next, as in neighbouring spaxels."""
+    random = np.random.RandomState(seed)
+    x = np.arange(n_points, dtype=float)
+    amplitude = np.linspace(2., 6., n)
+    mean = np.linspace(35., 45., n)
+    stddev = np.linspace(3., 6., n)
+    y = amplitude[:, None] * np.exp(-0.5 * ((x - mean[:, None]) /
+                                            stddev[:, None]) ** 2)
+    y += random.normal(0., 0.05, y.shape)
+    return x, y, np.array([amplitude, mean, stddev]).T
+
+
+def _spectrum(x, y):
+    return SpectrumData(SpectrumArray(x, unit=AA), SpectrumArray(y, unit=Jy))
+
+
+def test_results_do_not_depend_on_workers():
+    x, y, truth = _lines(10)
+    spectra = [_spectrum(x, line) for line in y]
+    model = models.Gaussian1D(3., 40., 4.)
+
+    serial = batch_fit.batch_fit(model, spectra, workers=1, chunk_size=3)
+    parallel = batch_fit.batch_fit(model, spectra, workers=2, chunk_size=3)
+
+    assert_array_equal(serial.status, parallel.status)
+    for name in model.param_names:
+        assert_array_equal(serial.parameters[name],
+                           parallel.parameters[name])
+
+    assert (serial.status == batch_fit.OK).all()
+    assert_allclose(serial.parameters['mean'], truth[:, 1], atol=0.1)
+
+
+def test_skipped_spectra():
+    x, y, _ = _lines(3)
+    y[1] = np.nan
+    spectra = [_spectrum(x, line) for line in y]
+
+    result = batch_fit.batch_fit(models.Gaussian1D(3., 40., 4.), spectra,
+                                 workers=1)
+
+    assert_array_equal(result.status, [batch_fit.OK, batch_fit.SKIPPED,
+                                       batch_fit.OK])
+    assert np.isnan(result.parameters['amplitude'][1])
+
+
+def test_fit_cube_maps():
+    x, y, truth = _lines(12)
+    cube = CubeData(y.T.reshape(x.size, 3, 4).copy())
+    model = models.Gaussian1D(3., 40., 4.)
+
+    serial = batch_fit.fit_cube(model, cube, workers=1, band=1)
+    parallel = batch_fit.fit_cube(model, cube, workers=2, band=1)
+
+    assert_array_equal(serial.status, parallel.status)
+    for name in model.param_names:
+        assert_array_equal(serial.maps[name].data, parallel.maps[name].data)
+
+    assert serial.maps['mean'].shape == (3, 4)
+    assert_allclose(serial.maps['mean'].data.ravel(), truth[:, 1],
+                    atol=0.1)
+    assert_allclose(serial.maps['stddev'].data.ravel(), truth[:, 2],
+                    atol=0.1)
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from astropy.nddata import StdDevUncertainty
+from astropy.units import AA, Jy
+
+from specview.core import SpectrumArray, SpectrumData
+from specview.analysis.coadd import coadd, common_grid
+
+
+def _spectrum(x, y, error=None):
+    x = np.asarray(x, dtype=float)
+    y = np.broadcast_to(np.asarray(y, dtype=float), x.shape).copy()
+    uncertainty = None
+    if error is not None:
+        uncertainty = StdDevUncertainty(np.full(x.shape, float(error)))
+    return SpectrumData(SpectrumArray(x, unit=AA),
+                        SpectrumArray(y, uncertainty=uncertainty, unit=Jy))
+
+
+def test_common_grid():
+    grid = common_grid([_spectrum(np.arange(0., 10.), 0),
+                        _spectrum(np.arange(5., 20., 0.5), 0)])
+
+    assert_allclose(grid, np.arange(0., 19.75, 0.5))
+
+
+def test_inverse_variance_mean():
+    x = np.arange(10.)
+    result = coadd([_spectrum(x, 1., 1.), _spectrum(x, 4., 2.)], grid=x)
+
+    # Weights of 1 and 1/4.
+    assert_allclose(result.y.data, (1. + 4. / 4) / 1.25)
+    assert_allclose(result.y.uncertainty.array, np.sqrt(1. / 1.25))
+
+
+def test_uniform_without_uncertainties():
+    x = np.arange(10.)
+    spectra = [_spectrum(x, 1., 1.), _spectrum(x, 4.)]
+
+    with pytest.raises(ValueError):
+        coadd(spectra, grid=x, weighting='ivar')
+
+    # Uniform by default, and errors are not all known.
+    result = coadd(spectra, grid=x)
+    assert_allclose(result.y.data, 2.5)
+    assert result.y.uncertainty is None
+
+
+def test_uniform_errors():
+    x = np.arange(10.)
+    spectra = [_spectrum(x, i, 2.) for i in range(4)]
+
+    result = coadd(spectra, grid=x, weighting='uniform')
+
+    assert_allclose(result.y.data, 1.5)
+    assert_allclose(result.y.uncertainty.array, 1.)
+
+
+def test_clipped_rejects_outliers():
+    x = np.arange(10.)
+    spectra = [_spectrum(x, 1.) for _ in range(9)]
+    spectra.append(_spectrum(x, 100.))
+
+    assert_allclose(coadd(spectra, grid=x, method='clipped').y.data, 1.)
+    assert_allclose(coadd(spectra, grid=x, method='median').y.data, 1.)
+
+
+def test_uncovered_points_are_masked():
+    result = coadd([_spectrum(np.arange(5.), 1.),
+                    _spectrum(np.arange(10., 15.), 3.)],
+                   grid=np.arange(15.))
+
+    assert_allclose(result.y.data, [1.] * 5 + [3.] * 5)
+    assert result.y.mask[5:10].all()
+
+
+def test_chunks_do_not_change_the_result():
+    random = np.random.RandomState(0)
+    x = np.linspace(0., 100., 201)
+    spectra = [_spectrum(x + random.uniform(-1, 1),
+                         random.normal(size=x.size), 0.5 + i)
+               for i in range(5)]
+
+    whole = coadd(spectra, grid=x[10:-10])
+    chunked = coadd(spectra, grid=x[10:-10], chunk_size=7)
+
+    assert_allclose(chunked.y.data, whole.y.data)
+    assert_allclose(chunked.y.uncertainty.array, whole.y.uncertainty.array)
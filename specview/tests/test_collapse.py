@@ -0,0 +1,117 @@
+import warnings
+
+import numpy as np
+from numpy.testing import assert_allclose
+
+from astropy.wcs import WCS
+
+from specview.core import CubeData
+from specview.analysis.collapse import collapse
+
+NUMPY = {'average': np.nanmean, 'median': np.nanmedian, 'sum': np.nansum,
+         'min': np.nanmin, 'max': np.nanmax}
+
+
+def _wcs():
+    wcs = WCS(naxis=3)
+    wcs.wcs.ctype = ['RA---TAN', 'DEC--TAN', 'WAVE']
+    wcs.wcs.cunit = ['deg', 'deg', 'm']
+    wcs.wcs.cdelt = [-1e-3, 1e-3, 1e-10]
+    wcs.wcs.crval = [150., 30., 6.5e-7]
+    wcs.wcs.crpix = [1., 1., 1.]
+    return wcs
+
+
+def _cube(shape=(7, 9, 11)):
+    """A cube with masked values, non-finite values and an empty pixel,
+    and its values with NaN in their place."""
+    random = np.random.RandomState(0)
+    data = random.normal(size=shape)
+    mask = random.uniform(size=shape) < 0.1
+    data[random.uniform(size=shape) < 0.05] = np.inf
+    data[:, 2, 3] = np.nan
+
+    values = np.where(mask | ~np.isfinite(data), np.nan, data)
+    return CubeData(data, mask=mask, wcs=_wcs()), values
+
+
+def _expected(method, values, axis=0):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        result = NUMPY[method](values, axis=axis)
+    result[np.isnan(values).all(axis=axis)] = np.nan
+    return result
+
+
+def test_methods_match_numpy():
+    cube, values = _cube()
+
+    for method in NUMPY:
+        for axis in range(3):
+            image = collapse(cube, method, axis=axis, workers=1)
+            assert_allclose(image.data, _expected(method, values, axis),
+                            err_msg='{} along {}'.format(method, axis))
+
+    assert np.isnan(collapse(cube, 'sum').data[2, 3])
+
+
+def test_tiles_and_workers():
+    cube, values = _cube()
+
+    # Tiles of a few pixels: bands of rows and parts of rows.
+    for tile_bytes in (8 * 7 * 30, 8 * 7 * 4):
+        for workers in (1, 3):
+            for method in NUMPY:
+                image = collapse(cube, method, workers=workers,
+                                 tile_bytes=tile_bytes)
+                assert_allclose(image.data, _expected(method, values))
+
+
+def test_weights():
+    cube, values = _cube()
+    weights = np.arange(7, dtype=float)
+    weights[3] = 0
+    w = np.where(np.isnan(values), 0, weights[:, None, None])
+
+    with np.errstate(invalid='ignore'):
+        average = np.nansum(values * w, axis=0) / w.sum(axis=0)
+    assert_allclose(collapse(cube, 'average', weights=weights).data,
+                    average)
+
+    total = np.nansum(values * w, axis=0)
+    total[w.sum(axis=0) == 0] = np.nan
+    assert_allclose(collapse(cube, 'sum', weights=weights).data, total)
+
+    # Planes of weight zero are left out.
+    left_out = np.where(weights[:, None, None] > 0, values, np.nan)
+    assert_allclose(collapse(cube, 'max', weights=weights).data,
+                    _expected('max', left_out))
+
+    # Equal weights: the lower middle value.
+    median = collapse(cube, 'median', weights=np.ones(cube.shape)).data
+    ordered = np.sort(values, axis=0)
+    count = (~np.isnan(values)).sum(axis=0)
+    lower = np.take_along_axis(
+        ordered, np.clip((count - 1) // 2, 0, None)[np.newaxis], axis=0)[0]
+    lower[count == 0] = np.nan
+    assert_allclose(median, lower)
+
+
+def test_spectral_window():
+    cube, values = _cube()
+    x = cube.spectral_axis
+
+    image = collapse(cube, 'sum', x_range=(x[2], x[4]))
+
+    assert_allclose(image.data, _expected('sum', values[2:5]))
+
+
+def test_wcs():
+    cube, _ = _cube()
+
+    image = collapse(cube)
+    assert image.wcs.naxis == 2
+    assert list(image.wcs.wcs.ctype) == ['RA---TAN', 'DEC--TAN']
+
+    # A single celestial axis is not a WCS.
+    assert collapse(cube, axis=1).wcs is None
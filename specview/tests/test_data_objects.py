@@ -0,0 +1,145 @@
+import numpy as np
+from numpy.testing import assert_allclose
+
+from astropy.nddata import StdDevUncertainty
+from astropy.units import AA, nm, Jy, mJy
+
+from specview.core import SpectrumArray, SpectrumData
+from specview.analysis.resample import get_plan
+from specview.analysis.statistics import extract
+
+
+def _spectrum():
+    x = SpectrumArray(np.array([300., 400., 500., 600.]), unit=AA)
+    y = SpectrumArray(np.array([1., 2., 3., 4.]), unit=Jy)
+    return SpectrumData(x, y)
+
+
+def test_convert_parent_in_place_keeps_layers():
+    parent = _spectrum()
+    layer = parent.view(np.array([False, False, False, True]))
+    masked = parent.view(np.array([False, True, False, False]))
+
+    parent.to(x_unit=nm, in_place=True)
+
+    assert_allclose(parent.x.data, [30., 40., 50., 60.])
+    assert parent.x.unit == nm
+
+    # The layers keep their values, in their unit.
+    assert layer.x.unit == AA
+    assert_allclose(layer.x.data, [300., 400., 500.])
+    assert_allclose(masked.x.data, [300., 500., 600.])
+    assert_allclose(layer.to(x_unit=nm).x.data, [30., 40., 50.])
+
+
+def test_convert_in_place_without_views():
+    parent = _spectrum()
+    x = parent.x._data
+    plan = get_plan(x, np.array([350., 450.]))
+
+    parent.to(x_unit=nm, in_place=True)
+
+    # Written over, and dropped from the caches.
+    assert parent.x._data is x
+    assert_allclose(x, [30., 40., 50., 60.])
+    assert get_plan(x, np.array([350., 450.])) is not plan
+
+
+def _assert_converts_alone(spectrum, other):
+    """Convert `spectrum` in place, leaving `other` as it is."""
+    x, y = other.x.data.copy(), other.y.data.copy()
+    x_unit, y_unit = other.x.unit, other.y.unit
+
+    spectrum.to(x_unit=nm, y_unit=mJy, in_place=True)
+
+    assert spectrum.x.unit == nm
+    assert other.x.unit == x_unit and other.y.unit == y_unit
+    assert_allclose(other.x.data, x)
+    assert_allclose(other.y.data, y)
+
+
+def test_convert_in_place_after_to():
+    parent = _spectrum()
+
+    # The dispersion is kept as it is, the flux is converted.
+    converted = parent.to(y_unit=mJy)
+    _assert_converts_alone(converted, parent)
+
+    converted = parent.to(x_unit=nm)
+    _assert_converts_alone(parent, converted)
+
+
+def test_convert_in_place_after_arithmetic():
+    parent = _spectrum()
+
+    _assert_converts_alone(parent.add(_spectrum()), parent)
+    _assert_converts_alone(parent, parent.multiply(_spectrum()))
+
+
+def test_convert_in_place_after_resampling():
+    parent = _spectrum()
+    other = SpectrumData(SpectrumArray(np.array([250., 450., 650.]), unit=AA),
+                         SpectrumArray(np.array([1., 1., 1.]), unit=Jy))
+
+    _assert_converts_alone(parent._fit_shape(other), parent)
+
+
+def test_convert_in_place_after_extract():
+    parent = _spectrum()
+
+    _assert_converts_alone(extract(parent, (350., 550.)), parent)
+    _assert_converts_alone(parent, extract(parent, (350., 550.)))
+
+
+def test_views_are_read_only():
+    parent = _spectrum()
+    layer = parent.view()
+
+    assert not layer.y._data.flags.writeable
+    assert parent.y._data.flags.writeable
+
+    copy = layer.copy()
+    copy.y._data[0] = 10.
+    assert parent.y.data[0] == 1.
+
+
+def _with_errors(y, error=None):
+    x = SpectrumArray(np.array([300., 400., 500., 600.]), unit=AA)
+    uncertainty = None if error is None else StdDevUncertainty(
+        np.full(4, float(error)))
+    return SpectrumData(x, SpectrumArray(np.full(4, float(y)),
+                                         uncertainty=uncertainty, unit=Jy))
+
+
+def test_uncertainties_of_sums_and_products():
+    a, b = _with_errors(2., 0.3), _with_errors(4., 0.4)
+
+    assert_allclose(a.add(b, True).y.uncertainty.array, 0.5)
+    assert_allclose(a.subtract(b, True).y.uncertainty.array, 0.5)
+    # (0.3 * 4) ** 2 + (0.4 * 2) ** 2
+    assert_allclose(a.multiply(b, True).y.uncertainty.array,
+                    np.sqrt(1.44 + 0.64))
+    # (0.3 ** 2 + 0.4 ** 2 * 0.5 ** 2) / 4 ** 2
+    assert_allclose(a.divide(b, True).y.uncertainty.array,
+                    np.sqrt((0.09 + 0.04) / 16.))
+
+
+def test_uncertainties_need_both_operands():
+    a, b = _with_errors(2., 0.3), _with_errors(4.)
+
+    assert a.add(b, True).y.uncertainty is None
+    assert b.multiply(a, True).y.uncertainty is None
+    assert a.add(_with_errors(4., 0.4)).y.uncertainty is None
+
+
+def test_uncertainties_through_resampling():
+    a = _with_errors(2., 0.3)
+    b = SpectrumData(SpectrumArray(np.array([250., 350., 450., 550., 650.]),
+                                   unit=AA),
+                     SpectrumArray(np.full(5, 4.),
+                                   uncertainty=StdDevUncertainty(
+                                       np.full(5, 0.4)), unit=Jy))
+
+    # Each point halfway between two of `b`: 0.4 ** 2 / 2 for its variance.
+    assert_allclose(a.add(b, True).y.uncertainty.array,
+                    np.sqrt(0.09 + 0.08))
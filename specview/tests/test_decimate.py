@@ -0,0 +1,64 @@
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+from specview.tools.decimate import DecimationPyramid
+
+
+def test_levels_keep_peaks():
+    x = np.arange(10000.)
+    y = np.zeros(x.size)
+    y[1234] = 5.
+    y[8765] = -3.
+
+    pyramid = DecimationPyramid(x, y)
+    assert len(pyramid.levels) > 1
+
+    new_x, new_y = pyramid.select(0., 9999., 100)
+
+    assert new_x.size <= 4 * 100 + 8
+    assert new_y.max() == 5.
+    assert new_y.min() == -3.
+
+
+def test_full_resolution_when_zoomed_in():
+    x = np.arange(10000.)
+    y = np.sin(x)
+
+    new_x, new_y = DecimationPyramid(x, y).select(99.5, 110.5, 1000)
+
+    assert_array_equal(new_x, x[99:112])
+    assert_array_equal(new_y, y[99:112])
+
+
+def test_descending():
+    x = np.arange(5000.)[::-1]
+    pyramid = DecimationPyramid(x, x * 2)
+
+    assert pyramid.x_range == (0., 4999.)
+    new_x, new_y = pyramid.select(10., 20., 1000)
+    assert_allclose(new_y, new_x * 2)
+
+
+def test_not_monotonic_drawn_in_full():
+    x = np.concatenate((np.linspace(0., 50., 5000),
+                        np.linspace(10., 60., 5000)))
+    y = np.arange(x.size, dtype=float)
+
+    pyramid = DecimationPyramid(x, y)
+
+    assert not pyramid.monotonic
+    assert len(pyramid.levels) == 1
+    assert pyramid.x_range == (0., 60.)
+    new_x, new_y = pyramid.select(20., 30., 100, step=True)
+    assert_array_equal(new_x, x)
+    assert_array_equal(new_y, y)
+
+
+def test_step():
+    x = np.array([0., 1., 2., 3.])
+    y = np.array([1., 2., 3., 4.])
+
+    new_x, new_y = DecimationPyramid(x, y).select(0., 3., 100, step=True)
+
+    assert_array_equal(new_x, [0., 1., 1., 2., 2., 3., 3., 4.])
+    assert_array_equal(new_y, [1., 1., 2., 2., 3., 3., 4., 4.])
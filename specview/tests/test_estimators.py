@@ -0,0 +1,41 @@
+import numpy as np
+from numpy.testing import assert_allclose
+
+from astropy.modeling import models
+
+from specview.analysis.estimators import estimate
+from specview.analysis.model_fitting import gaussian
+
+
+def test_gaussian_width_with_noise():
+    random = np.random.RandomState(0)
+    x = np.linspace(0., 1000., 2001)
+    y = (10. * np.exp(-0.5 * ((x - 300.) / 5.) ** 2) +
+         random.normal(0., 1., x.size))
+
+    model = estimate(models.Gaussian1D(), x, y)
+
+    assert_allclose(model.mean.value, 300., atol=2.)
+    assert_allclose(model.stddev.value, 5., rtol=0.3)
+    assert_allclose(model.amplitude.value, 10., rtol=0.4)
+
+
+def test_lorentz_width():
+    x = np.linspace(-50., 50., 1001)
+    y = models.Lorentz1D(amplitude=3., x_0=4., fwhm=6.)(x)
+
+    model = estimate(models.Lorentz1D(), x, y)
+
+    assert_allclose(model.x_0.value, 4., atol=0.1)
+    assert_allclose(model.fwhm.value, 6., rtol=0.05)
+
+
+def test_gaussian_fit_starts_from_estimates():
+    x = np.linspace(0., 100., 501)
+    y = 3. * np.exp(-0.5 * ((x - 40.) / 4.) ** 2)
+
+    (amplitude, mean, stddev), _, fitted = gaussian(x, y)
+
+    assert_allclose([amplitude.value, mean.value, stddev.value],
+                    [3., 40., 4.], rtol=1e-4)
+    assert_allclose(fitted, y, atol=1e-4)
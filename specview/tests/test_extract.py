@@ -0,0 +1,105 @@
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+
+from astropy.nddata import StdDevUncertainty
+from astropy.wcs import WCS
+
+from specview.core import CubeData
+from specview.analysis import extract
+
+
+def _wcs():
+    # A linear projection, so that boxes on the sky are boxes of pixels.
+    wcs = WCS(naxis=3)
+    wcs.wcs.ctype = ['RA---CAR', 'DEC--CAR', 'WAVE']
+    wcs.wcs.cunit = ['deg', 'deg', 'm']
+    wcs.wcs.cdelt = [-1e-3, 1e-3, 1e-10]
+    wcs.wcs.crval = [150., 0., 6.5e-7]
+    wcs.wcs.crpix = [6., 5., 1.]
+    return wcs
+
+
+def _cube(shape=(4, 10, 12), **kwargs):
+    data = np.arange(np.prod(shape), dtype=float).reshape(shape)
+    return CubeData(data, wcs=_wcs(), **kwargs)
+
+
+def _pixels(aperture, shape=(10, 12)):
+    """The aperture as a mask of the whole image plane."""
+    mask = np.zeros(shape, dtype=bool)
+    mask[aperture.rows, aperture.columns] = aperture.mask
+    return mask
+
+
+def _box(rows, columns, shape=(10, 12)):
+    mask = np.zeros(shape, dtype=bool)
+    mask[rows, columns] = True
+    return mask
+
+
+def test_pixel_box():
+    cube = _cube()
+
+    aperture = extract.box_aperture(cube, (2, 3), (5, 6))
+    assert_array_equal(_pixels(aperture), _box(slice(3, 7), slice(2, 6)))
+
+    # Pixels are in when their centers are.
+    aperture = extract.box_aperture(cube, (1.6, 2.5), (4.2, 5.5))
+    assert_array_equal(_pixels(aperture), _box(slice(3, 6), slice(2, 5)))
+
+    # Clipped to the cube.
+    aperture = extract.box_aperture(cube, (-3, 8), (2, 20))
+    assert_array_equal(_pixels(aperture), _box(slice(8, 10), slice(0, 3)))
+
+
+def test_world_box_keeps_its_edges():
+    cube = _cube()
+    celestial = cube.wcs.celestial
+    lower, upper = celestial.wcs_pix2world([2, 5], [3, 6], 0)
+
+    aperture = extract.box_aperture(cube, (lower[0], upper[0]),
+                                    (lower[1], upper[1]), world=True)
+
+    assert_array_equal(_pixels(aperture), _box(slice(3, 7), slice(2, 6)))
+
+
+def test_circle_and_polygon():
+    cube = _cube()
+
+    aperture = extract.circle_aperture(cube, (5, 4), 1)
+    expected = np.zeros((10, 12), dtype=bool)
+    expected[[3, 4, 4, 4, 5], [5, 4, 5, 6, 5]] = True
+    assert_array_equal(_pixels(aperture), expected)
+
+    aperture = extract.polygon_aperture(cube, [(0, 0), (3, 0), (0, 3)])
+    y, x = np.indices((10, 12))
+    assert_array_equal(_pixels(aperture), x + y <= 3)
+
+
+def test_extract_spectrum():
+    uncertainty = StdDevUncertainty(np.full((4, 10, 12), 2.))
+    mask = np.zeros((4, 10, 12), dtype=bool)
+    mask[1, 3, 2] = True
+    cube = _cube(uncertainty=uncertainty, mask=mask)
+    data = cube.data
+    aperture = extract.box_aperture(cube, (2, 3), (3, 4))
+
+    spectrum = extract.extract_spectrum(cube, aperture, method='sum')
+    region = np.ma.masked_array(data, mask)[:, 3:5, 2:4]
+    assert_allclose(spectrum.y.data, region.sum(axis=(1, 2)))
+    assert_allclose(spectrum.y.uncertainty.array, [4., np.sqrt(12), 4., 4.])
+    assert_allclose(spectrum.x.data, cube.spectral_axis)
+
+    spectrum = extract.extract_spectrum(cube, aperture, x_range=(
+        cube.spectral_axis[1], cube.spectral_axis[2]), method='mean')
+    assert_allclose(spectrum.y.data, region.mean(axis=(1, 2))[1:3])
+    assert_allclose(spectrum.y.uncertainty.array, [np.sqrt(12) / 3, 1.])
+
+
+def test_spectral_window():
+    cube = _cube()
+    x = cube.spectral_axis
+
+    assert extract.spectral_window(cube, (x[1], x[2])) == slice(1, 3)
+    assert extract.spectral_window(cube, (x[2], x[1])) == slice(1, 3)
+    assert extract.spectral_window(cube, (0., 1e-9)) == slice(0, 0)
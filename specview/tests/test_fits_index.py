@@ -0,0 +1,36 @@
+import gzip
+import shutil
+
+import numpy as np
+from astropy.io import fits
+
+from specview.tools import fits_index
+
+
+def _write(tmpdir):
+    path = str(tmpdir.join('spectrum.fits'))
+    fits.HDUList([fits.PrimaryHDU(),
+                  fits.ImageHDU(np.zeros(10), name='SCI')]).writeto(path)
+    return path
+
+
+def test_gzip_index_matches_plain(tmpdir):
+    path = _write(tmpdir)
+    with open(path, 'rb') as plain, gzip.open(path + '.gz', 'wb') as packed:
+        shutil.copyfileobj(plain, packed)
+
+    index = fits_index.get_index(path + '.gz')
+
+    assert index == fits_index.get_index(path)
+    assert [info.name for info in index] == ['PRIMARY', 'SCI']
+    assert index[1].shape == (10,)
+
+
+def test_cache_is_bounded(tmpdir, monkeypatch):
+    monkeypatch.setattr(fits_index, 'MAX_CACHED', 2)
+    fits_index.clear_cache()
+
+    for name in ('a', 'b', 'c'):
+        fits_index.get_index(_write(tmpdir.mkdir(name)))
+
+    assert len(fits_index._cache) == 2
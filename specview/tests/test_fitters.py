@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+from astropy.modeling import models
+
+from specview.analysis.fitters import LinearFitter, TrustRegionFitter
+
+
+def test_linear_fit():
+    x = np.linspace(-1., 1., 50)
+    y = 1. - 2. * x + 0.5 * x ** 2
+
+    fitted = LinearFitter()(models.Polynomial1D(2), x, y)
+
+    assert_allclose(fitted.parameters, [1., -2., 0.5], atol=1e-12)
+
+
+def test_linear_fit_with_fixed_parameter():
+    x = np.linspace(-1., 1., 50)
+    model = models.Polynomial1D(1, c0=3.)
+    model.c0.fixed = True
+
+    fitted = LinearFitter()(model, x, 3. + 2. * x + 0.1)
+
+    assert fitted.c0.value == 3.
+    assert_allclose(fitted.c1.value, 2., rtol=1e-6)
+
+
+def test_linear_fit_refuses_bounds():
+    model = models.Polynomial1D(1)
+    model.c1.bounds = (0., None)
+
+    with pytest.raises(ValueError):
+        LinearFitter()(model, np.arange(5.), np.arange(5.))
+
+
+def test_trust_region_keeps_bounds():
+    x = np.linspace(-1., 1., 50)
+    model = models.Polynomial1D(1)
+    model.c1.bounds = (None, 1.)
+
+    fitted = TrustRegionFitter()(model, x, 2. * x)
+
+    assert fitted.c1.value <= 1.
+    assert_allclose(fitted.c1.value, 1., atol=1e-6)
@@ -0,0 +1,51 @@
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from specview.tools.intervals import IntervalSet
+
+
+def _brute_force(boxes, x, y):
+    inside = np.zeros(x.shape, dtype=bool)
+    for x1, x2, y1, y2 in boxes:
+        inside |= ((x >= min(x1, x2)) & (x <= max(x1, x2)) &
+                   (y >= min(y1, y2)) & (y <= max(y1, y2)))
+    return inside
+
+
+BOXES = [(10, 30, 0, 5), (25, 40, 3, 8), (35, 20, -2, 1), (50, 50, 0, 10),
+         (60, 70, 0, 2), (65, 75, 0, 2)]
+
+
+def test_sorted():
+    random = np.random.RandomState(0)
+    x = np.linspace(0, 100, 1001)
+    y = random.uniform(-3, 10, x.size)
+
+    assert_array_equal(IntervalSet(BOXES).contains(x, y),
+                       _brute_force(BOXES, x, y))
+
+
+def test_unsorted():
+    random = np.random.RandomState(1)
+    x = np.concatenate((np.linspace(0, 60, 500), np.linspace(20, 100, 500)))
+    y = random.uniform(-3, 10, x.size)
+
+    assert_array_equal(IntervalSet(BOXES).contains(x, y),
+                       _brute_force(BOXES, x, y))
+    assert_array_equal(IntervalSet(BOXES).contains(x[::-1], y[::-1]),
+                       _brute_force(BOXES, x[::-1], y[::-1]))
+
+
+def test_merged_intervals():
+    intervals = IntervalSet([(0, 10, 0, 1), (10, 20, 0, 1),
+                             (5, 15, 2, 3)]).intervals
+
+    assert intervals == [(0, 5, ((0, 1),)), (5, 15, ((0, 1), (2, 3))),
+                         (15, 20, ((0, 1),))]
+
+
+def test_empty():
+    x = np.arange(5.)
+
+    assert not IntervalSet([]).contains(x, x).any()
+    assert len(IntervalSet([])) == 0
@@ -0,0 +1,77 @@
+import numpy as np
+from numpy.testing import assert_allclose
+
+from astropy import units as u
+from astropy.wcs import WCS
+
+from specview.core import CubeData
+from specview.analysis.moments import moment_maps, line_map
+
+
+def _wcs(unit='m', start=6.5e-7, step=1e-10):
+    wcs = WCS(naxis=3)
+    wcs.wcs.ctype = ['RA---TAN', 'DEC--TAN', 'WAVE']
+    wcs.wcs.cunit = ['deg', 'deg', unit]
+    wcs.wcs.cdelt = [-1e-3, 1e-3, step]
+    wcs.wcs.crval = [0., 0., start]
+    wcs.wcs.crpix = [1., 1., 1.]
+    return wcs
+
+
+def _lines(n_planes=400, shape=(6, 7)):
+    """Gaussian lines of random amplitude, center and width per spaxel."""
+    random = np.random.RandomState(0)
+    x = 6.5e-7 + np.arange(n_planes) * 1e-10
+    center = 6.7e-7 + random.uniform(-20, 20, shape) * 1e-10
+    sigma = random.uniform(3, 8, shape) * 1e-10
+    amplitude = random.uniform(1, 5, shape)
+    lines = amplitude * np.exp(-0.5 * ((x[:, None, None] - center) /
+                                       sigma) ** 2)
+    return x, lines, amplitude * sigma * np.sqrt(2 * np.pi), center, sigma
+
+
+def test_spectral_unit_matches_axis():
+    cube = CubeData(np.zeros((5, 2, 2)),
+                    wcs=_wcs('Angstrom', start=5000., step=2.))
+
+    # WCSLIB works in SI units for wavelengths.
+    assert cube.spectral_unit == u.m
+    assert_allclose((cube.spectral_axis * cube.spectral_unit).to(u.AA).value,
+                    [5000., 5002., 5004., 5006., 5008.])
+
+
+def test_moments():
+    x, lines, flux, center, sigma = _lines()
+    cube = CubeData(lines, wcs=_wcs(), unit=u.Jy)
+
+    maps = moment_maps(cube, tile_bytes=20000)
+
+    assert list(maps) == ['moment0', 'moment1', 'moment2']
+    assert maps['moment0'].unit == u.Jy * u.m
+    assert maps['moment1'].unit == u.m
+    assert_allclose(maps['moment0'].data, flux, rtol=1e-6)
+    assert_allclose(maps['moment1'].data, center, rtol=1e-9)
+    assert_allclose(maps['moment2'].data, sigma, rtol=1e-4)
+
+
+def test_line_map_subtracts_continuum():
+    x, lines, flux, center, sigma = _lines()
+    continuum = 2 + 1e7 * (x - x[0])
+    cube = CubeData(lines + continuum[:, None, None], wcs=_wcs(), unit=u.Jy)
+
+    line = line_map(cube, (x[140], x[260]), [(x[0], x[100]),
+                                             (x[300], x[399])],
+                    workers=3, tile_bytes=5000)
+
+    assert_allclose(line.data, flux, rtol=1e-3)
+
+
+def test_empty_spaxels():
+    x, lines, flux, center, sigma = _lines()
+    lines[:, 3, 4] = np.nan
+
+    maps = moment_maps(CubeData(lines, wcs=_wcs()), order=1, workers=1)
+
+    assert np.isnan(maps['moment1'].data[3, 4])
+    assert np.isnan(maps['moment0'].data[3, 4])
+    assert np.isfinite(maps['moment1'].data[2, 4])
@@ -0,0 +1,78 @@
+import warnings
+
+import numpy as np
+from numpy.testing import assert_allclose
+from astropy.io import fits
+from astropy.units import Unit
+
+from specview.tools.fits_index import get_index
+from specview.tools.preprocess import (read_data, read_many, column_unit,
+                                       DEFAULT_DISPERSION_UNIT,
+                                       DEFAULT_FLUX_UNIT)
+
+
+def _write(tmpdir, n):
+    paths = []
+    for i in range(n):
+        path = str(tmpdir.join('spectrum{}.fits'.format(i)))
+        columns = [fits.Column(name='wavelength', format='D', unit='Angstrom',
+                               array=np.arange(10.)),
+                   fits.Column(name='flux', format='D', unit='Jy',
+                               array=np.arange(10.) * i)]
+        fits.HDUList([fits.PrimaryHDU(),
+                      fits.BinTableHDU.from_columns(columns)]).writeto(path)
+        paths.append(path)
+    return paths
+
+
+def _check(spectra, paths):
+    assert len(spectra) == len(paths)
+    for i, spectrum in enumerate(spectra):
+        # Read into memory, with no file left open.
+        assert spectrum.source is None
+        assert not isinstance(spectrum.y._data, np.memmap)
+        assert_allclose(spectrum.y.data, np.arange(10.) * i)
+
+
+def test_read_many_in_process(tmpdir):
+    paths = _write(tmpdir, 5)
+    _check(list(read_many(paths, workers=1)), paths)
+
+
+def test_read_many_in_pool(tmpdir):
+    paths = _write(tmpdir, 5)
+    _check(list(read_many(paths, workers=2, chunksize=2)), paths)
+
+
+def test_read_many_skips_bad_files(tmpdir):
+    paths = _write(tmpdir, 2)
+    bad = str(tmpdir.join('bad.fits'))
+    with open(bad, 'w') as f:
+        f.write('not FITS')
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        spectra = list(read_many([paths[0], bad, paths[1]], workers=2))
+
+    assert spectra[1] is None
+    assert spectra[0] is not None and spectra[2] is not None
+    assert any(bad in str(w.message) for w in caught)
+
+
+def test_unusable_column_units(tmpdir):
+    path = str(tmpdir.join('units.fits'))
+    columns = [fits.Column(name='WAVELENGTH', format='D', unit='NOT_A_UNIT',
+                           array=np.arange(10.)),
+               fits.Column(name='FLUX', format='D', unit=' ',
+                           array=np.ones(10))]
+    fits.HDUList([fits.PrimaryHDU(),
+                  fits.BinTableHDU.from_columns(columns)]).writeto(path)
+
+    spectrum = read_data(path, eager=True)
+    assert spectrum.x.unit == Unit(DEFAULT_DISPERSION_UNIT)
+    assert spectrum.y.unit == Unit(DEFAULT_FLUX_UNIT)
+
+    info = get_index(path)[1]
+    assert column_unit(info.columns, info.units, 'flux', ' ') == ' '
+    assert column_unit(info.columns, info.units, 'wavelength', ' ') == ' '
+    assert column_unit(info.columns, info.units, 'other', 'Jy') == 'Jy'
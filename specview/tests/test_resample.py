@@ -0,0 +1,67 @@
+import numpy as np
+from numpy.testing import assert_allclose
+
+from astropy.units import AA, Jy
+
+from specview.core import SpectrumArray
+from specview.analysis.resample import get_plan, resample
+
+
+def test_plans_are_reused():
+    source = np.linspace(0., 10., 11)
+    target = np.linspace(0.5, 9.5, 10)
+
+    plan = get_plan(source, target)
+
+    assert get_plan(source, target) is plan
+    assert get_plan(source, target, 'flux') is not plan
+    assert get_plan(source.copy(), target) is not plan
+
+
+def test_plans_follow_in_place_changes():
+    source = np.linspace(0., 10., 11)
+    target = np.linspace(0.5, 9.5, 10)
+    x = SpectrumArray(source, unit=AA)
+
+    plan = get_plan(source, target)
+    source *= 2
+    x.invalidate_cache()
+
+    assert get_plan(source, target) is not plan
+    assert_allclose(resample(source, source, target), target)
+
+
+def test_linear_and_nearest():
+    x = np.array([0., 1., 2., 3.])
+    y = np.array([0., 10., 20., 30.])
+
+    assert_allclose(resample(x, y, [0.25, 2.5, 5.], fill=-1),
+                    [2.5, 25., -1])
+    assert_allclose(resample(x, y, [0.25, 2.6], 'nearest'), [0., 30.])
+
+
+def test_descending_grids():
+    x = np.array([3., 2., 1., 0.])
+    y = np.array([30., 20., 10., 0.])
+
+    assert_allclose(resample(x, y, [2.5, 0.5]), [25., 5.])
+
+
+def test_flux_conserved():
+    x = np.linspace(0., 99., 100)
+    y = np.random.RandomState(0).uniform(size=x.size)
+    new_x = np.arange(1., 98., 3.)
+
+    new_y = resample(x, y, new_x, 'flux')
+
+    # Each target bin averages three whole source bins.
+    assert_allclose(new_y, y[:99].reshape(-1, 3).mean(axis=1))
+
+
+def test_variance_and_mask():
+    source = np.array([0., 1., 2., 3.])
+    plan = get_plan(source, np.array([0.5, 2.]))
+
+    assert_allclose(plan.propagate_variance(np.ones(4)), [0.5, 1.])
+    assert_allclose(plan.propagate_mask(np.array([1, 0, 0, 0], bool)),
+                    [True, False])
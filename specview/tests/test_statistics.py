@@ -0,0 +1,78 @@
+import numpy as np
+from numpy.testing import assert_allclose
+
+from astropy.units import AA, Jy
+
+from specview.core import SpectrumArray, SpectrumData
+from specview.analysis import statistics
+from specview.analysis.statistics import stats
+
+
+def _spectrum(x, y):
+    return SpectrumData(SpectrumArray(np.asarray(x, dtype=float), unit=AA),
+                        SpectrumArray(np.asarray(y, dtype=float), unit=Jy))
+
+
+def test_prefix_sums_follow_in_place_changes():
+    spectrum = _spectrum(np.arange(10), np.arange(10))
+    assert_allclose(stats(spectrum, (2, 6))['mean'], 3.5)
+
+    spectrum.y._data *= 2
+    spectrum.y.invalidate_cache()
+
+    assert_allclose(stats(spectrum, (2, 6))['mean'], 7.)
+
+
+def test_prefix_cache_is_bounded():
+    spectra = [_spectrum(np.arange(10), np.arange(10) * i)
+               for i in range(statistics.MAX_PREFIX_SUMS + 5)]
+
+    for i, spectrum in enumerate(spectra):
+        assert_allclose(stats(spectrum)['mean'], 4.5 * i)
+
+    assert len(statistics._prefix_cache) <= statistics.MAX_PREFIX_SUMS
+
+
+def test_overlapping_orders():
+    x = np.concatenate((np.linspace(0, 50, 10), np.linspace(10, 60, 10)))
+    spectrum = _spectrum(x, np.arange(x.size))
+
+    assert not statistics.increasing(x)
+
+    inside = (x >= 12) & (x < 30)
+    result = stats(spectrum, (12, 30))
+    assert result['npoints'] == 6
+    assert_allclose(result['mean'], np.arange(x.size)[inside].mean())
+    assert_allclose(statistics.extract(spectrum, (12, 30)).x.data,
+                    x[inside])
+
+
+def test_region_stats_match_the_regions():
+    random = np.random.RandomState(0)
+    x = np.linspace(1000., 2000., 501)
+    y = random.normal(5., 2., x.size)
+    spectrum = _spectrum(x, y)
+    x_ranges = [(1000., 1100.), (1234.5, 1789.), (1500., 1500.),
+                (1990., 3000.)]
+
+    for x_range, result in zip(x_ranges,
+                               statistics.region_stats(spectrum, x_ranges)):
+        region = y[(x >= x_range[0]) & (x < x_range[1])]
+        assert result['npoints'] == region.size
+        if not region.size:
+            continue
+        assert_allclose(result['mean'], region.mean())
+        assert_allclose(result['median'], np.median(region))
+        assert_allclose(result['stddev'], region.std())
+        assert_allclose(result['total'],
+                        (region[1:] + region[:-1]).sum() / 2.)
+
+
+def test_increasing_follows_in_place_changes():
+    x = SpectrumArray(np.arange(5.), unit=AA)
+    assert statistics.increasing(x.data)
+
+    x._data[0] = 10.
+    x.invalidate_cache()
+
+    assert not statistics.increasing(x.data)
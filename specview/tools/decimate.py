@@ -0,0 +1,138 @@
+"""Level-of-detail decimation of curves for plotting
+
+A `DecimationPyramid` is built once per curve. Each level groups the
+points of the level below in bins and keeps their minimum and maximum, so
+that peaks survive decimation. When drawing, the coarsest level that
+still has about one bin per pixel over the visible range is selected,
+which bounds the number of points drawn by the screen width rather than
+by the size of the data.
+
+Bins need sorted abscissae: curves that are not monotonic, e.g. of
+overlapping spectral orders, are drawn in full instead.
+"""
+import numpy as np
+
+from specview.analysis.statistics import increasing
+
+
+class DecimationPyramid(object):
+    """Min/max decimation pyramid of a curve.
+
+    Parameters
+    ----------
+    x: ndarray
+        Abscissae, monotonic for the curve to be decimated.
+    y: ndarray
+        Ordinates.
+    factor: int
+        Number of bins of a level merged into a bin of the next one.
+    min_size: int
+        Levels are added until they have fewer bins than this.
+
+    Attributes
+    ----------
+    monotonic: bool
+        Whether the curve is monotonic, hence decimated.
+    """
+    def __init__(self, x, y, factor=4, min_size=512):
+        x = np.asarray(x)
+        y = np.asarray(y)
+
+        if x.size > 1 and x[0] > x[-1]:
+            x, y = x[::-1], y[::-1]
+
+        self.factor = factor
+        self.monotonic = increasing(x)
+        # Each level is (bin start, bin minimum, bin maximum).
+        self.levels = [(x, y, y)]
+
+        while self.monotonic and self.levels[-1][0].size > min_size:
+            self.levels.append(self._reduce(*self.levels[-1]))
+
+    @property
+    def x_range(self):
+        x = self.levels[0][0]
+        if not x.size:
+            return (0, 0)
+        if not self.monotonic:
+            return (np.nanmin(x), np.nanmax(x))
+        return (x[0], x[-1])
+
+    def _reduce(self, x, low, high):
+        factor = self.factor
+        full = x.size // factor * factor
+
+        new_x = x[:full:factor]
+        new_low = np.fmin.reduce(low[:full].reshape(-1, factor), axis=1)
+        new_high = np.fmax.reduce(high[:full].reshape(-1, factor), axis=1)
+
+        if full < x.size:
+            new_x = np.append(new_x, x[full])
+            new_low = np.append(new_low, np.fmin.reduce(low[full:]))
+            new_high = np.append(new_high, np.fmax.reduce(high[full:]))
+
+        return new_x, new_low, new_high
+
+    def select(self, x_min, x_max, pixels, step=False):
+        """Return the points to draw for a view.
+
+        Parameters
+        ----------
+        x_min, x_max: float
+            Visible range.
+        pixels: int
+            Width of the view, in pixels.
+        step: bool
+            Draw the full resolution level as a histogram.
+
+        Returns
+        -------
+        x, y: ndarray
+            Points to draw as a connected line. Decimated levels alternate
+            the minimum and maximum of each bin. All the points, as given,
+            if the curve is not monotonic.
+        """
+        base = self.levels[0][0]
+        if not self.monotonic:
+            return base, self.levels[0][1]
+
+        start, stop = self._bounds(base, x_min, x_max)
+
+        level = 0
+        count = stop - start
+        while (level + 1 < len(self.levels) and
+               count > 2 * max(pixels, 1)):
+            level += 1
+            count //= self.factor
+
+        x, low, high = self.levels[level]
+        if level > 0:
+            start, stop = self._bounds(x, x_min, x_max)
+            x = np.repeat(x[start:stop], 2)
+            y = np.column_stack((low[start:stop],
+                                 high[start:stop])).ravel()
+            return x, y
+
+        x, y = x[start:stop], low[start:stop]
+        if not step or x.size == 0:
+            return x, y
+
+        # Bins extend to the next point; the last one as wide as the one
+        # before it.
+        if stop < base.size:
+            end = base[stop]
+        elif base.size > 1:
+            end = 2 * base[-1] - base[-2]
+        else:
+            end = base[-1]
+        edges = np.append(x, end)
+
+        return np.repeat(edges, 2)[1:-1], np.repeat(y, 2)
+
+    @staticmethod
+    def _bounds(x, x_min, x_max):
+        """Index range covering [x_min, x_max], plus a point either side
+        so the curve runs off the edges of the view."""
+        start = max(np.searchsorted(x, x_min, side='right') - 1, 0)
+        stop = min(np.searchsorted(x, x_max, side='left') + 1, x.size)
+        return start, stop
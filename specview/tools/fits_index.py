@@ -0,0 +1,218 @@
+"""Header-only index of FITS files
+
+Building the index reads nothing but the header blocks of each HDU; the
+data blocks are skipped using the sizes given in the headers. Compressed
+files (gzip, bzip2, zip), which cannot be scanned that way, are indexed
+from the headers `astropy.io.fits` reads. Indices are cached per path and
+modification time, so that the file dialog, the readers and the
+controller can all share a single scan of a file.
+"""
+import os
+import re
+from collections import namedtuple, OrderedDict
+
+from astropy.io import fits
+
+BLOCK_SIZE = 2880
+CARD_SIZE = 80
+
+TABLE_KINDS = ('table', 'bintable')
+
+_END_CARD = b'END' + b' ' * 5
+_WCS_KEYWORD = re.compile(r'^(WCSAXES|CTYPE\d+|CUNIT\d+|CRVAL\d+|CRPIX\d+|'
+                          r'CDELT\d+|CROTA\d+|CD\d+_\d+|PC\d+_\d+|RESTFRQ|'
+                          r'RESTWAV|SPECSYS|EQUINOX|RADESYS)$')
+
+# Leading bytes of the compressed files astropy reads.
+_COMPRESSED = (b'\x1f\x8b', b'BZh', b'PK\x03\x04')
+
+# Indices most recently used, keyed by absolute path; the least recently
+# used are dropped first.
+MAX_CACHED = 64
+_cache = OrderedDict()
+
+
+class HDUInfo(namedtuple('HDUInfo', ['index', 'name', 'kind', 'shape',
+                                     'columns', 'units', 'wcs'])):
+    """Summary of a single HDU.
+
+    Attributes
+    ----------
+    index: int
+        Position of the HDU in the file.
+    name: str
+        Extension name, 'PRIMARY' for the primary HDU.
+    kind: str
+        One of 'image', 'table' or 'bintable'.
+    shape: tuple
+        Shape of the data in numpy order; number of rows for tables.
+    columns: list
+        Column names, empty for images.
+    units: list
+        Column units, `None` where a column has no unit.
+    wcs: dict
+        WCS keywords found in the header.
+    """
+    __slots__ = ()
+
+    @property
+    def is_table(self):
+        return self.kind in TABLE_KINDS
+
+    @property
+    def has_data(self):
+        return len(self.shape) > 0 and all(self.shape)
+
+    def column(self, name):
+        """Return the column name matching `name`, ignoring case.
+
+        Raises
+        ------
+        KeyError
+            If there is no such column.
+        """
+        for column in self.columns:
+            if column.lower() == name.lower():
+                return column
+        raise KeyError('Extension {} has no column "{}".'.format(self.index,
+                                                                 name))
+
+    def unit(self, column):
+        """Return the unit of `column`, or `None` if it has none."""
+        return self.units[self.columns.index(self.column(column))]
+
+
+def get_index(file_name):
+    """Return the header index of a FITS file.
+
+    Parameters
+    ----------
+    file_name: str
+        Path to the FITS file.
+
+    Returns
+    -------
+    [HDUInfo,]
+        One entry per HDU, in file order.
+    """
+    file_name = os.path.abspath(str(file_name))
+    stat = os.stat(file_name)
+    key = (stat.st_mtime, stat.st_size)
+
+    cached = _cache.pop(file_name, None)
+    if cached is not None and cached[0] == key:
+        _cache[file_name] = cached
+        return cached[1]
+
+    with open(file_name, 'rb') as fileobj:
+        compressed = fileobj.read(4).startswith(_COMPRESSED)
+        fileobj.seek(0)
+        index = [] if compressed else list(_scan(fileobj))
+
+    if not index:
+        # Compressed, or not laid out as plain FITS blocks; let astropy
+        # make sense of it.
+        index = _open_index(file_name)
+
+    _cache[file_name] = (key, index)
+    while len(_cache) > MAX_CACHED:
+        _cache.popitem(last=False)
+
+    return index
+
+
+def clear_cache():
+    """Forget all indices built so far."""
+    _cache.clear()
+
+
+def _scan(fileobj):
+    """Yield `HDUInfo` for each HDU, skipping over the data blocks."""
+    idx = 0
+    while True:
+        header = _read_header(fileobj, primary=idx == 0)
+        if header is None:
+            return
+
+        yield _hdu_info(idx, header)
+
+        fileobj.seek(_data_size(header), os.SEEK_CUR)
+        idx += 1
+
+
+def _open_index(file_name):
+    """Index of the headers of a file opened with `fits.open`."""
+    with fits.open(file_name) as hdulist:
+        return [_hdu_info(idx, hdu.header)
+                for idx, hdu in enumerate(hdulist)]
+
+
+def _read_header(fileobj, primary=False):
+    """Read header blocks up to and including the END card.
+
+    Returns `None` at the end of the file, or when what follows is not
+    another extension (e.g. trailing padding).
+    """
+    blocks = []
+    while True:
+        block = fileobj.read(BLOCK_SIZE)
+        if len(block) < BLOCK_SIZE:
+            if blocks:
+                raise IOError('Truncated header in {}.'.format(fileobj.name))
+            return None
+
+        if not blocks:
+            keyword = b'SIMPLE' if primary else b'XTENSION'
+            if not block.startswith(keyword):
+                return None
+
+        blocks.append(block)
+
+        for pos in range(0, BLOCK_SIZE, CARD_SIZE):
+            if block[pos:pos + len(_END_CARD)] == _END_CARD:
+                return fits.Header.fromstring(b''.join(blocks).decode('ascii'))
+
+
+def _data_size(header):
+    """Size on disk, padding included, of the data following `header`."""
+    naxis = header.get('NAXIS', 0)
+    if naxis == 0:
+        return 0
+
+    dims = [header['NAXIS{}'.format(i)] for i in range(1, naxis + 1)]
+    # Random groups flag themselves with a zero length first axis.
+    if header.get('GROUPS', False) and dims[0] == 0:
+        dims = dims[1:]
+
+    size = 1
+    for dim in dims:
+        size *= dim
+
+    size = (abs(header['BITPIX']) // 8 * header.get('GCOUNT', 1) *
+            (header.get('PCOUNT', 0) + size))
+
+    return -(-size // BLOCK_SIZE) * BLOCK_SIZE
+
+
+def _hdu_info(idx, header):
+    xtension = header.get('XTENSION', 'IMAGE').strip().upper()
+    kind = {'TABLE': 'table', 'BINTABLE': 'bintable'}.get(xtension, 'image')
+
+    name = header.get('EXTNAME', 'PRIMARY' if idx == 0 else '')
+    naxis = header.get('NAXIS', 0)
+
+    columns = []
+    units = []
+    if kind in TABLE_KINDS:
+        shape = (header.get('NAXIS2', 0),)
+        for i in range(1, header.get('TFIELDS', 0) + 1):
+            columns.append(header.get('TTYPE{}'.format(i), ''))
+            units.append(header.get('TUNIT{}'.format(i)))
+    else:
+        shape = tuple(header['NAXIS{}'.format(i)]
+                      for i in range(naxis, 0, -1))
+
+    wcs = dict((key, header[key]) for key in header.keys()
+               if _WCS_KEYWORD.match(key))
+
+    return HDUInfo(idx, name, kind, shape, columns, units, wcs)
@@ -0,0 +1,118 @@
+"""Unions of rectangular regions over sorted data
+
+Rectangular regions of interest on a spectrum plot select the points with
+`x1 <= x <= x2` and `y1 <= y <= y2`. An `IntervalSet` turns any number of
+them into sorted, non-overlapping x-intervals, each with the merged
+y-intervals that apply over it. On a sorted dispersion the points of each
+x-interval are then found with `np.searchsorted`, and only those are
+tested against y, instead of testing every point against every region.
+"""
+import numpy as np
+
+from specview.analysis.statistics import increasing
+
+
+class IntervalSet(object):
+    """Union of rectangular regions.
+
+    Parameters
+    ----------
+    boxes: [(x1, x2, y1, y2),]
+        The regions, bounds included. Bounds may come in either order.
+
+    Attributes
+    ----------
+    intervals: [(x1, x2, ((y1, y2),)),]
+        Sorted x-intervals, bounds included, with the sorted and merged
+        y-intervals selected over each. Consecutive intervals may share
+        a bound.
+    """
+    def __init__(self, boxes):
+        boxes = [(min(x1, x2), max(x1, x2), min(y1, y2), max(y1, y2))
+                 for x1, x2, y1, y2 in boxes]
+        self.intervals = _intervals(boxes)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def contains(self, x, y):
+        """Return a boolean array, True for the points within the regions.
+
+        Parameters
+        ----------
+        x: ndarray
+            Dispersion, best in increasing order (see
+            `statistics.increasing`); other orders, e.g. overlapping
+            spectral orders, fall back to testing every point.
+        y: ndarray
+            Values, of the shape of `x`.
+        """
+        x = np.asarray(x)
+        y = np.asarray(y)
+        inside = np.zeros(x.shape, dtype=bool)
+
+        if not self.intervals:
+            return inside
+
+        if not increasing(x):
+            for x1, x2, y_ranges in self.intervals:
+                inside |= (x >= x1) & (x <= x2) & _within(y, y_ranges)
+            return inside
+
+        starts = np.searchsorted(x, [i[0] for i in self.intervals], 'left')
+        stops = np.searchsorted(x, [i[1] for i in self.intervals], 'right')
+
+        for start, stop, (_, _, y_ranges) in zip(starts, stops,
+                                                  self.intervals):
+            if stop > start:
+                inside[start:stop] |= _within(y[start:stop], y_ranges)
+
+        return inside
+
+
+def _within(y, y_ranges):
+    selected = (y >= y_ranges[0][0]) & (y <= y_ranges[0][1])
+    for y1, y2 in y_ranges[1:]:
+        selected |= (y >= y1) & (y <= y2)
+    return selected
+
+
+def _merge(ranges):
+    """Sorted union of closed ranges."""
+    merged = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return tuple(merged)
+
+
+def _intervals(boxes):
+    """Split the x-axis at every box bound, and merge consecutive pieces
+    selecting the same y-intervals."""
+    if not boxes:
+        return []
+
+    edges = sorted(set(x for box in boxes for x in box[:2]))
+
+    intervals = []
+    for left, right in zip(edges[:-1], edges[1:]):
+        covering = [box[2:] for box in boxes
+                    if box[0] <= left and box[1] >= right]
+        if not covering:
+            continue
+
+        y_ranges = _merge(covering)
+        last = intervals[-1] if intervals else None
+        if last is not None and last[1] == left and last[2] == y_ranges:
+            intervals[-1] = (last[0], right, y_ranges)
+        else:
+            intervals.append((left, right, y_ranges))
+
+    # Boxes of no width cover no piece, only the points on their bound.
+    for x1, x2, y1, y2 in boxes:
+        if x1 == x2:
+            intervals.append((x1, x2, ((y1, y2),)))
+
+    return sorted(intervals)
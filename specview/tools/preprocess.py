@@ -1,21 +1,32 @@
 import warnings
+from functools import partial
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+from astropy.units import Unit
 from astropy.wcs import WCS
 from astropy.io import fits
 from astropy.io.fits.hdu.image import _ImageBaseHDU as FITS_image
 from astropy.io.fits.hdu.table import _TableLikeHDU as FITS_table
 from specview.core import SpectrumData
+from specview.tools.fits_index import get_index
 
 DEFAULT_FLUX_UNIT = 'count'
 DEFAULT_DISPERSION_UNIT = 'pixel'
 
 
-def read_image(image, flux_unit=None, dispersion_unit=None, **kwargs):
+def read_image(image, flux_unit=None, dispersion_unit=None, copy=True,
+               **kwargs):
     """Read 1D image
 
     Parameters
     ----------
     image: FITS Image HDU
 
+    copy: bool
+          If False, keep a reference to the (possibly memory-mapped) image
+          data instead of copying it into memory.
+
     Returns
     -------
     SpectrumData
@@ -25,15 +36,18 @@ def read_image(image, flux_unit=None, dispersion_unit=None, **kwargs):
     Assumes ONLY 1D and that the WCS has the dispersion
     definition. If not, its just pixels.
     """
-    if len(image.data.shape) > 1:
+    # Check the shape from the header, so that nothing gets paged in
+    # for images we are going to reject anyway.
+    if len(image.shape) > 1:
         raise RuntimeError('Attempting to read an image with more than one '
                            'dimension.')
     wcs = WCS(image.header)
     spectrum = SpectrumData()
     unit = flux_unit if flux_unit else DEFAULT_FLUX_UNIT
-    spectrum.set_y(image.data, unit=unit)
+    data = np.array(image.data) if copy else image.data
+    spectrum.set_y(data, unit=unit)
     unit = wcs.wcs.cunit[0] if not dispersion_unit else dispersion_unit
-    spectrum.set_x(wcs.all_pix2world(range(image.data.shape[0]), 1)[0],
+    spectrum.set_x(wcs.all_pix2world(np.arange(image.shape[0]), 1)[0],
                    unit=unit)
 
     return spectrum
@@ -41,7 +55,7 @@ def read_image(image, flux_unit=None, dispersion_unit=None, **kwargs):
 
 def read_table(table,
                flux='flux', dispersion='wavelength',
-               flux_unit=None, dispersion_unit=None):
+               flux_unit=None, dispersion_unit=None, copy=True):
     """Read FITS table
 
     Parameters
@@ -60,33 +74,34 @@ def read_table(table,
     flux_unit: str
                Unit of flux
 
+    copy: bool
+          If False, keep references to the (possibly memory-mapped)
+          columns instead of copying them into memory.
+
     Returns
     -------
     SpectrumData
     '"""
+    names = table.names
+    units = [column.unit for column in table.columns]
     if dispersion_unit is None:
-        try:
-            dispersion_unit = table.columns[table.names.index(dispersion.upper())].unit
-            if dispersion_unit is None:
-                raise ValueError
-        except ValueError:
-            dispersion_unit = DEFAULT_DISPERSION_UNIT
+        dispersion_unit = column_unit(names, units, dispersion,
+                                      DEFAULT_DISPERSION_UNIT)
     if flux_unit is None:
-        try:
-            flux_unit = table.columns[table.names.index(flux.upper())].unit
-            if flux_unit is None:
-                raise ValueError
-        except ValueError:
-            flux_unit = DEFAULT_FLUX_UNIT
+        flux_unit = column_unit(names, units, flux, DEFAULT_FLUX_UNIT)
+
+    x_data, y_data = table[dispersion], table[flux]
+    if copy:
+        x_data, y_data = np.array(x_data), np.array(y_data)
 
     spectrum = SpectrumData()
-    spectrum.set_x(table[dispersion], unit=dispersion_unit)
-    spectrum.set_y(table[flux], unit=flux_unit)
+    spectrum.set_x(x_data, unit=dispersion_unit)
+    spectrum.set_y(y_data, unit=flux_unit)
 
     return spectrum
 
 
-def read_data(file_name, ext=None, **kwargs):
+def read_data(file_name, ext=None, eager=False, **kwargs):
     """Simple function to read in a file and retrieve extensions that
     contain data.
 
@@ -98,26 +113,177 @@ def read_data(file_name, ext=None, **kwargs):
     ext: int
         Extension to read. If none, the first one with data will be used.
 
+    eager: bool
+        If True, copy the data into memory and close the file right away.
+        Otherwise the file is memory-mapped, the returned `SpectrumData`
+        only references the mapped column or image, and data is paged in
+        when it is actually used. The file then stays open for as long
+        as the `SpectrumData` is alive, or until its `close` is called.
+
     kwargs: dict
         Keyword arguments to pass to helper routines.
     """
     if ".fits" in file_name:
-        name = file_name.split("/")[-1].split(".")[-1]
-        hdulist = fits.open(str(file_name))
-
-        exts = [ext] if ext is not None else range(len(hdulist))
-        for idx in exts:
-            if isinstance(hdulist[idx], FITS_table):
-                try:
-                    data = read_table(hdulist[idx].data, **kwargs)
-                    return data
-                except Exception as e:
-                    warnings.warn('File {}[{}]: {}'.format(file_name, idx, e.args[0]))
-            elif isinstance(hdulist[idx], FITS_image):
-                try:
-                    data = read_image(hdulist[idx], **kwargs)
-                    return data
-                except Exception as e:
-                    warnings.warn('File {}[{}]: {}'.format(file_name, idx, e.args[0]))
-
-        raise RuntimeError('File {} does not contain any supported 1D format.'.format(file_name))
+        index = get_index(file_name)
+        exts = [ext] if ext is not None else [info.index for info in index
+                                              if info.has_data]
+
+        hdulist = fits.open(str(file_name), memmap=not eager)
+
+        try:
+            spectrum = _read_hdulist(hdulist, index, file_name, exts,
+                                     copy=eager, **kwargs)
+        except Exception:
+            hdulist.close()
+            raise
+
+        if eager:
+            hdulist.close()
+        else:
+            spectrum.source = hdulist
+
+        return spectrum
+
+
+def _read_hdulist(hdulist, index, file_name, exts, **kwargs):
+    """Read the first supported 1D spectrum out of an open HDUList.
+
+    Only the HDUs listed in `exts` are touched; `index` is the header
+    index of the file, used to fill in column units.
+    """
+    for idx in exts:
+        if isinstance(hdulist[idx], FITS_table):
+            try:
+                units = _column_units(index[idx], **kwargs)
+                data = read_table(hdulist[idx].data, **dict(kwargs, **units))
+                return data
+            except Exception as e:
+                warnings.warn('File {}[{}]: {}'.format(file_name, idx, e.args[0]))
+        elif isinstance(hdulist[idx], FITS_image):
+            try:
+                data = read_image(hdulist[idx], **kwargs)
+                return data
+            except Exception as e:
+                warnings.warn('File {}[{}]: {}'.format(file_name, idx, e.args[0]))
+
+    raise RuntimeError('File {} does not contain any supported 1D format.'.format(file_name))
+
+
+def column_unit(names, units, column, default):
+    """Return the unit of a table column, as given by its TUNIT keyword.
+
+    Parameters
+    ----------
+    names: [str,]
+        Names of the columns of the table.
+
+    units: [str,]
+        Their units, `None` for none.
+
+    column: str
+        Name of the column, in any case.
+
+    default: str
+        Returned when the column is not found, has a blank unit, or one
+        that astropy cannot parse.
+    """
+    for name, unit in zip(names, units):
+        if name.lower() != column.lower():
+            continue
+
+        if unit is None or not unit.strip():
+            return default
+
+        try:
+            Unit(unit)
+        except ValueError:
+            return default
+
+        return unit
+
+    return default
+
+
+def _column_units(info, flux='flux', dispersion='wavelength',
+                  flux_unit=None, dispersion_unit=None, **kwargs):
+    """Fill in the column units not given explicitly from the header index."""
+    if flux_unit is None:
+        flux_unit = column_unit(info.columns, info.units, flux,
+                                DEFAULT_FLUX_UNIT)
+    if dispersion_unit is None:
+        dispersion_unit = column_unit(info.columns, info.units, dispersion,
+                                      DEFAULT_DISPERSION_UNIT)
+
+    return {'flux_unit': flux_unit, 'dispersion_unit': dispersion_unit}
+
+
+def read_many(paths, workers=None, chunksize=8, **kwargs):
+    """Read many files, decoding them in a pool of processes.
+
+    Parameters
+    ----------
+    paths: [str,]
+        File names of the FITS data objects.
+
+    workers: int
+        Number of processes to use. Defaults to the number of CPUs. With
+        a single worker, files are read in this process.
+
+    chunksize: int
+        Number of files handed to a process at a time.
+
+    kwargs: dict
+        Keyword arguments to pass to `read_data`. Files are read eagerly,
+        each closed once read, so that reading many files does not keep
+        them all open; `eager=False` memory-maps them instead, with a
+        single worker only.
+
+    Returns
+    -------
+    generator
+        Yields a `SpectrumData` per path, in the order of `paths`, as soon
+        as it is available. Files that cannot be read yield `None` and
+        issue a warning.
+    """
+    if workers is None:
+        workers = cpu_count()
+
+    kwargs.setdefault('eager', True)
+
+    if workers <= 1:
+        for file_name in paths:
+            spectrum, message = _read_one(file_name, **kwargs)
+            if message is not None:
+                warnings.warn(message)
+            yield spectrum
+        return
+
+    # Data is copied into the worker's memory anyway when it gets sent
+    # back, so there is no point in memory-mapping the files there.
+    kwargs['eager'] = True
+
+    # Leaving the block early, e.g. when the generator is closed,
+    # terminates the workers.
+    with Pool(workers) as pool:
+        for spectrum, message in pool.imap(partial(_read_one, **kwargs),
+                                           paths, chunksize):
+            if message is not None:
+                warnings.warn(message)
+            yield spectrum
+
+        pool.close()
+        pool.join()
+
+
+def _read_one(file_name, **kwargs):
+    """Read a file, returning the error instead of raising it, so that
+    one bad file does not bring down a whole pool."""
+    try:
+        spectrum = read_data(file_name, **kwargs)
+    except Exception as e:
+        return None, 'File {}: {}'.format(file_name, e)
+
+    if spectrum is None:
+        return None, 'File {}: not a FITS file.'.format(file_name)
+
+    return spectrum, None
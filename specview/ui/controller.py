@@ -1,19 +1,29 @@
+from itertools import islice, repeat
+
 import numpy as np
 
 from astropy.modeling import core
 
 from specview.core.log import log
+from specview.external.qt import QtCore
 from specview.ui.viewer import MainWindow
 from specview.ui.model import SpectrumDataTreeModel
 from specview.ui.qt.tree_items import LayerDataTreeItem, ParameterDataTreeItem, ModelDataTreeItem
 from specview.ui.qt.subwindows import SpectraMdiSubWindow
+from specview.ui.fit_service import FitService
 from specview.analysis.model_fitting import get_fitter
 from specview.core.data_objects import SpectrumData
-from specview.tools.preprocess import read_data
+from specview.tools.preprocess import read_data, read_many, column_unit
+from specview.tools.fits_index import get_index
 from specview.ui.qt.dialogs import FileEditDialog
 from specview.tools.plugins import plugins
-from specview.analysis.statistics import stats, extract
+from specview.analysis.statistics import stats, region_stats, extract
 from specview.analysis.model_fitting import all_models
+from specview.analysis.batch_fit import batch_fit, fit_cube
+from specview.analysis.extract import (box_aperture, circle_aperture,
+                                       polygon_aperture, extract_cube,
+                                       extract_spectrum)
+from specview.analysis.moments import moment_maps, line_map
 
 
 class Controller(object):
@@ -24,6 +34,13 @@ class Controller(object):
         self._viewer.data_dock.wgt_data_tree.setModel(self._model)
         self._viewer.model_editor_dock.wgt_model_tree.setModel(self._model)
 
+        # Data items holding the fitted model of each layer, so that
+        # refits update the existing plots.
+        self._model_plots = {}
+
+        # Fits run in the background, one after the other.
+        self.fit_service = FitService()
+
         self.__connect_trees()
         self.__connect_menu_bar()
         self.__connect_data_dock()
@@ -44,6 +61,17 @@ class Controller(object):
         # demo, it's good enough
         self._main_name_space = {'np': np,
                                  'add_data_set': self.add_data_set,
+                                 'add_data_sets': self.add_data_sets,
+                                 'open_files': self.open_files,
+                                 'batch_fit': batch_fit,
+                                 'fit_cube': fit_cube,
+                                 'box_aperture': box_aperture,
+                                 'circle_aperture': circle_aperture,
+                                 'polygon_aperture': polygon_aperture,
+                                 'extract_cube': extract_cube,
+                                 'extract_spectrum': extract_spectrum,
+                                 'moment_maps': moment_maps,
+                                 'line_map': line_map,
                                  'dc': self.dc,
                                  'fc': self.fc,
                                  'log': self.log}
@@ -71,12 +99,26 @@ class Controller(object):
         self.viewer.model_editor_dock.btn_perform_fit.clicked.connect(
             self._perform_fit)
 
+        self.viewer.model_editor_dock.btn_cancel_fit.clicked.connect(
+            lambda: self.fit_service.cancel())
+
+        self.fit_service.sig_progress.connect(self._fit_progress)
+        self.fit_service.sig_finished.connect(self._fit_finished)
+        self.fit_service.sig_failed.connect(self._fit_failed)
+        self.fit_service.sig_cancelled.connect(self._fit_cancelled)
+
+        app = QtCore.QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.fit_service.stop)
+
         self.viewer.model_editor_dock.btn_replot_model.clicked.connect(
             self._replot_model)
 
         self.viewer.model_editor_dock.wgt_model_tree.sig_updated.connect(
             self._replot_model)
 
+        self.model.sig_removed_item.connect(self._forget_model_plots)
+
     def __connect_trees(self):
         self.viewer.data_dock.wgt_data_tree.sig_current_changed.connect(
             self.viewer.model_editor_dock.wgt_model_tree.set_root_index)
@@ -97,7 +139,7 @@ class Controller(object):
 
     def __connect_console(self):
         self.model.itemChanged.connect(self._update_namespace)
-        self.model.sig_added_item.connect(self._update_namespace)
+        self.model.sig_added_items.connect(self._update_namespace)
         self.model.sig_removed_item.connect(self._update_namespace)
 
         self.viewer.console_dock.wgt_console.kernel_client = self._kernel['client']
@@ -159,12 +201,59 @@ class Controller(object):
 
         x, y = layer_data_item.item.x.data, layer_data_item.item.y.data
 
-        fit_model = fitter(init_model, x, y)
-        new_y = fit_model(x)
+        # The result comes back through `_fit_finished`.
+        self.fit_service.submit(fitter, init_model, x, y,
+                                context=layer_data_item,
+                                state=self._fit_state(layer_data_item))
+        self._update_fit_status("Fit of {} queued.".format(
+            layer_data_item.text()))
+
+    @staticmethod
+    def _fit_state(layer_data_item):
+        """What a fit of a layer depends on: its data and its models, in
+        order, which the parameters of the result are applied to."""
+        return (layer_data_item.item,) + tuple(layer_data_item._models)
+
+    def _fit_progress(self, job, evaluations):
+        self._update_fit_status("Fitting {}: {} evaluations.".format(
+            job.context.text(), evaluations))
+
+    def _fit_finished(self, job):
+        layer_data_item = job.context
+        self._update_fit_status("Fit of {} done: {} evaluations in "
+                                "{:.2f}s, {} derivatives.".format(
+                                    layer_data_item.text(), job.evaluations,
+                                    job.elapsed,
+                                    "analytic" if job.analytic
+                                    else "numerical"))
+
+        # The layer may have been removed while fitting, or its models or
+        # data changed, in which case the result no longer matches them.
+        if (layer_data_item.parent not in self.model.items or
+                layer_data_item not in layer_data_item.parent.layers):
+            return
+
+        if not job.applies_to(self._fit_state(layer_data_item)):
+            self._update_fit_status("Fit of {} dropped: the layer changed "
+                                    "while fitting.".format(
+                                        layer_data_item.text()))
+            return
+
+        self._update_parameter_values(job.result, layer_data_item)
+        self._update_model_plot(layer_data_item, job.result(job.x))
 
-        self._update_parameter_values(fit_model, layer_data_item)
+    def _fit_failed(self, job):
+        self._update_fit_status("Fit of {} failed: {}".format(
+            job.context.text(), job.error))
 
-        self._update_model_plot(layer_data_item, new_y)
+    def _fit_cancelled(self, job):
+        self._update_fit_status("Fit of {} cancelled.".format(
+            job.context.text()))
+
+    def _update_fit_status(self, message):
+        self.viewer.model_editor_dock.btn_cancel_fit.setEnabled(
+            self.fit_service.busy)
+        self.viewer.statusBar().showMessage(message)
 
     def _replot_model(self):
         # only replot when a parameter value got changed by the user.
@@ -195,15 +284,42 @@ class Controller(object):
                 parameter_data_item.setText(str(value))
 
     def _update_model_plot(self, layer_data_item, new_y):
-        fit_spec_data = SpectrumData(x=layer_data_item.item.x)
+        fit_item = self._model_plots.get(layer_data_item)
+
+        # Refits replace the values of the earlier fit and redraw it in
+        # place, as long as its data item was not removed.
+        if fit_item is not None and fit_item in self.model.items:
+            fit_item.item.set_y(new_y, wcs=layer_data_item.item.y.wcs,
+                                unit=layer_data_item.item.y.unit)
+
+            for fit_layer in fit_item.layers:
+                fit_layer.update_data()
+
+                for sub_window in self.viewer.mdiarea.subWindowList():
+                    sub_window.graph.refresh_item(fit_layer)
+            return
+
+        # The layer views its parent; the fit gets its own copy of the
+        # dispersion, only the values of the layer, like `new_y`.
+        layer_x = layer_data_item.item.x
+        fit_spec_data = SpectrumData()
+        fit_spec_data.set_x(np.array(layer_x.data), unit=layer_x.unit)
         fit_spec_data.set_y(new_y, wcs=layer_data_item.item.y.wcs,
                             unit=layer_data_item.item.y.unit)
         spec_data_item = self.add_data_set(fit_spec_data,
                                            name="Model Fit ({}: {})".format(
                                                layer_data_item.parent.text(),
                                                layer_data_item.text()))
+        self._model_plots[layer_data_item] = spec_data_item
         self.display_graph(spec_data_item)
 
+    def _forget_model_plots(self, item):
+        """Drop the fit plots of a removed layer or data item, and the
+        removed fit plots themselves."""
+        for layer, fit_item in list(self._model_plots.items()):
+            if item in (layer, layer.parent, fit_item):
+                del self._model_plots[layer]
+
     def _open_file_dialog(self):
         fname = self.viewer.file_dialog.getOpenFileName(self.viewer,
                                                         'Open file')
@@ -227,6 +343,48 @@ class Controller(object):
         """
         return self.model.create_data_item(nddata, name)
 
+    def add_data_sets(self, nddata_list, names=None, chunk=64):
+        """Add many datasets to the list, `chunk` at a time.
+
+        Each chunk is inserted as one batched update, and shown before the
+        next one is taken from `nddata_list`, so that datasets appear as
+        they are read rather than once all of them are.
+
+        Parameters
+        ----------
+        nddata_list: [SpectrumData,]
+            The data to add. May be any iterable, such as the generator
+            returned by `read_many`; `None` entries are skipped.
+
+        names: [str,]
+            Names of the datasets, matching `nddata_list`.
+
+        chunk: int
+            Number of datasets inserted per update.
+
+        Returns
+        -------
+        [SpectrumDataTreeItem,]
+            The items created.
+        """
+        if names is None:
+            names = repeat("Data")
+
+        pairs = ((nddata, name) for nddata, name in zip(nddata_list, names)
+                 if nddata is not None)
+
+        items = []
+        while True:
+            batch = list(islice(pairs, chunk))
+            if not batch:
+                break
+
+            items.extend(self.model.create_data_items(
+                [p[0] for p in batch], [p[1] for p in batch]))
+            QtCore.QCoreApplication.processEvents()
+
+        return items
+
     def create_display(self, spectrum_data):
         """Create a plot display with the given data.
 
@@ -291,8 +449,7 @@ class Controller(object):
         active_item = sub_window.graph.active_item
         active_data = active_item.item
 
-        region = extract(active_data, x_range)
-        stat = stats(region)
+        stat = stats(active_data, x_range)
 
         self.viewer.measurement_dock.set_labels(stat,
                                          data_name=active_item.parent.text(),
@@ -304,18 +461,16 @@ class Controller(object):
         active_data = active_item.item
 
         # Get ROI stats
-        stat_list = []
         x_rois = []
         for roi in sub_window.graph.rois[-2:]:
             if roi is None:
                 continue
 
             x_range, y_range = sub_window.graph._get_roi_coords(roi)
-
-            region = extract(active_data, x_range)
-            stat_list.append(stats(region))
             x_rois.append(x_range)
 
+        stat_list = region_stats(active_data, x_rois)
+
         # Determine feature bounds
         if x_rois[0][1] < x_rois[1][0]:
             feature_roi = (x_rois[0][1], x_rois[1][0])
@@ -351,6 +506,22 @@ class Controller(object):
         name = path.split('/')[-1].split('.')[-2]
         self.add_data_set(spec_data, name)
 
+    def open_files(self, paths, workers=None):
+        """Open many fully-read files without any dialog.
+
+        Parameters
+        ----------
+        paths: [str,]
+            Files to open; the first extension with data is used.
+
+        workers: int
+            Number of processes decoding the files.
+        """
+        paths = list(paths)
+        names = [path.split('/')[-1].split('.')[-2] for path in paths]
+
+        return self.add_data_sets(read_many(paths, workers=workers), names)
+
     def _open_with_dialog(self, path):
         dialog = FileEditDialog(path)
         dialog.exec_()
@@ -378,13 +549,21 @@ class Controller(object):
         clean_path = tokens[0]
         elements = tokens[1].split(',')
         ext = int(elements[0])
-        dispersion = elements[1]
-        flux = elements[2][:-1]
 
+        # Resolve the column names against the header index, which
+        # read_data reuses instead of parsing the file again.
+        info = get_index(clean_path)[ext]
+        dispersion = info.column(elements[1])
+        flux = info.column(elements[2][:-1])
+
+        # Columns without a usable unit are dimensionless.
         spec_data = read_data(clean_path, ext=ext, flux=flux,
                               dispersion=dispersion,
-                              flux_unit=" ",
-                              dispersion_unit=" ")
+                              flux_unit=column_unit(info.columns, info.units,
+                                                    flux, " "),
+                              dispersion_unit=column_unit(info.columns,
+                                                          info.units,
+                                                          dispersion, " "))
         return spec_data
 
     # -- slot functions
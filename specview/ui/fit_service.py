@@ -0,0 +1,267 @@
+"""Background fitting
+
+Fits are queued on a `FitService`, a thread that runs them one after the
+other so that the GUI stays responsive. The service reports on each fit
+with Qt signals, which are delivered on the GUI thread, and fits can be
+cancelled whether they are still queued or already running.
+"""
+import time
+from collections import deque
+
+from ..external.qt import QtCore
+
+
+class FitCancelled(Exception):
+    """Raised inside a running fit to stop it."""
+
+
+class FitJob(object):
+    """A fit submitted to the `FitService`.
+
+    Attributes
+    ----------
+    model: Model
+        Copy of the initial model, taken when the fit was submitted.
+    context: object
+        Whatever the submitter needs to handle the result, e.g. the layer
+        the data comes from.
+    state: tuple
+        What the fit was computed from, e.g. the models and the data of
+        the layer, for the submitter to check that the result still
+        applies once the fit is done (see `applies_to`).
+    result: Model
+        The fitted model, once the fit finished.
+    error: Exception
+        What made the fit fail, if it did.
+    evaluations: int
+        Number of model evaluations so far.
+    analytic: bool
+        Whether the model has analytic derivatives; otherwise the fitter
+        estimates them, at the cost of extra evaluations.
+    elapsed: float
+        Duration of the fit, in seconds.
+    """
+    def __init__(self, fitter, model, x, y, context=None, state=(),
+                 **kwargs):
+        self.fitter = fitter
+        self.model = model.copy()
+        self.x = x
+        self.y = y
+        self.context = context
+        self.state = tuple(state)
+        self.kwargs = kwargs
+
+        self.result = None
+        self.error = None
+        self.evaluations = 0
+        self.analytic = self.model.fit_deriv is not None
+        self.elapsed = 0.
+        self.cancelled = False
+
+    def applies_to(self, state):
+        """Whether `state` holds the very objects of `self.state`, i.e.
+        nothing the fit depends on was replaced, added or removed since it
+        was submitted."""
+        state = tuple(state)
+        return (len(state) == len(self.state) and
+                all(a is b for a, b in zip(state, self.state)))
+
+    def run(self, progress=None, interval=50):
+        """Run the fit in the calling thread.
+
+        Parameters
+        ----------
+        progress: callable
+            Called with the number of evaluations every `interval`
+            evaluations.
+
+        Raises
+        ------
+        FitCancelled
+            If `cancelled` gets set while fitting.
+        """
+        objective = getattr(self.fitter, 'objective_function', None)
+        if objective is None:
+            # Direct solvers, nothing to count or cancel.
+            start = time.time()
+            self.result = self.fitter(self.model, self.x, self.y,
+                                      **self.kwargs)
+            self.elapsed = time.time() - start
+            return self.result
+
+        def counted(*args, **kwargs):
+            if self.cancelled:
+                raise FitCancelled()
+
+            self.evaluations += 1
+            if progress is not None and self.evaluations % interval == 0:
+                progress(self.evaluations)
+
+            return objective(*args, **kwargs)
+
+        # The fitters call their objective through the instance.
+        self.fitter.objective_function = counted
+        start = time.time()
+        try:
+            self.result = self.fitter(self.model, self.x, self.y,
+                                      **self.kwargs)
+        finally:
+            self.elapsed = time.time() - start
+            self.fitter.objective_function = objective
+
+        return self.result
+
+
+class FitService(QtCore.QThread):
+    """Thread running queued fits in order.
+
+    Signals
+    -------
+    sig_started: FitJob
+        A fit started.
+    sig_progress: FitJob, int
+        Number of model evaluations of a running fit so far.
+    sig_finished: FitJob
+        A fit succeeded; the fitted model is in `job.result`.
+    sig_failed: FitJob
+        A fit raised; the exception is in `job.error`.
+    sig_cancelled: FitJob
+        A fit was cancelled, before or while running.
+    """
+    # TODO: get rid of nasty try/excepts
+    try:
+        sig_started = QtCore.pyqtSignal(object)
+        sig_progress = QtCore.pyqtSignal(object, int)
+        sig_finished = QtCore.pyqtSignal(object)
+        sig_failed = QtCore.pyqtSignal(object)
+        sig_cancelled = QtCore.pyqtSignal(object)
+    except AttributeError:
+        sig_started = QtCore.Signal(object)
+        sig_progress = QtCore.Signal(object, int)
+        sig_finished = QtCore.Signal(object)
+        sig_failed = QtCore.Signal(object)
+        sig_cancelled = QtCore.Signal(object)
+
+    def __init__(self, parent=None, interval=50):
+        super(FitService, self).__init__(parent)
+        self.interval = interval
+
+        self._jobs = deque()
+        self._current = None
+        self._stopping = False
+        self._mutex = QtCore.QMutex()
+        self._wake = QtCore.QWaitCondition()
+
+    @property
+    def pending(self):
+        """Fits waiting to run."""
+        self._mutex.lock()
+        try:
+            return list(self._jobs)
+        finally:
+            self._mutex.unlock()
+
+    @property
+    def busy(self):
+        """Whether a fit is running or waiting to."""
+        return self._current is not None or len(self._jobs) > 0
+
+    def submit(self, fitter, model, x, y, context=None, state=(), **kwargs):
+        """Queue a fit, starting the thread if needed.
+
+        Parameters
+        ----------
+        fitter: Fitter
+            Fitter instance, used by this fit only.
+        model: Model
+            The initial model. It is copied, so it can be edited while
+            fitting.
+        x, y: ndarray
+            The data to fit.
+        context: object
+            Handed back with the job in the signals.
+        state: iterable
+            Objects the fit depends on, see `FitJob.state`.
+
+        Returns
+        -------
+        FitJob
+        """
+        job = FitJob(fitter, model, x, y, context, state, **kwargs)
+
+        self._mutex.lock()
+        try:
+            self._jobs.append(job)
+            self._wake.wakeOne()
+        finally:
+            self._mutex.unlock()
+
+        if not self.isRunning():
+            self._stopping = False
+            self.start()
+
+        return job
+
+    def cancel(self, job=None):
+        """Cancel a fit, or all fits when `job` is `None`.
+
+        Queued fits are dropped; the running one stops at its next model
+        evaluation.
+        """
+        self._mutex.lock()
+        try:
+            jobs = list(self._jobs) if job is None else [job]
+            for queued in jobs:
+                if queued in self._jobs:
+                    self._jobs.remove(queued)
+                    queued.cancelled = True
+                    self.sig_cancelled.emit(queued)
+
+            current = self._current
+            if current is not None and (job is None or job is current):
+                current.cancelled = True
+        finally:
+            self._mutex.unlock()
+
+    def stop(self):
+        """Cancel all fits and wait for the thread to finish."""
+        self.cancel()
+
+        self._mutex.lock()
+        try:
+            self._stopping = True
+            self._wake.wakeOne()
+        finally:
+            self._mutex.unlock()
+
+        self.wait()
+
+    def run(self):
+        while True:
+            self._mutex.lock()
+            try:
+                while not self._jobs and not self._stopping:
+                    self._wake.wait(self._mutex)
+
+                if self._stopping:
+                    return
+
+                job = self._current = self._jobs.popleft()
+            finally:
+                self._mutex.unlock()
+
+            self.sig_started.emit(job)
+
+            try:
+                job.run(lambda count: self.sig_progress.emit(job, count),
+                        self.interval)
+            except FitCancelled:
+                signal = self.sig_cancelled
+            except Exception as e:
+                job.error = e
+                signal = self.sig_failed
+            else:
+                signal = self.sig_finished
+
+            self._current = None
+            signal.emit(job)
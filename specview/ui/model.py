@@ -1,32 +1,53 @@
 from os import path, sys
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from fnmatch import fnmatchcase
+from contextlib import contextmanager
+from itertools import repeat
 
 import numpy as np
 
 from ..external.qt import QtGui, QtCore
 
-from specview.analysis import model_fitting
+from specview.analysis import model_fitting, estimators
 from specview.ui.qt.tree_items import (SpectrumDataTreeItem, ModelDataTreeItem,
                                        LayerDataTreeItem, ParameterDataTreeItem,
                                        float_check)
 
 PATH = path.join(path.dirname(sys.modules[__name__].__file__), "qt", "img")
 
+# Icons are loaded once and shared, instead of once per item.
+_icons = {}
+
+
+def _icon(name):
+    if name not in _icons:
+        _icons[name] = QtGui.QIcon(path.join(PATH, name))
+
+    return _icons[name]
+
 
 class SpectrumDataTreeModel(QtGui.QStandardItemModel):
     """Custom TreeView model for displaying DataSetItems."""
     # TODO: get rid of nasty try/excepts
     try:
         sig_added_item = QtCore.pyqtSignal(QtCore.QModelIndex)
+        sig_added_items = QtCore.pyqtSignal(list)
         sig_added_fit_model = QtCore.pyqtSignal(ModelDataTreeItem)
         sig_removed_item = QtCore.pyqtSignal(object)
     except AttributeError:
         sig_added_item = QtCore.Signal(QtCore.QModelIndex)
+        sig_added_items = QtCore.Signal(list)
         sig_added_fit_model = QtCore.Signal(ModelDataTreeItem)
         sig_removed_item = QtCore.Signal(object)
 
     def __init__(self):
         super(SpectrumDataTreeModel, self).__init__()
         self._items = []
+        # Batched update state, see `begin_update`.
+        self._update_depth = 0
+        self._pending_rows = OrderedDict()
+        self._pending_items = []
         self.itemChanged.connect(self._item_changed)
         self.dc = self.DataCollection(self)
         self.fc = self.FitCollection(self)
@@ -50,7 +71,65 @@ class SpectrumDataTreeModel(QtGui.QStandardItemModel):
         if hasattr(item, 'update_value') and hasattr(item, "_name"):
             item.update_value(item._name, item.data())
 
+        # The item may have been renamed.
+        self.dc._rename(item)
+        self.fc._rename(item)
+
+    def _append_row(self, parent, item):
+        """Append `item` under `parent`, deferring it while batching."""
+        if self._update_depth > 0:
+            self._pending_rows.setdefault(parent, []).append(item)
+        else:
+            parent.appendRow(item)
+
+    def _added(self, item):
+        """Announce `item`, deferring it while batching."""
+        if self._update_depth > 0:
+            self._pending_items.append(item)
+        else:
+            self.sig_added_item.emit(item.index())
+            self.sig_added_items.emit([item])
+
     # --- public functions
+    def begin_update(self):
+        """Start a batch of insertions.
+
+        Until the matching `end_update`, rows are collected instead of
+        inserted, and no `sig_added_item` is emitted. Calls may be nested.
+        """
+        self._update_depth += 1
+
+    def end_update(self):
+        """Finish a batch of insertions.
+
+        The collected rows are appended with one call per parent, and the
+        additions are announced once: `sig_added_item` for the last item
+        and `sig_added_items` for all of them.
+        """
+        self._update_depth -= 1
+
+        if self._update_depth > 0:
+            return
+
+        rows, self._pending_rows = self._pending_rows, OrderedDict()
+        items, self._pending_items = self._pending_items, []
+
+        for parent, children in rows.items():
+            parent.appendRows(children)
+
+        if items:
+            self.sig_added_item.emit(items[-1].index())
+            self.sig_added_items.emit(items)
+
+    @contextmanager
+    def batch_update(self):
+        """Context manager wrapping `begin_update` and `end_update`."""
+        self.begin_update()
+        try:
+            yield self
+        finally:
+            self.end_update()
+
     def remove_data_item(self, index, parent_index):
         item = index.model().itemFromIndex(index)
         self.removeRow(index.row(), parent_index)
@@ -58,43 +137,63 @@ class SpectrumDataTreeModel(QtGui.QStandardItemModel):
         if item in self._items:
             self._items.remove(item)
 
+            for layer_item in item.layers:
+                self.dc._remove(layer_item)
+                self.fc._remove(layer_item)
+
         # if it's a layer
-        for sdt_item in self._items:
-            if item in sdt_item.layers:
-                sdt_item.layers.remove(item)
+        if isinstance(item, LayerDataTreeItem):
+            item.parent.remove_layer(item)
+
+        # if it's a model, the compound model of its layer changes
+        if isinstance(item, ModelDataTreeItem):
+            item.parent.remove_model(item._model)
+            # Fits are indexed by layer, for as long as it has models.
+            if not item.parent._models:
+                self.fc._remove(item.parent)
+
+        self.dc._remove(item)
+        self.fc._remove(item)
 
         self.sig_removed_item.emit(item)
 
     def create_data_item(self, nddata, name="New"):
         spec_data_item = SpectrumDataTreeItem(nddata, name)
-        spec_data_item.setIcon(QtGui.QIcon(path.join(PATH, 'data_set.png')))
+        spec_data_item.setIcon(_icon('data_set.png'))
 
         self._items.append(spec_data_item)
-        self.appendRow(spec_data_item)
-        self.sig_added_item.emit(spec_data_item.index())
+        self.dc._add(spec_data_item)
+        self._append_row(self.invisibleRootItem(), spec_data_item)
+        self._added(spec_data_item)
 
         return spec_data_item
 
+    def create_data_items(self, nddata_list, names=None):
+        """Create data items in bulk, as a single batched update."""
+        names = repeat("New") if names is None else names
+
+        with self.batch_update():
+            return [self.create_data_item(nddata, name)
+                    for nddata, name in zip(nddata_list, names)]
+
     def create_layer(self, parent, mask=None, rois=None):
         if not isinstance(parent, SpectrumDataTreeItem):
             return
 
-        if mask is not None and np.all([x for x in mask]):
+        if mask is not None and np.all(mask):
             return
 
-        if mask is None:
-            spec_data = parent.item
-            mask = np.zeros(spec_data.x.shape, dtype=bool)
-
+        # Count layers rather than rows, rows may still be pending.
         layer_data_item = LayerDataTreeItem(parent, mask, rois,
                                             "Layer {}".format(
-                                                parent.rowCount()+1))
-        layer_data_item.setIcon(QtGui.QIcon(path.join(PATH, 'layer.png')))
+                                                len(parent.layers)+1))
+        layer_data_item.setIcon(_icon('layer.png'))
 
         parent.add_layer(layer_data_item)
-        parent.appendRow(layer_data_item)
+        self.dc._add(layer_data_item)
+        self._append_row(parent, layer_data_item)
 
-        self.sig_added_item.emit(layer_data_item.index())
+        self._added(layer_data_item)
 
         return layer_data_item
 
@@ -108,12 +207,20 @@ class SpectrumDataTreeModel(QtGui.QStandardItemModel):
             print("Current model is not implemented.")
             return
 
+        # Start from estimates on what the models of the layer do not
+        # account for yet.
+        x, y = parent.item.x.data, parent.item.y.data
+        if parent._models:
+            y = y - parent.model(x)
+        estimators.estimate(model, x, y)
+
         parent.add_model(model)
+        self.fc._add(parent)
         model_data_item = ModelDataTreeItem(parent, model, model_name)
-        model_data_item.setIcon(QtGui.QIcon(path.join(PATH, 'model.png')))
+        model_data_item.setIcon(_icon('model.png'))
 
-        parent.appendRow(model_data_item)
-        self.sig_added_item.emit(model_data_item.index())
+        self._append_row(parent, model_data_item)
+        self._added(model_data_item)
         self.sig_added_fit_model.emit(model_data_item)
 
     # --- overridden functions
@@ -163,22 +270,100 @@ class SpectrumDataTreeModel(QtGui.QStandardItemModel):
     # Subclasses to expose Data, Fits, and any other deeply
     # embedded information
     class Collections(object):
-        """Provide direct access to embedded information."""
+        """Provide direct access to embedded information.
+
+        Tree items are indexed by name, so that key lookups do not walk
+        the tree. The model keeps the index current as items are added,
+        removed and renamed.
+        """
         def __init__(self, model):
             self._model = model
+            self._index = {}
+            self._names = {}
+            # Sorted distinct names, for prefix queries.
+            self._sorted = []
+            self._count = 0
 
         # --- Make iterable, over both data and layers.
         def __iter__(self):
             raise NotImplementedError('__iter__ must be implemented in a subclass.')
 
         def __len__(self):
-            return sum(1 for _ in self)
+            return self._count
+
+        def __contains__(self, key):
+            return key in self._index
 
         def __getitem__(self, key):
-            for (existing_key, value) in self:
-                if key == existing_key:
-                    return value
-            raise KeyError('Key "{}" does not exist.'.format(key))
+            try:
+                return self._value(self._index[key][0])
+            except KeyError:
+                raise KeyError('Key "{}" does not exist.'.format(key))
+
+        def startswith(self, prefix):
+            """Return the (name, value) pairs whose name starts with
+            `prefix`."""
+            return [(name, self._value(item))
+                    for name in self._prefixed(prefix)
+                    for item in self._index[name]]
+
+        def glob(self, pattern):
+            """Return the (name, value) pairs whose name matches the
+            shell-style wildcard `pattern`."""
+            # Only names sharing the literal head of the pattern can match.
+            prefix = pattern
+            for i, char in enumerate(pattern):
+                if char in '*?[':
+                    prefix = pattern[:i]
+                    break
+
+            return [(name, self._value(item))
+                    for name in self._prefixed(prefix)
+                    if fnmatchcase(name, pattern)
+                    for item in self._index[name]]
+
+        def _prefixed(self, prefix):
+            names = []
+            for name in self._sorted[bisect_left(self._sorted, prefix):]:
+                if not name.startswith(prefix):
+                    break
+                names.append(name)
+            return names
+
+        def _value(self, item):
+            """What the collection exposes for a tree item."""
+            return item.item
+
+        # --- Index maintenance, called by the model.
+        def _add(self, item):
+            if item in self._names:
+                return
+
+            name = clean_special(item.text())
+            self._names[item] = name
+            if name not in self._index:
+                self._index[name] = []
+                insort(self._sorted, name)
+            self._index[name].append(item)
+            self._count += 1
+
+        def _remove(self, item):
+            name = self._names.pop(item, None)
+            if name is None:
+                return
+
+            items = self._index[name]
+            items.remove(item)
+            if not items:
+                del self._index[name]
+                del self._sorted[bisect_left(self._sorted, name)]
+            self._count -= 1
+
+        def _rename(self, item):
+            name = self._names.get(item)
+            if name is not None and name != clean_special(item.text()):
+                self._remove(item)
+                self._add(item)
 
     class DataCollection(Collections):
         """Provide direct access to all the data in the tree."""
@@ -198,6 +383,9 @@ class SpectrumDataTreeModel(QtGui.QStandardItemModel):
                         yield(clean_special(layer_item.text()),
                               models)
 
+        def _value(self, item):
+            return item._models
+
 
 def clean_special(text):
     """Remove special characters."""
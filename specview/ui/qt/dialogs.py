@@ -1,6 +1,6 @@
 from ...external.qt import QtGui, QtCore
-from astropy.io import fits
-from astropy.io.fits.hdu.table import _TableLikeHDU as FITS_table
+
+from specview.tools.fits_index import get_index
 
 
 class FileEditDialog(QtGui.QDialog):
@@ -12,11 +12,12 @@ class FileEditDialog(QtGui.QDialog):
         self.flux_unit = None
         self.dispersion_unit = None
 
+        # Only the headers are needed to fill in the selectors.
         # TODO: get rid of nasty try/excepts
         try:
-            self.hdulist = fits.open(str(file_path))
-        except IOError:
-            self.hdulist = fits.open(str(file_path[0]))
+            self.index = get_index(file_path)
+        except (IOError, OSError):
+            self.index = get_index(file_path[0])
 
         self.vb_layout_main = QtGui.QVBoxLayout()
         self.setLayout(self.vb_layout_main)
@@ -29,8 +30,8 @@ class FileEditDialog(QtGui.QDialog):
 
         # Extension selector
         self.ext_selector = QtGui.QComboBox()
-        self.ext_selector.addItems(["[{}] {}".format(i, self.hdulist[i].name)
-                                    for i in range(len(self.hdulist))])
+        self.ext_selector.addItems(["[{}] {}".format(info.index, info.name)
+                                    for info in self.index])
         self.ext_selector.currentIndexChanged.connect(self._set_selectors)
 
         # Manual input lines
@@ -43,7 +44,7 @@ class FileEditDialog(QtGui.QDialog):
 
         # Label detailing how many extensions were found
         hdu_count = QtGui.QLabel("Detected {} extensions in this FITS "
-                                 "file.".format(len(self.hdulist)))
+                                 "file.".format(len(self.index)))
 
         # Form layout
         self.form_layout = QtGui.QFormLayout()
@@ -76,12 +77,7 @@ class FileEditDialog(QtGui.QDialog):
         self.flux_col_selector.clear()
         self.disp_col_selector.clear()
 
-        data = self.hdulist[index].data
-
-        if data is not None:
-            col_names = data.names
-        else:
-            col_names = ""
+        col_names = self.index[index].columns
 
         self.flux_col_selector.addItems(col_names)
         self.disp_col_selector.addItems(col_names)
@@ -89,11 +85,11 @@ class FileEditDialog(QtGui.QDialog):
     def _on_accept(self):
         self.ext = int(self.ext_selector.currentIndex())
 
-        if isinstance(self.hdulist[self.ext], FITS_table):
+        if self.index[self.ext].is_table:
             flux_ind = self.flux_col_selector.currentIndex()
             disp_ind = self.disp_col_selector.currentIndex()
-            self.flux = self.hdulist[self.ext].data.names[flux_ind]
-            self.dispersion = self.hdulist[self.ext].data.names[disp_ind]
+            self.flux = self.index[self.ext].columns[flux_ind]
+            self.dispersion = self.index[self.ext].columns[disp_ind]
 
         self.flux_unit = str(self.man_flux_unit.text())
         self.disp_unit = str(self.man_disp_unit.text())
@@ -217,6 +217,10 @@ class ModelDockWidget(BaseDockWidget):
 
         # Create button for performing fit
         self.btn_perform_fit = QtGui.QPushButton("&Fit Model")
+
+        # Create button for cancelling the running and queued fits
+        self.btn_cancel_fit = QtGui.QPushButton("&Cancel Fit")
+        self.btn_cancel_fit.setEnabled(False)
         #
         # TODO for testing only. Must be replaced by appropriate signal/slot
         #
@@ -229,6 +233,7 @@ class ModelDockWidget(BaseDockWidget):
         self.add_widget(self.wgt_fit_selector)
 
         self.add_widget(self.btn_perform_fit)
+        self.add_widget(self.btn_cancel_fit)
 
         # TODO removing button from GUI. This is also provisional, until we
         # figure out a way to update plots without creating layers each time.
@@ -1,10 +1,14 @@
+import weakref
 from itertools import cycle, tee
 
 from ...external.qt import QtGui, QtCore
 import pyqtgraph as pg
 import numpy as np
 
+from specview.core import SpectrumArray
 from specview.ui.qt.tree_items import SpectrumDataTreeItem, LayerDataTreeItem
+from specview.tools.decimate import DecimationPyramid
+from specview.tools.intervals import IntervalSet
 
 
 class BaseGraph(QtGui.QWidget):
@@ -29,6 +33,11 @@ class BaseGraph(QtGui.QWidget):
         self._rois = []
         self._active_roi = None
         self._units = None
+        # Bumped whenever an ROI is added, moved or removed, to invalidate
+        # the interval set and the mask cached from it.
+        self._roi_version = 0
+        self._roi_intervals = None
+        self._roi_mask_cache = None
 
     @property
     def active_roi(self):
@@ -46,6 +55,9 @@ class BaseGraph(QtGui.QWidget):
     def _set_active_roi(self):
         self._active_roi = self.sender()
 
+    def _rois_changed(self, *args):
+        self._roi_version += 1
+
     def dragEnterEvent(self, e):
         e.accept()
 
@@ -59,48 +71,78 @@ class BaseGraph(QtGui.QWidget):
         def remove():
             self.view_box.removeItem(roi)
             self._rois.remove(roi)
+            self._rois_changed()
 
         roi = pg.RectROI([x_pos, y_pos], [x_len * 0.5, y_len * 0.5],
                          sideScalers=True, removable=True)
         self._rois.append(roi)
         self.view_box.addItem(roi)
+        self._rois_changed()
 
         # Connect the remove functionality
         roi.sigRemoveRequested.connect(remove)
+        roi.sigRegionChanged.connect(self._rois_changed)
         roi.sigRegionChangeFinished.connect(self._set_active_roi)
 
         # Let everyone know, ROI is ready for use.
         roi.sigRegionChangeFinished.emit(self)
 
 
+    @staticmethod
+    def _roi_box(roi):
+        x1, y1, x2, y2 = roi.parentBounds().getCoords()
+        return x1, x2, y1, y2
+
+    @property
+    def roi_intervals(self):
+        """The ROIs as an `IntervalSet`, rebuilt only when they change."""
+        if (self._roi_intervals is None or
+                self._roi_intervals[0] != self._roi_version):
+            self._roi_intervals = (
+                self._roi_version,
+                IntervalSet([self._roi_box(roi) for roi in self._rois]))
+
+        return self._roi_intervals[1]
+
     def get_roi_mask(self, x_data, y_data):
-        mask_holder = []
+        """Mask of the points outside all ROIs.
 
-        for roi in self._rois:
-            roi_shape = roi.parentBounds()
-            x1, y1, x2, y2 = roi_shape.getCoords()
+        The mask is cached for the last data and ROI set; it is read-only
+        and shared, so copy it before modifying it.
+        """
+        cache = self._roi_mask_cache
+        if (cache is not None and cache[0] == self._roi_version and
+                cache[1] is x_data and cache[2] is y_data):
+            return cache[3]
 
-            mask_holder.append((x_data >= x1) & (x_data <= x2) &
-                               (y_data >= y1) & (y_data <= y2))
+        mask = ~self.roi_intervals.contains(x_data, y_data)
+        mask.flags.writeable = False
+        self._roi_mask_cache = (self._roi_version, x_data, y_data, mask)
 
-        mask = np.logical_not(reduce(np.logical_or, mask_holder))
         return mask
 
     def get_active_roi_mask(self, x_data, y_data):
-        roi_shape = self._active_roi.parentBounds()
-        x1, y1, x2, y2 = roi_shape.getCoords()
+        intervals = IntervalSet([self._roi_box(self._active_roi)])
+        return ~intervals.contains(x_data, y_data)
 
-        mask = ((x_data >= x1) & (x_data <= x2) &
-                (y_data >= y1) & (y_data <= y2))
 
-        mask = np.logical_not(mask)
-        return mask
+# Graphs to tell when the values of an array are modified in place.
+_spectra_graphs = weakref.WeakSet()
+
+
+@SpectrumArray.on_invalidate
+def _data_changed(array):
+    for graph in list(_spectra_graphs):
+        graph._data_changed(array)
 
 
 class SpectraGraph(BaseGraph):
     def __init__(self):
         super(SpectraGraph, self).__init__()
         self._plot_dict = {}
+        # Decimation pyramids of the curves, see `_update_lod`.
+        self._pyramids = {}
+        _spectra_graphs.add(self)
         self._active_plot = None
         self._active_item = None
 
@@ -113,6 +155,8 @@ class SpectraGraph(BaseGraph):
         self.view_box = self.plot_window.getViewBox()
 
         self.sig_units_changed.connect(self.update_all)
+        self.view_box.sigXRangeChanged.connect(self._update_lod)
+        self.view_box.sigResized.connect(self._update_lod)
 
     @property
     def active_item(self):
@@ -138,15 +182,11 @@ class SpectraGraph(BaseGraph):
         return [x1, x2], [y1, y2]
 
     def update_all(self, use_step=True):
-        layer_data_items = self._plot_dict.keys()
-
-        for layer_data_item in layer_data_items:
-            self.remove_item(layer_data_item)
+        """Redraw all items in place, e.g. after the units changed."""
+        for layer_data_item in list(self._plot_dict.keys()):
+            self.refresh_item(layer_data_item, full=True)
 
-        self._icolors = cycle(self.__colors)
-
-        for layer_data_item in layer_data_items:
-            self.add_item(layer_data_item, use_step)
+        self.plot_window.enableAutoRange()
 
     def update_item(self, layer_data_item=None, style='histogram'):
         if layer_data_item is None:
@@ -156,17 +196,53 @@ class SpectraGraph(BaseGraph):
                 return
 
         plot = self._plot_dict[layer_data_item][-1]
+
+        # Curves change style in place, only scatter plots need new items.
+        if plot in self._pyramids and style != 'scatter':
+            self._update_curve(layer_data_item, plot, style == 'histogram')
+            return
+
         color = plot.opts['pen'].color()
         self.remove_item(layer_data_item)
         self.add_item(layer_data_item, style=style, color=color)
 
+    def refresh_item(self, layer_data_item, full=False):
+        """Redraw an item in place, keeping its style, after its data or
+        the units changed. Does nothing if the item is not displayed.
+
+        Parameters
+        ----------
+        layer_data_item: LayerDataTreeItem
+            The item to redraw.
+        full: bool
+            Draw the full extent of the data rather than the current view.
+        """
+        if layer_data_item not in self._plot_dict:
+            return
+
+        plot = self._plot_dict[layer_data_item][-1]
+
+        if plot in self._pyramids:
+            self._update_curve(layer_data_item, plot,
+                               self._pyramids[plot][1], full)
+            return
+
+        color = plot.opts['pen'].color()
+        set_active = layer_data_item is self._active_item
+        self.remove_item(layer_data_item)
+        self.add_item(layer_data_item, set_active, style='scatter',
+                      color=color)
+
     def add_item(self, layer_data_item, set_active=True, style='histogram',
                  color=None):
-        color = next(self._icolors) if not color else color
         if layer_data_item in self._plot_dict.keys():
-            self._plot_dict[layer_data_item].append(layer_data_item)
-        else:
-            self._plot_dict[layer_data_item] = []
+            self.refresh_item(layer_data_item)
+            if set_active:
+                self.select_active(layer_data_item)
+            return
+
+        color = next(self._icolors) if not color else color
+        self._plot_dict[layer_data_item] = []
 
         layer_data = layer_data_item.item
 
@@ -190,6 +266,7 @@ class SpectraGraph(BaseGraph):
         for layer_data_item in layer_data_items:
             for plot in self._plot_dict[layer_data_item]:
                 self.plot_window.removeItem(plot)
+                self._pyramids.pop(plot, None)
 
         for layer_data_item in layer_data_items:
             del self._plot_dict[layer_data_item]
@@ -197,33 +274,23 @@ class SpectraGraph(BaseGraph):
     def _graph_data(self, layer_data_item, set_active=True,
                     style='histogram', color=None):
         color = next(self._icolors) if not color else color
-        spec_data = layer_data_item.item
-        spec_x_array = spec_data.x.convert_unit_to(self._units[0])
-        spec_y_array = spec_data.y.convert_unit_to(self._units[1])
 
-        if style is not 'scatter':
-            if style is 'histogram':
-                fin_pnt = spec_x_array.data[-1] - spec_x_array.data[-2] +\
-                          spec_x_array.data[-1]
-                x_data = np.append(spec_x_array.data, fin_pnt)
-            else:
-                x_data = spec_x_array.data
-
-            plot = pg.PlotDataItem(x_data,
-                                   spec_y_array.data,
-                                   pen=pg.mkPen(color),
-                                   stepMode=style == 'histogram')
+        if style != 'scatter':
+            # Only what the view can show gets drawn; the full extent is
+            # drawn first so that auto-ranging sees all of the data.
+            pyramid, source = self._make_pyramid(layer_data_item)
+            plot = pg.PlotDataItem(pen=pg.mkPen(color))
+            self._pyramids[plot] = (pyramid, style == 'histogram', source)
+            self._set_lod_data(plot, *pyramid.x_range)
         else:
+            spec_data = layer_data_item.item
+            spec_x_array = spec_data.x.convert_unit_to(self._units[0])
+            spec_y_array = spec_data.y.convert_unit_to(self._units[1])
             plot = pg.ScatterPlotItem(spec_x_array.data,
                                       spec_y_array.data,
                                       pen=pg.mkPen(color))
 
-        self.plot_window.setLabel('bottom',
-                                  text='Dispersion [{}]'.format(
-                                      spec_x_array.unit))
-        self.plot_window.setLabel('left',
-                                  text='Flux [{}]'.format(
-                                      spec_y_array.unit))
+        self._set_labels()
 
         self._plot_dict[layer_data_item].append(plot)
         self.plot_window.addItem(plot)
@@ -231,6 +298,76 @@ class SpectraGraph(BaseGraph):
         if set_active:
             self.select_active(layer_data_item)
 
+    def _set_labels(self):
+        self.plot_window.setLabel('bottom',
+                                  text='Dispersion [{}]'.format(
+                                      self._units[0]))
+        self.plot_window.setLabel('left',
+                                  text='Flux [{}]'.format(
+                                      self._units[1]))
+
+    def _make_pyramid(self, layer_data_item):
+        """Convert the data of an item to the plot units and build its
+        decimation pyramid. Also returns what it was built from."""
+        spec_data = layer_data_item.item
+        spec_x_array = spec_data.x.convert_unit_to(self._units[0])
+        spec_y_array = spec_data.y.convert_unit_to(self._units[1])
+
+        source = (spec_data.x, spec_data.y, self._units[0], self._units[1])
+        pyramid = DecimationPyramid(spec_x_array.data, spec_y_array.data)
+
+        return pyramid, source
+
+    def _update_curve(self, layer_data_item, plot, step, full=False):
+        """Redraw a curve with `setData`, rebuilding its pyramid only when
+        the data arrays or the units changed."""
+        pyramid, _, source = self._pyramids[plot]
+        spec_data = layer_data_item.item
+
+        if (source is None or
+                source[0] is not spec_data.x or source[1] is not spec_data.y or
+                source[2:] != (self._units[0], self._units[1])):
+            pyramid, source = self._make_pyramid(layer_data_item)
+
+        self._pyramids[plot] = (pyramid, step, source)
+
+        if full:
+            self._set_lod_data(plot, *pyramid.x_range)
+        else:
+            self._set_lod_data(plot, *self.view_box.viewRange()[0])
+
+        self._set_labels()
+
+    def _data_changed(self, array):
+        """Drop the pyramids built from `array`, or from views of it, whose
+        values were modified in place (see
+        `SpectrumArray.invalidate_cache`), and redraw their items."""
+        for layer_data_item, plots in list(self._plot_dict.items()):
+            stale = False
+            for plot in plots:
+                pyramid, step, source = self._pyramids.get(plot,
+                                                           (None, None, None))
+                if source is not None and any(
+                        np.may_share_memory(spec_array._data, array)
+                        for spec_array in source[:2]):
+                    self._pyramids[plot] = (pyramid, step, None)
+                    stale = True
+
+            if stale:
+                self.refresh_item(layer_data_item)
+
+    def _set_lod_data(self, plot, x_min, x_max):
+        pyramid, step, _ = self._pyramids[plot]
+        pixels = int(self.view_box.width()) or 1000
+        plot.setData(*pyramid.select(x_min, x_max, pixels, step=step))
+
+    def _update_lod(self, *args):
+        """Redraw the curves at the detail level of the current view."""
+        x_min, x_max = self.view_box.viewRange()[0]
+
+        for plot in self._pyramids:
+            self._set_lod_data(plot, x_min, x_max)
+
     def set_active(self, layer_data_item):
         self._active_plot = self._plot_dict[layer_data_item][-1]
         self._active_item = layer_data_item
@@ -5,7 +5,7 @@ import math
 from ...external.qt import QtGui, QtCore
 import numpy as np
 
-from specview.core.data_objects import SpectrumData
+from specview.analysis import model_fitting
 
 # RE pattern to decode scientific and floating point notation.
 _pattern = re.compile(r"[+-]?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?")
@@ -89,22 +89,33 @@ class LayerDataTreeItem(QtGui.QStandardItem):
         self._mask = mask
         self._rois = rois
         self._models = []
+        self._compound = None
 
-        x = parent.item.x
-        y = parent.item.y
-        self._data = SpectrumData(x[~mask], y[~mask])
+        # A read-only view of the parent data; `item.copy()` gives
+        # writeable arrays.
+        self._data = parent.item.view(mask)
 
         self.setText(name)
         self.setData(self._data)
 
     @property
     def model(self):
-        """This returns a class object."""
+        """The sum of the models of the layer, as a single model.
+
+        It is built once, and again only after a model is added or removed
+        or a parameter constraint changes. Parameter values edited on the
+        models are copied in on each access.
+        """
 
         #TODO here is the place to add support for a compound model expression handler.
 
-        compound_model = np.sum(self._models)
-        return compound_model
+        if self._compound is None:
+            self._compound = model_fitting.compound_model(self._models)
+        elif len(self._models) > 1:
+            self._compound.parameters = np.concatenate(
+                [model.parameters for model in self._models])
+
+        return self._compound
 
     @property
     def item(self):
@@ -116,6 +127,21 @@ class LayerDataTreeItem(QtGui.QStandardItem):
 
     def add_model(self, model):
         self._models.append(model)
+        self.invalidate_model()
+
+    def remove_model(self, model):
+        self._models.remove(model)
+        self.invalidate_model()
+
+    def invalidate_model(self):
+        """Rebuild the compound model on next access."""
+        self._compound = None
+
+    def update_data(self):
+        """Rebuild the data of the layer from its parent, after the arrays
+        of the parent were replaced."""
+        self._data = self._parent.item.view(self._mask)
+        self.setData(self._data)
 
     # --- signals
     def sig_update(self):
@@ -238,6 +264,7 @@ class AttributeValueDataTreeItem(ParameterValueDataTreeItem):
         self._value = value
         parameter = getattr(self._parent._parent._model, self._parent._name)
         setattr(parameter, name, value)
+        self._parent._parent._parent.invalidate_model()
         # the layer that has to be signaled is 3 levels above the attribute.
         self._parent._parent._parent.sig_update()
 
@@ -272,6 +299,7 @@ class BooleanAttributeValueDataTreeItem(ParameterValueDataTreeItem):
             setattr(parameter, self._name, True)
         else:
             setattr(parameter, self._name, False)
+        self._parent._parent._parent.invalidate_model()
         # the layer that has to be signaled is 3 levels above the attribute.
         # But, avoid signaling for now. Otherwise, a new model and its layer
         # get created every time an attribute gets changed by the user.